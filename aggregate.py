@@ -0,0 +1,233 @@
+# vectorized per-bucket aggregation of result rows
+import numpy as np
+
+from lifecycle import ContainerIndex, idle_before_scale_down, jain_fairness
+from quantities import cpu_cores, invocation_rate, memory_bytes
+from sketch import LogHistogram
+
+MIB = 1024 * 1024
+LATENCY_COLUMNS = ["executionLatency", "requestResponseLatency", "schedulingLatency"]
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p95": 0.95, "p99": 0.99}
+EXECUTION_COLUMNS = ["containerId", "hostId", "executionStartTime", "executionEndTime"]
+
+
+def elapsed_seconds(times, origin) -> np.ndarray:
+    # same microsecond rounding as (fts(t) - fts(origin)).total_seconds()
+    times = np.asarray(times, dtype="float64")
+    return (np.round(times * 1e6) - np.round(float(origin) * 1e6)) / 1e6
+
+
+def bucket_index(secs, _min, _bucket, nbuckets) -> np.ndarray:
+    """Map seconds to the index of the bucket [min, min + bucket) holding them, -1 if none."""
+    secs = np.asarray(secs, dtype="float64")
+    with np.errstate(invalid="ignore"):
+        idx = np.floor((secs - _min) / _bucket)
+        # repair float rounding right at the bucket edges
+        idx[_min + idx * _bucket > secs] -= 1
+        idx[_min + (idx + 1) * _bucket <= secs] += 1
+        valid = (idx >= 0) & (idx < nbuckets)
+    return np.where(valid, idx, -1).astype("int64")
+
+
+class Aggregator:
+    def __init__(self, _min, _max, _bucket):
+        self.bin_size = (_max - _min) // _bucket
+        self.interval = _bucket
+
+        self.edges = np.arange(_min, _max, _bucket)
+        self.buckets = [{"min": int(i), "max": int(i + _bucket)} for i in self.edges]
+        self.midpoints = [(b["min"] + b["max"]) / 2 for b in self.buckets]
+
+        self.df = None
+        self.index = None
+        self._containers = None
+        self._container_stats = None
+
+    def load(self, df, request_start_time):
+        self.df = df
+        self.request_start_time = request_start_time
+
+        secs = elapsed_seconds(df["requestTime"], request_start_time)
+        self.index = bucket_index(secs, self.edges[0] if len(self.edges) else 0, self.interval, len(self.edges))
+        self.valid = self.index >= 0
+        self._counts = np.bincount(self.index[self.valid], minlength=len(self.edges))
+        self._containers = None
+        self._container_stats = None
+
+    def _count(self, mask):
+        mask = self.valid & mask
+        return np.bincount(self.index[mask], minlength=len(self.edges))
+
+    def _sum(self, values, mask):
+        mask = self.valid & mask
+        return np.bincount(self.index[mask], weights=values[mask], minlength=len(self.edges))
+
+    def _mean(self, values, mask):
+        n = self._count(mask)
+        s = self._sum(values, mask)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n == 0, 0, s / np.maximum(n, 1))
+
+    def _series(self, y):
+        return {'x': list(self.midpoints), 'y': [v.item() if hasattr(v, "item") else v for v in y]}
+
+    def _success(self):
+        return (self.df["statusCode"] == 200).to_numpy()
+
+    def get_data_list(self, colname, value):
+        mask = self.valid & (self.df[colname] == value).to_numpy()
+        return [int(self.edges[i]) for i in np.sort(self.index[mask])]
+
+    get_data_list_avg = get_data_list
+
+    def get_latency_data(self, colname):
+        values = self.df[colname].to_numpy(dtype="float64", na_value=np.nan)
+        return self._series(self._mean(values, self._success()))
+
+    def get_latency_sketch(self, colname):
+        values = self.df[colname].to_numpy(dtype="float64", na_value=np.nan)
+        mask = self.valid & self._success()
+        sketch = LogHistogram(len(self.edges))
+        sketch.add(values[mask], self.index[mask])
+        return sketch
+
+    def get_latency_percentiles(self, colname):
+        sketch = self.get_latency_sketch(colname)
+        data = {'x': list(self.midpoints)}
+        for name, q in PERCENTILES.items():
+            data[name] = sketch.quantile(q).tolist()
+        data['max'] = sketch.quantile(1).tolist()
+        return data
+
+    def get_summary(self):
+        ok, failed = self.get_status_data("statusCode")
+        summary = {
+            "requestStartTime": float(self.request_start_time),
+            "requests": int(sum(ok['y']) + sum(failed['y'])),
+            "successful": int(sum(ok['y'])),
+            "failed": int(sum(failed['y'])),
+            "latency": {},
+        }
+        for col in LATENCY_COLUMNS:
+            if col not in self.df.columns:
+                continue
+            total = self.get_latency_sketch(col).total()
+            stats = {"count": int(total.count()[0]), "min": float(total.quantile(0)[0])}
+            for name, q in PERCENTILES.items():
+                stats[name] = float(total.quantile(q)[0])
+            stats["max"] = float(total.quantile(1)[0])
+            summary["latency"][col] = {k: (None if v != v else v) for k, v in stats.items()}
+
+        table = self.get_container_stats()
+        if len(table):
+            gaps = self.get_container_index().gap_sketch()
+            some = gaps.count()[0] > 0
+            stats = {
+                "count": len(table),
+                "meanBusyFraction": float(table["busyFraction"].mean()),
+                "medianBusyFraction": float(table["busyFraction"].median()),
+                "maxInFlight": int(table["maxInFlight"].max()),
+                "overlappingExecutions": float(table["overlapping"].sum() / table["executions"].sum()),
+                "medianIdleGap": float(gaps.quantile(0.5)[0]) if some else None,
+                "p95IdleGap": float(gaps.quantile(0.95)[0]) if some else None,
+                "medianIdleBeforeScaleDown": float(table["idleBeforeScaleDown"].median()),
+                "fairness": float(jain_fairness(table["executions"])),
+            }
+            summary["containers"] = {k: (None if v != v else v) for k, v in stats.items()}
+        return summary
+
+    def get_status_data(self, colname):
+        ok = (self.df[colname] == 200).to_numpy()
+        return self._series(self._count(ok)), self._series(self._count(~ok))
+
+    def get_requests_data(self):
+        return self._series(self._counts)
+
+    def get_repliacs_data(self, name):
+        values = self.df["replicas"]
+        everything = np.ones(len(values), dtype=bool)
+        n = self._count(everything)
+        s = self._sum(values.to_numpy(dtype="float64", na_value=np.nan), everything)
+        with np.errstate(invalid="ignore"):
+            y = np.where(n == 0, 0, np.floor_divide(s, np.maximum(n, 1)))
+        if not np.isnan(y).any():
+            y = y.astype("int64")
+        return self._series(y)
+
+    def get_fn_invocation_rate(self, name):
+        values = invocation_rate(self.df["functionInvocationRate"])
+        return self._series(self._mean(values, ~np.isnan(values)))
+
+    def get_memory_usage(self, name):
+        if name not in list(self.df.columns):
+            return {}
+        values = memory_bytes(self.df[name]) / MIB
+        return self._series(self._mean(values, ~np.isnan(values)))
+
+    def get_cpu_usage(self, name):
+        if name not in list(self.df.columns):
+            return {}
+        values = cpu_cores(self.df[name])
+        return self._series(self._mean(values, ~np.isnan(values)))
+
+    def get_container_index(self):
+        """The lifecycle index of the run's containers, built on first use."""
+        if self._containers is None:
+            if not set(EXECUTION_COLUMNS) <= set(self.df.columns):
+                self._containers = ContainerIndex.from_executions(*[np.zeros(0)] * 5)
+                return self._containers
+            ok = ((self.df["statusCode"] == 200) & self.df["containerId"].notna() & self.df["executionStartTime"].notna()).to_numpy()
+            self._containers = ContainerIndex.from_executions(
+                self.df["containerId"].to_numpy()[ok],
+                self.df["hostId"].to_numpy()[ok],
+                elapsed_seconds(self.df["executionStartTime"].to_numpy()[ok], self.request_start_time),
+                elapsed_seconds(self.df["executionEndTime"].to_numpy()[ok], self.request_start_time),
+                self.index[ok],
+            )
+        return self._containers
+
+    def get_replica_timeline(self):
+        """Seconds since the start and the replicas metric wherever it changed from the row before, in order of response."""
+        if "replicas" not in self.df:
+            return np.zeros(0), np.zeros(0)
+        timeline = self.df[["responseTime", "replicas"]].dropna()
+        values = timeline["replicas"].to_numpy(dtype="float64")
+        changed = np.diff(values, prepend=np.nan) != 0
+        times = elapsed_seconds(timeline["responseTime"].to_numpy()[changed], self.request_start_time)
+        order = np.argsort(times, kind="mergesort")
+        return times[order], values[changed][order]
+
+    def get_container_stats(self):
+        """One row per container, built on first use; shared by the summary, charts and table, so read-only."""
+        if self._container_stats is None:
+            table = self.get_container_index().containers()
+            table["idleBeforeScaleDown"] = idle_before_scale_down(table, *self.get_replica_timeline())
+            self._container_stats = table
+        return self._container_stats
+
+    def get_container_heat(self):
+        heat = self.get_container_index().heat(len(self.edges))
+        names = self.get_container_index().names
+        return {names[c]: self._series(heat[c]) for c in np.flatnonzero(heat.sum(axis=1))}
+
+    def get_container_utilization(self):
+        """Per bucket: each container's busy fraction, their mean and the fairness of requests across them.
+
+        Only containers that had started and not yet finished their last
+        execution count towards a bucket.
+        """
+        index = self.get_container_index()
+        edges = np.append(self.edges, self.edges[-1] + self.interval) if len(self.edges) else np.zeros(1)
+        alive = index.alive(edges)
+        busy = np.where(alive, index.busy_by_bucket(edges) / self.interval, np.nan)
+        heat = np.where(alive, index.heat(len(self.edges)), np.nan)
+        n = alive.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, np.nansum(busy, axis=0) / np.maximum(n, 1), np.nan)
+        return {
+            'x': list(self.midpoints),
+            'busy': busy,
+            'meanBusy': mean.tolist(),
+            'fairness': jain_fairness(heat, axis=0).tolist(),
+            'alive': n.tolist(),
+        }
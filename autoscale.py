@@ -0,0 +1,321 @@
+# autoscaler responsiveness and efficiency per run and per phase of its load profile
+import os
+from argparse import ArgumentParser
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import FormatStrFormatter
+
+from cache import load_run, result_files
+from profiles import arrival_times, load_phases, profile_for
+from simulate import parse_config
+
+STEP = 1.0
+WINDOW = 10.0
+# p95 has recovered once it is back under this multiple of the run's typical p95 ...
+RECOVERY_FACTOR = 1.5
+# ... and stays there for this long
+HOLD = 30.0
+# per-pod throughput is the rate pods sustained at their busiest, not their average
+THROUGHPUT_QUANTILE = 0.95
+
+
+def profile_origin(df, phases):
+    """When the profile started, on the client's clock.
+
+    A profile ramping up from 0 sends its first request a while after it
+    starts; going by the first request alone would shift every phase.
+    """
+    if "scheduledTime" in df and df["scheduledTime"].notna().any():
+        first = df["scheduledTime"].min()
+    else:
+        first = df["requestTime"].min()
+    offsets = arrival_times(phases) if phases else np.zeros(0)
+    return first - (offsets[0] if len(offsets) else 0.0)
+
+
+def offered_load(phases, grid) -> np.ndarray:
+    """Requests per second the profile asks for at each of ``grid`` seconds."""
+    rate = np.zeros(len(grid))
+    for p in phases:
+        inside = (grid >= p["start"]) & (grid < p["end"])
+        share = (grid[inside] - p["start"]) / p["duration"] if p["duration"] else 0.0
+        rate[inside] = p["from_rate"] + (p["to_rate"] - p["from_rate"]) * share
+    return rate
+
+
+def observed_load(secs, grid, window=WINDOW) -> np.ndarray:
+    """Requests per second actually sent, averaged over ``window`` seconds, for runs without a profile."""
+    step = grid[1] - grid[0] if len(grid) > 1 else STEP
+    counts, _ = np.histogram(secs, bins=np.append(grid, grid[-1] + step) if len(grid) else [0, step])
+    width = max(int(round(window / step)), 1)
+    return np.convolve(counts / step, np.ones(width) / width, mode="same")
+
+
+def replicas_on(df, origin, grid) -> np.ndarray:
+    """The replicas metric at each of ``grid`` seconds, held from the response that last reported it."""
+    if "replicas" not in df:
+        return np.full(len(grid), np.nan)
+    timeline = df[["responseTime", "replicas"]].dropna().sort_values("responseTime", kind="mergesort")
+    if timeline.empty:
+        return np.full(len(grid), np.nan)
+    values = timeline["replicas"].to_numpy(dtype="float64")
+    at = np.searchsorted(timeline["responseTime"].to_numpy() - origin, grid, "right") - 1
+    # before the first report the run started with the first reported replicas
+    return values[np.maximum(at, 0)]
+
+
+def pod_throughput(df, origin, grid, replicas, window=WINDOW, quantile=THROUGHPUT_QUANTILE) -> float:
+    """Successful responses per second per replica that the pods sustained, from ``window``-second bins."""
+    ok = df.loc[df["statusCode"] == 200, "responseTime"].to_numpy() - origin
+    bins = np.floor(grid / window).astype("int64")
+    nbins = int(bins[-1]) + 1 if len(bins) else 0
+    done = np.bincount(np.floor(ok[ok >= 0] / window).astype("int64"), minlength=nbins)[:nbins]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_replicas = np.bincount(bins, weights=replicas, minlength=nbins) / np.bincount(bins, minlength=nbins)
+        per_pod = done / window / mean_replicas
+    per_pod = per_pod[(done > 0) & (mean_replicas > 0)]
+    return float(np.quantile(per_pod, quantile)) if len(per_pod) else np.nan
+
+
+def window_p95(df, origin, grid, window=WINDOW) -> np.ndarray:
+    """p95 response latency of the requests sent in each ``window``-second bin, at each of ``grid`` seconds.
+
+    Bins whose requests all failed are infinitely slow, bins nobody sent
+    anything in are NaN.
+    """
+    bins = np.floor(grid / window).astype("int64")
+    nbins = int(bins[-1]) + 1 if len(bins) else 0
+    secs = df["requestTime"].to_numpy() - origin
+    b = np.floor(secs / window).astype("int64")
+    keep = (b >= 0) & (b < nbins)
+
+    p95 = np.full(nbins, np.nan)
+    sent = np.bincount(b[keep], minlength=nbins)
+    p95[sent > 0] = np.inf
+    ok = keep & (df["statusCode"] == 200).to_numpy()
+    latency = pd.Series(df["requestResponseLatency"].to_numpy()[ok]).groupby(b[ok]).quantile(0.95)
+    p95[latency.index.to_numpy()] = latency.to_numpy()
+    return p95[bins]
+
+
+def increases(phases) -> list:
+    """Phases in which the profile asks for more load than at the end of the phase before."""
+    found, previous = [], 0.0
+    for p in phases:
+        if max(p["from_rate"], p["to_rate"]) > previous:
+            found.append(p["phase"])
+        previous = p["to_rate"]
+    return found
+
+
+def held_until(phases, index) -> float:
+    """End of the load the phase at ``index`` rises to: the start of the next phase that lowers or raises it again."""
+    for p in phases[index + 1:]:
+        if p["to_rate"] != p["from_rate"]:
+            return p["start"]
+    return np.inf
+
+
+def scale_up_lag(grid, replicas, start, end=np.inf) -> float:
+    """Seconds from ``start`` to the first replica count above the one at ``start``, before ``end``.
+
+    NaN if the replicas did not rise by then: a rise once the load has
+    changed again answers that change, not this one.
+    """
+    after = (grid >= start) & (grid < end)
+    if not after.any():
+        return np.nan
+    t, r = grid[after], replicas[after]
+    up = np.flatnonzero(r > r[0])
+    return float(t[up[0]] - start) if len(up) else np.nan
+
+
+def recovery_time(grid, p95, threshold, start, end, hold=HOLD) -> float:
+    """Seconds from ``start`` until p95 is back under ``threshold`` for ``hold`` seconds.
+
+    0 if it never went over within [start, end), NaN if it did and never
+    recovered before the run ended.
+    """
+    bad = p95 > threshold
+    inside = (grid >= start) & (grid < end)
+    if not bad[inside].any():
+        return 0.0
+    first = np.flatnonzero(inside & bad)[0]
+    step = grid[1] - grid[0]
+    span = max(int(round(hold / step)), 1)
+    # the number of bad points in every run of ``span`` points starting at i
+    window = np.convolve(bad[first:].astype("int64"), np.ones(span, dtype="int64"), mode="valid")
+    calm = np.flatnonzero(window == 0)
+    return float(grid[first + calm[0]] - start) if len(calm) else np.nan
+
+
+def analyse(file, phases=None, step=STEP, window=WINDOW, pod_rate=None, factor=RECOVERY_FACTOR, hold=HOLD):
+    """Per-phase and whole-run autoscaling metrics of a run, plus the timelines they come from."""
+    df = load_run(file).frame()
+    origin = profile_origin(df, phases)
+    end = max(float(df["responseTime"].max() - origin), phases[-1]["end"] if phases else 0.0)
+    grid = np.arange(0.0, end, step)
+
+    if phases:
+        offered = offered_load(phases, grid)
+    else:
+        offered = observed_load(df["requestTime"].to_numpy() - origin, grid, window)
+        phases = [{"phase": 0, "kind": "observed", "start": 0.0, "end": end, "duration": end, "from_rate": np.nan, "to_rate": np.nan}]
+
+    replicas = replicas_on(df, origin, grid)
+    if pod_rate is None:
+        pod_rate = pod_throughput(df, origin, grid, replicas, window)
+    needed = np.ceil(offered / pod_rate) if pod_rate > 0 else np.full(len(grid), np.nan)
+    over = np.maximum(replicas - needed, 0) * step
+    under = np.maximum(needed - replicas, 0) * step
+
+    p95 = window_p95(df, origin, grid, window)
+    finite = p95[np.isfinite(p95)]
+    baseline = float(np.median(finite)) if len(finite) else np.nan
+    threshold = baseline * factor
+
+    secs = df["requestTime"].to_numpy() - origin
+    at = np.clip(np.floor(secs / step).astype("int64"), 0, max(len(grid) - 1, 0))
+    failed = (df["statusCode"] != 200).to_numpy()
+    short = failed & (under[at] > 0) if len(grid) else failed & False
+    rising = increases(phases)
+
+    rows = []
+    for e, p in enumerate(phases):
+        inside = (grid >= p["start"]) & (grid < p["end"])
+        sent = (secs >= p["start"]) & (secs < p["end"])
+        rows.append({
+            "phase": p["phase"],
+            "kind": p["kind"],
+            "start": p["start"],
+            "end": p["end"],
+            "requests": int(sent.sum()),
+            "failures": int((sent & failed).sum()),
+            "scaleUpLag": scale_up_lag(grid, replicas, p["start"], held_until(phases, e)) if p["phase"] in rising else np.nan,
+            "recoveryTime": recovery_time(grid, p95, threshold, p["start"], p["end"], hold),
+            "replicaSeconds": float(np.sum(replicas[inside]) * step),
+            "neededReplicaSeconds": float(np.sum(needed[inside]) * step),
+            "overProvisioned": float(np.sum(over[inside])),
+            "underProvisioned": float(np.sum(under[inside])),
+            "underProvisionedFailures": int((sent & short).sum()),
+        })
+    per_phase = pd.DataFrame(rows)
+
+    summary = {
+        "podThroughput": pod_rate,
+        "baselineP95": baseline,
+        "requests": len(df),
+        "failures": int(failed.sum()),
+        "meanScaleUpLag": per_phase["scaleUpLag"].mean(),
+        "maxScaleUpLag": per_phase["scaleUpLag"].max(),
+        "maxRecoveryTime": per_phase["recoveryTime"].max(skipna=False) if len(per_phase) else np.nan,
+    }
+    for col in ["replicaSeconds", "neededReplicaSeconds", "overProvisioned", "underProvisioned"]:
+        summary[col] = float(np.sum(per_phase[col]))
+    summary["underProvisionedFailures"] = int(per_phase["underProvisionedFailures"].sum())
+    with np.errstate(invalid="ignore", divide="ignore"):
+        summary["efficiency"] = summary["neededReplicaSeconds"] / summary["replicaSeconds"]
+
+    timeline = pd.DataFrame({"time": grid, "offered": offered, "replicas": replicas, "needed": needed, "p95": p95})
+    return timeline, per_phase, summary, threshold, phases
+
+
+def plot_autoscaling(timeline, phases, threshold, folder, name="Autoscaling"):
+    fig, ax = plt.subplots(3, 1, figsize=(16,11), sharex=True)
+    t = timeline["time"]
+
+    ax[0].plot(t, timeline["offered"], label='Offered load')
+    ax[0].set_ylabel('Requests per second')
+    ax[0].set_title('Offered load')
+
+    ax[1].step(t, timeline["replicas"], where='post', label='Replicas')
+    ax[1].step(t, timeline["needed"], where='post', label='Needed at the observed per-pod throughput')
+    ax[1].fill_between(t, timeline["needed"], timeline["replicas"], where=timeline["replicas"] > timeline["needed"],
+                       step='post', alpha=0.3, color='tab:green', label='Over-provisioned')
+    ax[1].fill_between(t, timeline["needed"], timeline["replicas"], where=timeline["replicas"] < timeline["needed"],
+                       step='post', alpha=0.3, color='tab:red', label='Under-provisioned')
+    ax[1].set_ylabel('Replicas')
+    ax[1].set_title('Replicas against demand')
+
+    p95 = timeline["p95"].replace(np.inf, np.nan)
+    ax[2].plot(t, p95, label='p95 response latency')
+    if threshold == threshold:
+        ax[2].axhline(threshold, color='grey', linestyle='--', label='Recovery threshold')
+    ax[2].set_ylabel('Latency (in seconds)')
+    ax[2].set_title('p95 response latency')
+
+    for a in ax:
+        a.legend(loc='best')
+        a.xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+        for p in phases:
+            a.axvline(p["start"], color='grey', linestyle=':', linewidth=0.8)
+    ax[-1].set_xlabel('Time in seconds since the start of the profile')
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+    plt.close(fig)
+
+
+def config_columns(config):
+    """Cluster and HPA settings of a results directory name, empty if it does not follow the convention."""
+    try:
+        c = parse_config(config)
+    except ValueError:
+        return {}
+    return {"nodes": c["nodes"], "size": c["size"], "minReplicas": c["min_replicas"], "maxReplicas": c["max_replicas"], "target": c["target"]}
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="result CSVs or directories of them")
+    parser.add_argument("-o", "--output", default="autoscaling", help="directory to write tables and plots to")
+    parser.add_argument("--step", type=float, default=STEP, help="seconds between points of the timelines")
+    parser.add_argument("--window", type=float, default=WINDOW, help="seconds per p95 and throughput bin")
+    parser.add_argument("--pod-throughput", type=float, help="requests per second one replica serves, instead of the observed one")
+    parser.add_argument("--recovery-factor", type=float, default=RECOVERY_FACTOR, help="p95 over this multiple of the run's typical p95 has not recovered")
+    parser.add_argument("--hold", type=float, default=HOLD, help="seconds p95 has to stay recovered")
+    args = parser.parse_args()
+
+    files = result_files(args.results)
+
+    runs, phases_rows = [], []
+    for e, file in enumerate(files):
+        profile = profile_for(file)
+        phases = load_phases(profile) if profile else None
+        timeline, per_phase, summary, threshold, phases = analyse(
+            file, phases, args.step, args.window, args.pod_throughput, args.recovery_factor, args.hold)
+
+        folder = os.path.join(args.output, os.path.splitext(file)[0])
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        per_phase.to_csv(os.path.join(folder, "phases.csv"), index=False)
+        plot_autoscaling(timeline, phases, threshold, folder)
+
+        config, name = Path(file).parent.name, Path(file).stem
+        keys = dict(config=config, **config_columns(config), profile=name)
+        runs.append(dict(keys, **summary))
+        phases_rows.append(pd.DataFrame(keys, index=per_phase.index).join(per_phase))
+        lag = summary["meanScaleUpLag"]
+        print("[*] {}/{}: {}: scale-up lag {}, over {:.0f} / under {:.0f} replica-seconds, {} failures while under".format(
+            e + 1, len(files), file, "{:.0f}s".format(lag) if lag == lag else "-", summary["overProvisioned"], summary["underProvisioned"],
+            summary["underProvisionedFailures"]))
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    summary = pd.DataFrame(runs)
+    summary.to_csv(os.path.join(args.output, "autoscaling_summary.csv"), index=False)
+    if phases_rows:
+        pd.concat(phases_rows, ignore_index=True).to_csv(os.path.join(args.output, "autoscaling_phases.csv"), index=False)
+
+    for profile, group in summary.groupby("profile"):
+        print("[*] {}".format(profile))
+        columns = ["config", "meanScaleUpLag", "maxRecoveryTime", "overProvisioned", "underProvisioned", "underProvisionedFailures", "efficiency"]
+        print(group[columns].to_string(index=False, float_format="{:.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
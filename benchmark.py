@@ -0,0 +1,269 @@
+# benchmark the analysis pipeline on synthetic result CSVs in the metrics.js layout
+import gc
+import itertools
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import plot
+from aggregate import LATENCY_COLUMNS
+from cache import load_run
+from profiling import Profiler, print_report
+from stream import CHUNKSIZE, stream_file
+
+# requests per second of the synthetic runs, so 10^7 rows span about a day
+RATE = 100.0
+START_TIME = 1600000000.0
+SCRAPE_INTERVAL = 15.0
+FAILURE_RATE = 0.1
+REGRESSION_THRESHOLD = 1.2
+# stages this much slower or less are timer noise, whatever the ratio
+NOISE_SECONDS = 0.05
+
+
+def uuids(rng, n) -> np.ndarray:
+    """``n`` random UUID-shaped strings."""
+    hexes = pd.Series(rng.integers(0, 2 ** 63, size=(n, 2)).tolist()).map(lambda x: "{:016x}{:016x}".format(*x))
+    return (hexes.str[:8] + "-" + hexes.str[8:12] + "-4" + hexes.str[13:16] + "-a" + hexes.str[17:20] + "-" + hexes.str[20:]).to_numpy()
+
+
+class Synthetic:
+    """A synthetic run in the metrics.js column layout and units.
+
+    Requests arrive as a Poisson process at ``rate``; each is served by a
+    random one of ``containers`` containers spread over ``nodes`` nodes,
+    with log-normal execution times. Cluster metrics change every scrape
+    interval. Rows come out in order of response, in chunks, so runs of
+    any size can be written with bounded memory.
+    """
+
+    def __init__(self, rows, nodes=10, containers=20, seed=0, rate=RATE, failure_rate=FAILURE_RATE):
+        self.rows = rows
+        self.rate = rate
+        self.failure_rate = failure_rate
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+
+        self.duration = rows / rate
+        steps = int(self.duration // SCRAPE_INTERVAL) + 2
+        self.nodes = ["s-2vcpu-2gb-{}-default-pool-{:05x}".format(nodes, rng.integers(0, 16 ** 5)) for _ in range(nodes)]
+        self.host_ids = START_TIME - 7200 + np.arange(nodes)
+        self.container_ids = uuids(rng, containers)
+        self.container_hosts = self.host_ids[np.arange(containers) % nodes]
+        self.cpu = rng.uniform(0.03, 1.9, size=(nodes, steps)) * 1e9
+        self.memory = rng.uniform(380, 1500, size=(nodes, steps)) * 1024
+        self.replicas = np.clip(containers + np.cumsum(rng.integers(-1, 2, steps)), 1, None)
+        self.invocation_rate = np.maximum(rng.normal(rate, rate / 10, steps), 0) * 1000
+
+    def columns(self) -> list:
+        columns = ["executionStartTime", "executionEndTime", "executionLatency", "containerId", "hostId",
+                   "statusCode", "requestResponseLatency", "requestTime", "responseTime", "requestId", "replicas"]
+        for node in self.nodes:
+            columns += [node + "CpuUsage", node + "MemoryUsage"]
+        return columns + ["functionInvocationRate", "schedulingLatency"]
+
+    def chunks(self, chunksize=CHUNKSIZE):
+        rng = np.random.default_rng(self.seed + 1)
+        clock = 0.0
+        for lo in range(0, self.rows, chunksize):
+            n = min(chunksize, self.rows - lo)
+            sent = clock + np.cumsum(rng.exponential(1 / self.rate, n))
+            clock = sent[-1]
+            yield self.frame(rng, sent)
+
+    def frame(self, rng, sent) -> pd.DataFrame:
+        n = len(sent)
+        ok = rng.random(n) >= self.failure_rate
+        scheduling = 0.15 + rng.exponential(0.3, n)
+        execution = rng.lognormal(np.log(4.0), 0.6, n)
+        response = np.where(ok, sent + scheduling + execution + rng.exponential(0.05, n), sent + rng.uniform(0.1, 120, n))
+        container = rng.integers(0, len(self.container_ids), n)
+
+        data = {
+            "executionStartTime": np.where(ok, START_TIME + sent + scheduling, np.nan),
+            "executionEndTime": np.where(ok, START_TIME + sent + scheduling + execution, np.nan),
+            "executionLatency": np.where(ok, execution, np.nan),
+            "containerId": np.where(ok, self.container_ids[container], None),
+            "hostId": np.where(ok, self.container_hosts[container], np.nan),
+            "statusCode": np.where(ok, 200, 500),
+            "requestResponseLatency": np.round(response - sent, 3),
+            "requestTime": np.round(START_TIME + sent, 3),
+            "responseTime": np.round(START_TIME + response, 3),
+            "requestId": uuids(rng, n),
+        }
+        step = np.minimum((response // SCRAPE_INTERVAL).astype("int64"), len(self.replicas) - 1)
+        data["replicas"] = self.replicas[step]
+        for e, node in enumerate(self.nodes):
+            data[node + "CpuUsage"] = pd.Series(self.cpu[e][step].astype("int64")).astype(str).to_numpy() + "n"
+            data[node + "MemoryUsage"] = pd.Series(self.memory[e][step].astype("int64")).astype(str).to_numpy() + "Ki"
+        data["functionInvocationRate"] = pd.Series(self.invocation_rate[step].astype("int64")).astype(str).to_numpy() + "m"
+        data["schedulingLatency"] = np.where(ok, scheduling, np.nan)
+        return pd.DataFrame(data, columns=self.columns()).sort_values("responseTime", kind="mergesort")
+
+    def write(self, path, chunksize=CHUNKSIZE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = str(path) + ".tmp"
+        for e, chunk in enumerate(self.chunks(chunksize)):
+            chunk.to_csv(tmp, mode="w" if e == 0 else "a", header=e == 0, index=False)
+        os.replace(tmp, path)
+        return path
+
+
+def dataset(folder, rows, nodes, containers, seed=0):
+    """Path of the synthetic CSV for these parameters under ``folder``, written if it does not exist yet."""
+    path = os.path.join(folder, "synthetic-{}-{}-{}-{}.csv".format(rows, nodes, containers, seed))
+    if not os.path.exists(path):
+        Synthetic(rows, nodes, containers, seed).write(path)
+    return path
+
+
+def aggregations(buck):
+    """Every aggregation the plots ask for, without rendering anything."""
+    buck.get_summary()
+    for col in LATENCY_COLUMNS:
+        buck.get_latency_data(col)
+        buck.get_latency_percentiles(col)
+    buck.get_status_data("statusCode")
+    buck.get_requests_data()
+    buck.get_heat_data()
+    buck.get_container_heat()
+    buck.get_container_utilization()
+    buck.get_container_stats()
+    buck.get_repliacs_data("replicas")
+    buck.get_fn_invocation_rate("functionInvocationRate")
+    for col in buck.df.columns:
+        if col.endswith("CpuUsage"):
+            buck.get_cpu_usage(col)
+        elif col.endswith("MemoryUsage"):
+            buck.get_memory_usage(col)
+
+
+def run_case(file, folder, stream=False, render=True, memory=False):
+    """Stage timings of one pass of the pipeline over ``file``."""
+    profiler = Profiler(memory=memory)
+    with profiler:
+        if not stream:
+            with profiler.stage("parse"):
+                load_run(file, use_cache=False)
+            with profiler.stage("cache"):
+                # writes the cache entry the plots then load from
+                load_run(file)
+        if render:
+            plot.plot_file(file, folder, stream=stream, profiler=profiler)
+        else:
+            with profiler.stage("load"):
+                buck = stream_file(plot.StreamBucket, file) if stream else plot.load_buckets(file)
+            aggregations(profiler.instrument(buck))
+    gc.collect()
+    return profiler.report()
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.node(),
+    }
+
+
+def compare(results, baseline=None, threshold=REGRESSION_THRESHOLD) -> pd.DataFrame:
+    """Stage times of the latest benchmark run against earlier ones.
+
+    Each case is compared with the most recent earlier run that timed it,
+    or with run or commit ``baseline`` only.
+    """
+    keys = ["rows", "nodes", "containers", "mode", "traced", "stage"]
+    latest = results["run"].iloc[-1]
+    before = results[results["run"] != latest]
+    if baseline is not None:
+        before = before[(before["run"] == baseline) | (before["commit"] == baseline)]
+        if before.empty:
+            raise ValueError("no benchmark run or commit {!r} recorded".format(baseline))
+    before = before.drop_duplicates(keys, keep="last")
+
+    merged = results[results["run"] == latest].merge(before, on=keys, suffixes=("", "Before"))
+    merged["ratio"] = merged["seconds"] / merged["secondsBefore"]
+    merged["regression"] = (merged["ratio"] > threshold) & (merged["seconds"] - merged["secondsBefore"] > NOISE_SECONDS)
+    return merged[keys + ["runBefore", "secondsBefore", "seconds", "ratio", "regression"]]
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="write a synthetic result CSV")
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--rows", type=int, default=10000)
+    generate_parser.add_argument("--nodes", type=int, default=10)
+    generate_parser.add_argument("--containers", type=int, default=20)
+    generate_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = subparsers.add_parser("run", help="time every stage of the pipeline over a grid of synthetic runs")
+    run_parser.add_argument("-o", "--output", default="benchmarks", help="directory for the synthetic data and results.csv")
+    run_parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    run_parser.add_argument("--nodes", type=int, nargs="+", default=[5, 50])
+    run_parser.add_argument("--containers", type=int, nargs="+", default=[20])
+    run_parser.add_argument("--stream", action="store_true", help="also time --stream mode")
+    run_parser.add_argument("--no-render", action="store_true", help="time the aggregations only")
+    run_parser.add_argument("--memory", action="store_true", help="trace peak memory per stage, slowing everything down")
+
+    compare_parser = subparsers.add_parser("compare", help="compare the latest run with an earlier one")
+    compare_parser.add_argument("-o", "--output", default="benchmarks")
+    compare_parser.add_argument("--baseline", help="run id or commit to compare against (default: the run before)")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        Synthetic(args.rows, args.nodes, args.containers, args.seed).write(args.path)
+        print("[*] {}: {} rows, {} nodes, {} containers".format(args.path, args.rows, args.nodes, args.containers))
+        return
+
+    results_path = os.path.join(args.output, "results.csv")
+    if args.command == "compare":
+        table = compare(pd.read_csv(results_path, dtype={"run": str, "commit": str}), args.baseline, args.threshold)
+        print(table.to_string(index=False, float_format="{:.3f}".format))
+        regressions = table[table["regression"]]
+        print("\n[*] {} of {} stages slower than {:.0%} of the baseline".format(len(regressions), len(table), args.threshold))
+        sys.exit(1 if len(regressions) else 0)
+
+    env = dict(run=time.strftime("%Y%m%dT%H%M%S"), **environment())
+    modes = ["memory"] + (["stream"] if args.stream else [])
+    tables = []
+    for rows, nodes, containers in itertools.product(args.rows, args.nodes, args.containers):
+        started = time.perf_counter()
+        file = dataset(os.path.join(args.output, "data"), rows, nodes, containers)
+        generated = time.perf_counter() - started
+        for mode in modes:
+            folder = os.path.join(args.output, "plots", Path(file).stem, mode)
+            report = run_case(file, folder, stream=mode == "stream", render=not args.no_render, memory=args.memory)
+            shutil.rmtree(folder, ignore_errors=True)
+            tables.append(report.assign(rows=rows, nodes=nodes, containers=containers, mode=mode, traced=args.memory, **env))
+            # self times of all stages add up to the whole pass
+            print("[*] {} rows, {} nodes, {} containers, {}: {:.2f}s ({:.2f}s to generate)".format(
+                rows, nodes, containers, mode, report["selfSeconds"].sum(), generated))
+            print_report(report)
+
+    results = pd.concat(tables, ignore_index=True)
+    front = ["run", "commit", "rows", "nodes", "containers", "mode", "traced"]
+    results = results[front + [c for c in results.columns if c not in front]]
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    results.to_csv(results_path, mode="a", header=not os.path.exists(results_path), index=False)
+    print("[*] appended {} stage timings of run {} to {}".format(len(results), env["run"], results_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# block bootstrap confidence intervals for run statistics and for differences between cluster configurations
+import os
+import re
+from argparse import ArgumentParser
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from autoscale import config_columns
+from cache import load_run, result_files
+from sketch import LogHistogram
+
+BLOCK = 30.0
+# a block is redrawn from the blocks at most this many positions away, so resamples keep the profile's shape
+NEIGHBOURS = 2
+RESAMPLES = 2000
+CONFIDENCE = 0.95
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+METRICS = list(QUANTILES) + ["failureRate", "throughput", "replicaSeconds"]
+# repeats of a profile are told apart by a trailing v<N>, like result-30speak1v1.csv ... v3.csv
+REPEAT = re.compile(r"v\d+$")
+
+
+def group_key(file):
+    """Configuration and profile of a result CSV, the same for every repeat of a run."""
+    return Path(file).parent.name, REPEAT.sub("", Path(file).stem)
+
+
+class Blocks:
+    """A group's requests cut into blocks of ``width`` seconds per run, reduced to what the statistics need.
+
+    Every block keeps a latency histogram of its successful requests,
+    its request, success and failure counts, its length in seconds and
+    the replica-seconds accrued in it. A resample only chooses how often
+    each block counts, so its cost does not depend on the number of
+    requests.
+    """
+
+    def __init__(self, frames, width=BLOCK, neighbours=NEIGHBOURS):
+        self.neighbours = neighbours
+        self.sketch = LogHistogram()
+        hists, requests, successful, seconds, replicas, runs = [], [], [], [], [], []
+        for e, df in enumerate(frames):
+            start = df["requestTime"].min()
+            duration = float(df["responseTime"].max() - start)
+            n = max(int(np.ceil(duration / width)), 1)
+            block = np.clip(((df["requestTime"] - start) // width).to_numpy(dtype="int64"), 0, n - 1)
+            ok = (df["statusCode"] == 200).to_numpy()
+
+            latency = df["requestResponseLatency"].to_numpy(dtype="float64", na_value=np.nan)[ok]
+            bins = self.sketch.bin_of(latency[~np.isnan(latency)])
+            keys = block[ok][~np.isnan(latency)] * self.sketch.width + bins
+            hists.append(np.bincount(keys, minlength=n * self.sketch.width).reshape(n, self.sketch.width))
+
+            requests.append(np.bincount(block, minlength=n))
+            successful.append(np.bincount(block[ok], minlength=n))
+            edges = np.arange(n) * width
+            seconds.append(np.minimum(edges + width, duration) - edges)
+            replicas.append(self.replica_seconds(df, start, width, n))
+            runs.append(np.full(n, e))
+
+        self.hist = np.concatenate(hists).astype("float64")
+        self.requests = np.concatenate(requests).astype("float64")
+        self.successful = np.concatenate(successful).astype("float64")
+        self.seconds = np.concatenate(seconds)
+        self.replicas = np.concatenate(replicas)
+        self.run = np.concatenate(runs)
+        self.runs = len(frames)
+        self.first = np.searchsorted(self.run, np.arange(self.runs))
+        self.length = np.bincount(self.run, minlength=self.runs)
+
+    @staticmethod
+    def replica_seconds(df, start, width, n):
+        """Area under the replicas metric, as compare.replica_seconds, credited to the block each sample starts in."""
+        if "replicas" not in df:
+            return np.full(n, np.nan)
+        timeline = df[["responseTime", "replicas"]].dropna().sort_values("responseTime")
+        t = timeline["responseTime"].to_numpy(dtype="float64")
+        if len(t) < 2:
+            return np.zeros(n)
+        block = np.clip(((t[:-1] - start) // width).astype("int64"), 0, n - 1)
+        return np.bincount(block, weights=np.diff(t) * timeline["replicas"].to_numpy(dtype="float64")[:-1], minlength=n)
+
+    def resample(self, resamples, rng):
+        """Resamples x blocks counts: runs drawn with replacement, then each drawn run's blocks redrawn locally.
+
+        Every block of a drawn run is replaced by one of the blocks at
+        most ``neighbours`` positions away (a local block bootstrap), so
+        a ramp is resampled from the ramp and a peak from the peak, not
+        from the whole run.
+        """
+        counts = np.zeros(resamples * len(self.run))
+        rows = np.arange(resamples)[:, None] * len(self.run)
+        for run in rng.integers(0, self.runs, size=(self.runs, resamples)):
+            for e in np.unique(run):
+                drawn = rows[run == e]
+                n = self.length[e]
+                offset = rng.integers(-self.neighbours, self.neighbours + 1, size=(len(drawn), n))
+                position = np.abs(np.arange(n) + offset)
+                # reflect at both ends, so the first and last blocks are not drawn more often
+                position = np.where(position > n - 1, 2 * (n - 1) - position, position).clip(0, n - 1)
+                counts += np.bincount((drawn + self.first[e] + position).ravel(), minlength=len(counts))
+        return counts.reshape(resamples, len(self.run))
+
+    def statistics(self, counts) -> pd.DataFrame:
+        """Every metric for every row of block counts; a row of ones is the sample as observed."""
+        counts = np.atleast_2d(counts)
+        stats = {}
+        hist = np.cumsum(counts @ self.hist, axis=1)
+        n = hist[:, -1]
+        for name, q in QUANTILES.items():
+            # the sketch's rank convention, so the observed values match compare.py
+            rank = np.floor(q * np.maximum(n - 1, 0))
+            at = np.argmax(hist > rank[:, None], axis=1)
+            stats[name] = np.where(n > 0, self.sketch.values[at], np.nan)
+
+        requests = counts @ self.requests
+        seconds = counts @ self.seconds
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats["failureRate"] = 1 - (counts @ self.successful) / requests
+            stats["throughput"] = (counts @ self.successful) / seconds
+        # per run, so groups with different numbers of repeats compare
+        stats["replicaSeconds"] = counts @ self.replicas / self.runs
+        return pd.DataFrame(stats)
+
+
+def interval(samples, confidence=CONFIDENCE):
+    """Percentile interval of each column of bootstrap samples."""
+    tail = (1 - confidence) / 2
+    return samples.quantile(tail), samples.quantile(1 - tail)
+
+
+def bootstrap_groups(groups, width=BLOCK, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0, neighbours=NEIGHBOURS):
+    """Estimates with confidence intervals per group, and the bootstrap samples behind them."""
+    rng = np.random.default_rng(seed)
+    rows, samples = [], {}
+    for (config, profile), files in groups.items():
+        blocks = Blocks([load_run(f).frame() for f in files], width, neighbours)
+        observed = blocks.statistics(np.ones(len(blocks.run))).iloc[0]
+        samples[config, profile] = blocks.statistics(blocks.resample(resamples, rng))
+        low, high = interval(samples[config, profile], confidence)
+        for metric in METRICS:
+            rows.append(dict(config=config, **config_columns(config), profile=profile, runs=len(files), metric=metric,
+                             estimate=observed[metric], low=low[metric], high=high[metric]))
+    return pd.DataFrame(rows), samples
+
+
+def differences(intervals, samples, baseline=None, confidence=CONFIDENCE) -> pd.DataFrame:
+    """Interval of each configuration's difference to the baseline configuration, per profile and metric.
+
+    Groups are resampled independently, so paired bootstrap samples
+    are a sample of the difference.
+    """
+    estimates = intervals.set_index(["config", "profile", "metric"])["estimate"]
+    rows = []
+    for profile, group in intervals.groupby("profile", sort=False):
+        configs = list(dict.fromkeys(group["config"]))
+        if len(configs) < 2:
+            continue
+        base = baseline if baseline in configs else configs[0]
+        for config in configs:
+            if config == base:
+                continue
+            diff = samples[config, profile] - samples[base, profile]
+            low, high = interval(diff, confidence)
+            for metric in METRICS:
+                estimate = estimates[config, profile, metric] - estimates[base, profile, metric]
+                rows.append(dict(profile=profile, config=config, baseline=base, metric=metric, estimate=estimate,
+                                 low=low[metric], high=high[metric],
+                                 significant=bool(low[metric] > 0 or high[metric] < 0)))
+    return pd.DataFrame(rows)
+
+
+def plot_intervals(intervals, folder, name, confidence=CONFIDENCE):
+    fig, ax = plt.subplots(1, len(METRICS), figsize=(4 * len(METRICS), 1 + 0.5 * intervals["config"].nunique()), sharey=True)
+    for a, metric in zip(ax, METRICS):
+        rows = intervals[intervals["metric"] == metric]
+        y = np.arange(len(rows))
+        a.errorbar(rows["estimate"], y, xerr=[rows["estimate"] - rows["low"], rows["high"] - rows["estimate"]],
+                   fmt='o', capsize=3)
+        a.set_yticks(y)
+        a.set_yticklabels(rows["config"])
+        a.set_title(metric)
+    ax[0].invert_yaxis()
+    fig.suptitle('{}: estimates with {:.0%} confidence intervals'.format(name, confidence))
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(folder, 'intervals.png'))
+    plt.close(fig)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="result CSVs or directories of them; repeats end in v<N>")
+    parser.add_argument("-o", "--output", default="bootstrap", help="directory to write tables and plots to")
+    parser.add_argument("--block", type=float, default=BLOCK, help="seconds per block resampled together")
+    parser.add_argument("--neighbours", type=int, default=NEIGHBOURS, help="blocks away from its position a block may be redrawn from")
+    parser.add_argument("--resamples", type=int, default=RESAMPLES, help="bootstrap resamples per group")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE, help="confidence level of the intervals")
+    parser.add_argument("--baseline", help="configuration the others are compared to (default: the first one per profile)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, for reproducible intervals")
+    args = parser.parse_args()
+
+    groups = {}
+    for file in result_files(args.results):
+        groups.setdefault(group_key(file), []).append(file)
+    intervals, samples = bootstrap_groups(groups, args.block, args.resamples, args.confidence, args.seed, args.neighbours)
+    diffs = differences(intervals, samples, args.baseline, args.confidence)
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    intervals.to_csv(os.path.join(args.output, "intervals.csv"), index=False)
+    diffs.to_csv(os.path.join(args.output, "differences.csv"), index=False)
+    for profile, group in intervals.groupby("profile", sort=False):
+        folder = os.path.join(args.output, profile)
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        plot_intervals(group, folder, profile, args.confidence)
+
+        print("[*] {}".format(profile))
+        cells = group.assign(ci=["{:.3g} [{:.3g}, {:.3g}]".format(*v) for v in group[["estimate", "low", "high"]].to_numpy()])
+        print(cells.pivot(index=["config", "runs"], columns="metric", values="ci")[METRICS].to_string())
+        for _, d in diffs[diffs["profile"] == profile].iterrows() if len(diffs) else []:
+            if d["significant"]:
+                print("[!] {}: {} {:+.3g} [{:+.3g}, {:+.3g}] against {}".format(
+                    d["config"], d["metric"], d["estimate"], d["low"], d["high"], d["baseline"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# parse each results CSV once into a columnar cache with normalized units
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from quantities import cpu_cores, invocation_rate, memory_bytes
+
+CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", ".cache/results")
+CACHE_VERSION = 2
+
+NODE_METRICS = {
+    "CpuUsage": cpu_cores,  # cores
+    "MemoryUsage": memory_bytes,  # bytes
+}
+CLUSTER_METRICS = {
+    "replicas": lambda v: pd.to_numeric(pd.Series(v), errors="coerce").to_numpy(dtype="float64"),
+    "functionInvocationRate": invocation_rate,  # invocations per second
+}
+
+
+def metric_columns(columns) -> list:
+    """(column, node, metric) for every node or cluster metric column of a result CSV."""
+    found = []
+    for col in columns:
+        for metric in NODE_METRICS:
+            if col.endswith(metric) and col != metric:
+                found.append((col, col[: -len(metric)], metric))
+        if col in CLUSTER_METRICS:
+            found.append((col, "", col))
+    return found
+
+
+class Run:
+    """A parsed result CSV: one row per request plus deduplicated metric snapshots.
+
+    ``requests`` holds the request facts and a ``snapshot`` id per row,
+    ``metrics`` is the long table (snapshot, time, node, metric, value)
+    with CPU in cores, memory in bytes and rates per second.
+    """
+
+    def __init__(self, requests, metrics, columns, source=None):
+        self.requests = requests
+        self.metrics = metrics
+        self.columns = columns
+        self.source = source
+
+    def series(self, node, metric) -> np.ndarray:
+        """Per-request values of one metric, NaN where the snapshot lacked it."""
+        m = self.metrics[(self.metrics["node"] == node) & (self.metrics["metric"] == metric)]
+        by_snapshot = np.full(int(self.metrics["snapshot"].max()) + 1 if len(self.metrics) else 1, np.nan)
+        by_snapshot[m["snapshot"].to_numpy()] = m["value"].to_numpy()
+        return by_snapshot[self.requests["snapshot"].to_numpy()]
+
+    def frame(self) -> pd.DataFrame:
+        """The run in the metrics.js column layout, quantities as float64 base units."""
+        data = {}
+        wide = {col: (node, metric) for col, node, metric in metric_columns(self.columns)}
+        for col in self.columns:
+            if col in wide:
+                data[col] = self.series(*wide[col])
+            else:
+                data[col] = self.requests[col]
+        return pd.DataFrame(data, index=self.requests.index)
+
+
+def ingest(df, source=None) -> Run:
+    wide = metric_columns(df.columns)
+    metric_cols = [col for col, _, _ in wide]
+
+    values = {}
+    for col, node, metric in wide:
+        parse = NODE_METRICS[metric] if node else CLUSTER_METRICS[metric]
+        values[col] = parse(df[col])
+    values = pd.DataFrame(values, index=df.index)
+
+    if metric_cols:
+        snapshot = values.groupby(metric_cols, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        snapshot = np.zeros(len(df), dtype="int64")
+
+    # number snapshots in the order they were first observed
+    seen = df["responseTime"].to_numpy(dtype="float64", na_value=np.nan) if "responseTime" in df else np.arange(len(df), dtype="float64")
+    firsts = pd.DataFrame({"snapshot": snapshot, "time": seen}).groupby("snapshot")["time"].min().sort_values(kind="mergesort")
+    renumber = np.empty(len(firsts), dtype="int64")
+    renumber[firsts.index.to_numpy()] = np.arange(len(firsts))
+    snapshot = renumber[snapshot]
+
+    requests = df.drop(columns=metric_cols).assign(snapshot=snapshot)
+
+    first_rows = pd.Series(np.arange(len(df))).groupby(snapshot).first().to_numpy()
+    metrics = []
+    for col, node, metric in wide:
+        v = values[col].to_numpy()[first_rows]
+        keep = ~np.isnan(v)
+        metrics.append(pd.DataFrame({
+            "snapshot": np.arange(len(first_rows))[keep],
+            "time": firsts.to_numpy()[keep],
+            "node": node,
+            "metric": metric,
+            "value": v[keep],
+        }))
+    metrics = pd.concat(metrics, ignore_index=True) if metrics else pd.DataFrame(
+        {"snapshot": [], "time": [], "node": [], "metric": [], "value": []}
+    )
+    return Run(requests, metrics, list(df.columns), source)
+
+
+def file_fingerprint(path) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def file_hash(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path) -> str:
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".npz")
+
+
+def _pack(prefix, df, arrays, meta):
+    strings = []
+    for col in df.columns:
+        v = df[col]
+        if pd.api.types.is_numeric_dtype(v.dtype) or pd.api.types.is_bool_dtype(v.dtype):
+            arrays[f"{prefix}/{col}"] = v.to_numpy()
+        else:
+            # codes into the distinct values, -1 where missing; UTF-8 bytes take a quarter of the space of U
+            codes, uniques = pd.factorize(v.astype(object))
+            arrays[f"{prefix}/{col}"] = codes.astype("int32")
+            arrays[f"{prefix}/{col}.uniques"] = np.array([u.encode() for u in map(str, uniques)], dtype="S")
+            strings.append(col)
+    meta[prefix] = {"columns": list(df.columns), "strings": strings}
+
+
+def _unpack(prefix, npz, meta):
+    data = {}
+    for col in meta[prefix]["columns"]:
+        v = npz[f"{prefix}/{col}"]
+        if col in meta[prefix]["strings"]:
+            uniques = np.array([u.decode() for u in npz[f"{prefix}/{col}.uniques"]] + [np.nan], dtype=object)
+            # code -1 picks the trailing NaN
+            v = pd.Series(uniques[v], dtype=object)
+        data[col] = v
+    return pd.DataFrame(data)
+
+
+def save(run, path, fingerprint):
+    arrays, meta = {}, dict(fingerprint, version=CACHE_VERSION, source=run.source, columns=run.columns)
+    _pack("requests", run.requests, arrays, meta)
+    _pack("metrics", run.metrics, arrays, meta)
+    arrays["meta"] = np.array(json.dumps(meta))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    # uncompressed: zlib took several times longer than parsing the CSV, and codes are compact already
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _read_meta(path):
+    with np.load(path) as npz:
+        return json.loads(str(npz["meta"]))
+
+
+def load(path) -> Run:
+    with np.load(path) as npz:
+        meta = json.loads(str(npz["meta"]))
+        return Run(_unpack("requests", npz, meta), _unpack("metrics", npz, meta), meta["columns"], meta["source"])
+
+
+def load_run(path, use_cache=True) -> Run:
+    """Parsed run for a result CSV, from the cache when the CSV is unchanged."""
+    if not use_cache:
+        return ingest(pd.read_csv(path), path)
+
+    fingerprint = file_fingerprint(path)
+    cached = cache_path(path)
+    if os.path.exists(cached):
+        try:
+            meta = _read_meta(cached)
+        except (OSError, ValueError, KeyError):
+            meta = {}
+        if meta.get("version") == CACHE_VERSION and meta.get("size") == fingerprint["size"]:
+            if meta.get("mtime_ns") == fingerprint["mtime_ns"]:
+                return load(cached)
+            # touched but possibly unchanged, the content hash decides
+            if meta.get("sha256") == file_hash(path):
+                run = load(cached)
+                save(run, cached, dict(fingerprint, sha256=meta["sha256"]))
+                return run
+
+    run = ingest(pd.read_csv(path), path)
+    save(run, cached, dict(fingerprint, sha256=file_hash(path)))
+    return run
+
+
+def result_files(paths) -> list:
+    """Result CSVs among ``paths``, walking the directories."""
+    files = [os.path.join(r, f) for p in paths for r, d, fs in os.walk(p) for f in fs]
+    files += [p for p in paths if os.path.isfile(p)]
+    return sorted(f for f in files if f.endswith(".csv"))
+
+
+if __name__ == "__main__":
+    files = result_files(sys.argv[1:])
+    for e, file in enumerate(files):
+        run = load_run(file)
+        print("[*] {}/{}: {} ({} requests, {} snapshots)".format(e + 1, len(files), file, len(run.requests), run.requests["snapshot"].max() + 1 if len(run.requests) else 0))
@@ -0,0 +1,269 @@
+# resumable experiment campaign: every cluster configuration x load profile, one <output>/<config>/<profile>.csv per cell
+import importlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ruamel.yaml import YAML
+
+from simulate import parse_config
+
+clusters = importlib.import_module("manage-clusters")
+logger = logging.getLogger()
+
+STATE_FILE = ".campaign.json"
+DEFAULT_LOADGEN = (
+    "python3 loadgen.py run load-generator/{profile}.yml -t {gateway} -o {workdir} "
+    "--prometheus {prometheus} --kube-context {context}"
+)
+DEFAULT_ANALYSIS = [
+    "python3 plot2.py {output} plots",
+    "python3 compare.py {output} -o comparison --plots plots",
+]
+REPLICAS_COMMAND = (
+    "kubectl get deployment primality -n openfaas-fn "
+    "-o jsonpath='{{.spec.replicas}} {{.status.replicas}}' --kubeconfig {kubeconfig} --context {context}"
+)
+
+
+def kubeconfig(cluster: Dict) -> str:
+    """The cluster's own kubeconfig, the only one holding its context."""
+    default = Path(os.path.expanduser(clusters.KUBECONFIG_DIR)) / f"{cluster['context']}.yml"
+    return cluster.get("kubeconfig", str(default))
+
+
+def load_spec(path: str) -> Dict:
+    """The campaign spec, with defaults filled in.
+
+    ``configs`` are results directory names like 10-s-2vcpu-2gb-10-100-0.1,
+    ``profiles`` names of load-generator/*.yml. ``loadgen`` and
+    ``analysis`` are shell commands formatted with the cell's names and
+    cluster endpoints.
+    """
+    spec = dict(YAML(typ="safe").load(Path(path)))
+    for key in ("configs", "profiles"):
+        if not spec.get(key):
+            raise ValueError(f"campaign spec {path} lists no {key}")
+    for config in spec["configs"]:
+        parse_config(config)
+    spec.setdefault("output", "results")
+    spec.setdefault("loadgen", DEFAULT_LOADGEN)
+    spec.setdefault("analysis", DEFAULT_ANALYSIS)
+    spec["cooldown"] = {"timeout": 900, "interval": 15, "settle": 60, **(spec.get("cooldown") or {})}
+    return spec
+
+
+class CampaignState:
+    """Progress of every cell and cluster, written to disk after each change."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        if path.exists():
+            self.data = json.loads(path.read_text())
+        else:
+            self.data = {"cells": {}, "clusters": {}, "analysis": {}}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data, indent=2))
+        os.replace(tmp, self.path)
+
+    def cell(self, config: str, profile: str) -> Dict:
+        return self.data["cells"].setdefault(f"{config}/{profile}", {"status": "pending", "attempts": 0})
+
+    def cluster(self, config: str) -> Optional[Dict]:
+        return self.data["clusters"].get(config)
+
+    def set_cluster(self, config: str, record: Dict):
+        self.data["clusters"][config] = record
+        self.save()
+
+
+class Campaign:
+    def __init__(self, spec: Dict, keep_clusters: bool = False, kubeconfig_dir: str = clusters.KUBECONFIG_DIR):
+        self.spec = spec
+        self.output = Path(spec["output"])
+        self.keep_clusters = keep_clusters
+        self.kubeconfig_dir = kubeconfig_dir
+        self.state = CampaignState(self.output / STATE_FILE)
+
+    def result_path(self, config: str, profile: str) -> Path:
+        return self.output / config / f"{profile}.csv"
+
+    def done(self, config: str, profile: str) -> bool:
+        cell = self.state.cell(config, profile)
+        if self.result_path(config, profile).exists():
+            if cell["status"] != "done":
+                # results from before the campaign, or a run finished just before an interruption
+                cell.update(status="done", file=str(self.result_path(config, profile)))
+                self.state.save()
+            return True
+        return False
+
+    def pending(self, config: str) -> List[str]:
+        return [p for p in self.spec["profiles"] if not self.done(config, p)]
+
+    def run(self):
+        for config in self.spec["configs"]:
+            profiles = self.pending(config)
+            if not profiles:
+                self.teardown(config)
+                continue
+            logger.info(f"{config}: {len(profiles)} of {len(self.spec['profiles'])} profiles to run")
+            cluster, fresh = self.provision(config)
+            try:
+                for e, profile in enumerate(profiles):
+                    if e or not fresh:
+                        self.cooldown(cluster, parse_config(config)["min_replicas"])
+                    self.run_cell(config, profile, cluster)
+            except BaseException:
+                if not self.keep_clusters:
+                    self.teardown(config)
+                raise
+            self.teardown(config)
+        self.analyse()
+
+    def provision(self, config: str):
+        """The config's cluster and whether it was just created, reusing one left up by an earlier run."""
+        record = self.state.cluster(config)
+        if record and record["status"] == "up" and clusters.cluster_exists(record["id"]):
+            logger.info(f"{config}: reusing cluster {record['name']} ({record['id']})")
+            return record, False
+        if record and record["status"] == "creating" and clusters.cluster_exists(record["name"]):
+            # interrupted while installing: nothing says how far it got
+            logger.warning(f"{config}: deleting half-provisioned cluster {record['name']}")
+            clusters.delete_cluster(record["name"])
+
+        params = parse_config(config)
+        self.state.set_cluster(config, {"status": "creating", "name": f"{params['size']}-{params['nodes']}"})
+        started = time.time()
+        record = clusters.create_cluster(
+            params["size"], params["nodes"], params["min_replicas"], params["max_replicas"], params["target"],
+            kubeconfig_dir=self.kubeconfig_dir,
+        )
+        record.update(status="up", provisionSeconds=round(time.time() - started, 1))
+        self.state.set_cluster(config, record)
+        return record, True
+
+    def teardown(self, config: str):
+        record = self.state.cluster(config)
+        if record and record["status"] in ("up", "creating"):
+            clusters.delete_cluster(record.get("id", record["name"]))
+            record["status"] = "deleted"
+            self.state.set_cluster(config, record)
+
+    def replicas(self, cluster: Dict) -> List[int]:
+        command = REPLICAS_COMMAND.format(kubeconfig=kubeconfig(cluster), context=cluster["context"])
+        output = clusters.run_command(command, capture_output=True)
+        return [int(v) for v in (output or "").split()]
+
+    def cooldown(self, cluster: Dict, min_replicas: int):
+        """Wait until the function is back at ``min_replicas``, then let the cluster settle."""
+        options = self.spec["cooldown"]
+        started = time.time()
+        while True:
+            replicas = self.replicas(cluster)
+            if replicas and max(replicas) <= min_replicas:
+                logger.info(f"Replicas back at {min_replicas} after {time.time() - started:.0f}s")
+                break
+            if time.time() - started > options["timeout"]:
+                logger.warning(f"Replicas still at {replicas} after {options['timeout']}s cool-down, going on")
+                break
+            time.sleep(options["interval"])
+        time.sleep(options["settle"])
+
+    def run_cell(self, config: str, profile: str, cluster: Dict):
+        cell = self.state.cell(config, profile)
+        workdir = self.output / config / f".{profile}"
+        shutil.rmtree(workdir, ignore_errors=True)
+        workdir.mkdir(parents=True)
+        cell.update(status="running", attempts=cell["attempts"] + 1, started=time.time())
+        self.state.save()
+
+        logger.info(f"{config}: running {profile}")
+        command = self.spec["loadgen"].format(
+            profile=profile, config=config, workdir=workdir, output=self.output, **cluster
+        )
+        env = dict(
+            os.environ,
+            KUBECONFIG=kubeconfig(cluster),
+            KUBE_CONTEXT=cluster["context"],
+            PROM_SERVER=cluster["prometheus"],
+            OUTPUT_DIR=str(workdir),
+        )
+        logger.debug(f"Executing: {command}")
+        returncode = subprocess.run(command, shell=True, env=env).returncode
+        written = sorted(workdir.glob("*.csv"), key=lambda p: p.stat().st_mtime)
+
+        cell["finished"] = time.time()
+        if returncode or not written:
+            cell.update(status="failed", error=f"exit status {returncode}" if returncode else "no result CSV written")
+            logger.error(f"{config}: {profile} failed: {cell['error']}")
+        else:
+            os.replace(written[-1], self.result_path(config, profile))
+            shutil.rmtree(workdir)
+            cell.update(status="done", file=str(self.result_path(config, profile)), error=None)
+            logger.info(f"{config}: {profile} done in {cell['finished'] - cell['started']:.0f}s")
+        self.state.save()
+
+    def analyse(self):
+        """Run the analysis commands if any cell finished since they last ran."""
+        finished = [c.get("finished", 0) for c in self.state.data["cells"].values() if c["status"] == "done"]
+        last = self.state.data["analysis"].get("finished", 0)
+        if not finished or max(finished) <= last:
+            return
+        for command in self.spec["analysis"]:
+            command = command.format(output=self.output)
+            logger.info(f"Analysing: {command}")
+            if subprocess.run(command, shell=True).returncode:
+                logger.error(f"Analysis command failed: {command}")
+                return
+        self.state.data["analysis"]["finished"] = time.time()
+        self.state.save()
+
+    def status(self):
+        for config in self.spec["configs"]:
+            record = self.state.cluster(config) or {}
+            print(f"{config}  cluster: {record.get('status', '-')}")
+            for profile in self.spec["profiles"]:
+                self.done(config, profile)
+                cell = self.state.cell(config, profile)
+                error = f"  ({cell['error']})" if cell.get("error") and cell["status"] == "failed" else ""
+                print(f"    {profile:24} {cell['status']:8} attempts: {cell['attempts']}{error}")
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    for action in ("run", "status"):
+        subparser = subparsers.add_parser(action)
+        subparser.add_argument("spec", help="campaign YAML: configs, profiles, output, loadgen, cooldown, analysis")
+    subparsers.choices["run"].add_argument(
+        "--keep-clusters", action="store_true", help="leave the current cluster up if interrupted, to resume on it"
+    )
+    subparsers.choices["run"].add_argument(
+        "--path", help="directory searched first for doctl, kubectl and friends, e.g. fakes for a dry run"
+    )
+    args = parser.parse_args()
+
+    if args.action == "status":
+        Campaign(load_spec(args.spec)).status()
+        return
+    kubeconfig_dir = clusters.KUBECONFIG_DIR
+    if args.path:
+        os.environ["PATH"] = os.path.abspath(args.path) + os.pathsep + os.environ["PATH"]
+        # kubeconfigs of stand-in clusters must not replace real ones
+        kubeconfig_dir = tempfile.mkdtemp(prefix="fake-kube-")
+    Campaign(load_spec(args.spec), keep_clusters=args.keep_clusters, kubeconfig_dir=kubeconfig_dir).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# per-host clock offset and drift against the load generator's clock, NTP style
+import os
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregate import EXECUTION_COLUMNS
+from cache import load_run, result_files
+from stream import CHUNKSIZE
+
+WINDOW = 60
+# fewer windows than this fit a constant offset, drift from a handful of points is noise
+MIN_DRIFT_WINDOWS = 5
+COLUMNS = ["hostId", "statusCode", "requestTime", "responseTime", "executionStartTime", "executionEndTime"]
+SAMPLE_COLUMNS = ["hostId", "window", "time", "delay", "offset", "upper", "lower"]
+
+
+def has_executions(columns) -> bool:
+    """Whether a run recorded where and when its requests executed, which every estimate needs."""
+    return set(EXECUTION_COLUMNS) <= set(columns)
+
+
+def window_samples(df, window=WINDOW) -> pd.DataFrame:
+    """The minimum-delay exchange of every host in every ``window`` seconds.
+
+    Each successful request is an NTP exchange: the client sends at
+    requestTime and receives at responseTime, the host starts and ends
+    on its own clock. Its offset estimate is only as good as its delay,
+    the round trip minus the execution, so only the quickest are kept.
+    The bounds every exchange puts on the offset (a host can not start
+    before the request was sent or end after the response arrived) are
+    kept per window too.
+    """
+    if not has_executions(df.columns):
+        return pd.DataFrame(columns=SAMPLE_COLUMNS)
+    ok = df[(df["statusCode"] == 200) & df["executionStartTime"].notna() & df["hostId"].notna()]
+    t1, t4 = ok["requestTime"].to_numpy(), ok["responseTime"].to_numpy()
+    t2, t3 = ok["executionStartTime"].to_numpy(), ok["executionEndTime"].to_numpy()
+    samples = pd.DataFrame({
+        "hostId": ok["hostId"].to_numpy(),
+        "window": np.floor(t1 / window).astype("int64"),
+        "time": t1,
+        "delay": (t4 - t1) - (t3 - t2),
+        "offset": ((t2 - t1) + (t3 - t4)) / 2,
+        "upper": t2 - t1,
+        "lower": t3 - t4,
+    })
+    return reduce_samples(samples)
+
+
+def reduce_samples(samples) -> pd.DataFrame:
+    """Combine window samples, e.g. from several chunks, keeping the minimum delay per host and window."""
+    best = samples.sort_values("delay", kind="mergesort").drop_duplicates(["hostId", "window"])
+    bounds = samples.groupby(["hostId", "window"]).agg(upper=("upper", "min"), lower=("lower", "max"))
+    best = best.drop(columns=["upper", "lower"]).join(bounds, on=["hostId", "window"])
+    return best.sort_values(["hostId", "window"]).reset_index(drop=True)
+
+
+def fit(samples, drift=True) -> pd.DataFrame:
+    """Offset (seconds, host minus client) at ``origin`` and drift (seconds per second) per host.
+
+    The line through the windows' minimum-delay offsets gives the drift;
+    its intercept is then moved into the range every exchange allows, if
+    that range is not empty.
+    """
+    rows = []
+    for host, s in samples.groupby("hostId"):
+        t = s["time"].to_numpy() - s["time"].min()
+        origin = s["time"].min()
+        if drift and len(s) >= MIN_DRIFT_WINDOWS and np.ptp(t) > 0:
+            # weight the quickest exchanges the most
+            weights = 1 / np.maximum(s["delay"].to_numpy() - s["delay"].min(), 1e-3)
+            slope, offset = np.polyfit(t, s["offset"].to_numpy(), 1, w=np.sqrt(weights))
+        else:
+            slope, offset = 0.0, float(s.sort_values("delay")["offset"].iloc[0])
+
+        lo = np.max(s["lower"].to_numpy() - slope * t)
+        hi = np.min(s["upper"].to_numpy() - slope * t)
+        feasible = lo <= hi
+        if feasible:
+            offset = min(max(offset, lo), hi)
+        rows.append({
+            "hostId": host,
+            "origin": origin,
+            "offset": offset,
+            "drift": slope,
+            "minDelay": s["delay"].min(),
+            "windows": len(s),
+            "feasible": feasible,
+        })
+    return pd.DataFrame(rows, columns=["hostId", "origin", "offset", "drift", "minDelay", "windows", "feasible"])
+
+
+def estimate(df, window=WINDOW, drift=True) -> pd.DataFrame:
+    return fit(window_samples(df, window), drift)
+
+
+def estimate_file(file, window=WINDOW, drift=True, chunksize=CHUNKSIZE) -> pd.DataFrame:
+    """The same estimate reading the CSV in chunks, for --stream."""
+    if not has_executions(pd.read_csv(file, nrows=0).columns):
+        return fit(pd.DataFrame(columns=SAMPLE_COLUMNS), drift)
+    samples = [window_samples(chunk, window) for chunk in pd.read_csv(file, usecols=COLUMNS, chunksize=chunksize)]
+    return fit(reduce_samples(pd.concat(samples, ignore_index=True)), drift)
+
+
+def correct(df, offsets) -> pd.DataFrame:
+    """``df`` with execution times moved to the client's clock and latency components recomputed.
+
+    schedulingLatency becomes request to (corrected) execution start and
+    returnLatency execution end to response; executionWait is scheduling
+    latency beyond the host's quickest one-way trip, the part spent
+    queueing rather than in transport. The raw scheduling latency and
+    the applied offset are kept as rawSchedulingLatency and clockOffset.
+    Runs without execution columns are returned as they are.
+    """
+    if not has_executions(df.columns):
+        return df
+    df = df.copy()
+    by_host = offsets.set_index("hostId")
+    hosts = df["hostId"]
+    origin = hosts.map(by_host["origin"]).to_numpy(dtype="float64")
+    offset = hosts.map(by_host["offset"]).fillna(0).to_numpy(dtype="float64")
+    drift = hosts.map(by_host["drift"]).fillna(0).to_numpy(dtype="float64")
+    one_way = hosts.map(by_host["minDelay"] / 2).to_numpy(dtype="float64")
+
+    clock = offset + drift * np.nan_to_num(df["requestTime"].to_numpy(dtype="float64") - origin)
+    df["clockOffset"] = np.where(np.isnan(origin), np.nan, clock)
+    if "schedulingLatency" in df:
+        df["rawSchedulingLatency"] = df["schedulingLatency"]
+    df["executionStartTime"] = df["executionStartTime"] - clock
+    df["executionEndTime"] = df["executionEndTime"] - clock
+    df["schedulingLatency"] = df["executionStartTime"] - df["requestTime"]
+    df["executionWait"] = df["schedulingLatency"] - one_way
+    df["returnLatency"] = df["responseTime"] - df["executionEndTime"]
+    return df
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="result CSVs or directories of them")
+    parser.add_argument("-o", "--output", default="clocks", help="directory to write the per-host offsets to")
+    parser.add_argument("--window", type=float, default=WINDOW, help="seconds per minimum-delay sample")
+    parser.add_argument("--no-drift", action="store_true", help="fit a constant offset per host")
+    args = parser.parse_args()
+
+    tables = []
+    for file in result_files(args.results):
+        df = load_run(file).frame()
+        if not has_executions(df.columns):
+            print("[!] {}: no execution columns, skipping".format(file))
+            continue
+        offsets = estimate(df, args.window, not args.no_drift)
+        fixed = correct(df, offsets)
+        ok = df["statusCode"] == 200
+        before = (df.loc[ok, "schedulingLatency"] < 0).mean()
+        after = (fixed.loc[ok, "schedulingLatency"] < 0).mean()
+        print("[*] {}: {} hosts, offsets {:.3f}..{:.3f}s, negative scheduling latency {:.1%} -> {:.1%}".format(
+            file, len(offsets), offsets["offset"].min(), offsets["offset"].max(), before, after))
+        tables.append(offsets.assign(config=Path(file).parent.name, profile=Path(file).stem))
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    table = pd.concat(tables, ignore_index=True) if tables else fit(pd.DataFrame(columns=SAMPLE_COLUMNS))
+    table.to_csv(os.path.join(args.output, "clock_offsets.csv"), index=False)
+
+
+if __name__ == "__main__":
+    main()
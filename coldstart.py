@@ -0,0 +1,210 @@
+# cold-start detection and cold-start latency analytics per run
+import os
+from argparse import ArgumentParser
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import FormatStrFormatter
+
+from aggregate import EXECUTION_COLUMNS, LATENCY_COLUMNS
+from cache import load_run, result_files
+from profiles import load_phases, phase_of, profile_for
+
+# seconds either side of a cold start its warm baseline is drawn from; load changes quickly around scale-ups
+WARM_WINDOW = 10
+# containers first executing this many seconds into a run were already running when it started
+INITIAL = 30
+
+
+def prefixed(prefix, col):
+    return prefix + col[0].upper() + col[1:]
+
+
+def first_executions(df) -> pd.DataFrame:
+    """The first successful execution of every container, in order of execution."""
+    ok = df[(df["statusCode"] == 200) & df["containerId"].notna()]
+    first = ok.sort_values("executionStartTime", kind="mergesort").drop_duplicates("containerId")
+    return first.reset_index(drop=True)
+
+
+def replica_increases(df) -> np.ndarray:
+    """One entry per added replica: the time the replicas metric first showed it."""
+    timeline = df[["responseTime", "replicas"]].dropna().sort_values("responseTime", kind="mergesort")
+    step = np.diff(timeline["replicas"].to_numpy(), prepend=np.nan)
+    up = step > 0
+    return np.repeat(timeline["responseTime"].to_numpy()[up], step[up].astype("int64"))
+
+
+def detect(df, window=WARM_WINDOW, initial=INITIAL) -> pd.DataFrame:
+    """Cold starts of a run, one row per container started during it.
+
+    The containers that executed within the first ``initial`` seconds
+    of the run were already running; every other container's first
+    execution is a cold start. Where the replicas metric rose before it,
+    the earliest unmatched increase is its ``scaleUpTime``. Its overhead
+    is measured against requests within ``window`` seconds of it on
+    containers of the same host that were already warm.
+    """
+    first = first_executions(df)
+    started = first.set_index("containerId")["executionStartTime"]
+    start = first["executionStartTime"].min() if len(first) else np.nan
+    first = first[first["executionStartTime"] > start + initial]
+    increases = replica_increases(df) if "replicas" in df else np.zeros(0)
+
+    scale_up = np.full(len(first), np.nan)
+    pending = 0
+    for e, t in enumerate(first["executionStartTime"].to_numpy()):
+        if pending < len(increases) and increases[pending] <= t:
+            scale_up[e] = increases[pending]
+            pending += 1
+
+    cold = first.assign(scaleUpTime=scale_up)
+    cold["startupLag"] = cold["executionStartTime"] - cold["scaleUpTime"]
+
+    # warm baseline: successful requests around the same time on the host's other containers
+    # that had started before; the cold container's own next ones queued behind its start
+    warm = df[(df["statusCode"] == 200) & ~df["requestId"].isin(first["requestId"])]
+    warm = warm.assign(containerStart=warm["containerId"].map(started))
+    columns = [c for c in LATENCY_COLUMNS if c in df]
+    for col in columns:
+        cold[prefixed("warm", col)] = np.nan
+
+    by_host = {host: rows.sort_values("requestTime") for host, rows in warm.groupby("hostId")}
+    overall = warm[columns].median()
+    for i, row in cold.iterrows():
+        rows = by_host.get(row["hostId"])
+        if rows is not None:
+            times = rows["requestTime"].to_numpy()
+            lo, hi = np.searchsorted(times, [row["requestTime"] - window, row["requestTime"] + window])
+            rows = rows.iloc[lo:hi]
+            rows = rows[(rows["containerId"] != row["containerId"]) & (rows["containerStart"] < row["executionStartTime"])]
+        baseline = rows[columns].median() if rows is not None and not rows.empty else overall
+        for col in columns:
+            cold.at[i, prefixed("warm", col)] = baseline[col]
+
+    for col in columns:
+        cold[prefixed("extra", col)] = cold[col] - cold[prefixed("warm", col)]
+
+    keep = ["containerId", "hostId", "requestId", "requestTime", "executionStartTime", "scaleUpTime", "startupLag"]
+    keep += columns + [c for c in cold.columns if c.startswith(("warm", "extra"))]
+    return cold[keep].reset_index(drop=True)
+
+
+def analyse(df, phases=None, initial=INITIAL):
+    origin = df["requestTime"].min()
+    cold = detect(df, initial=initial)
+    cold.insert(0, "time", cold["requestTime"] - origin)
+    if phases:
+        idx = phase_of(cold["time"], phases)
+        cold.insert(1, "phase", idx)
+        cold.insert(2, "phaseKind", [phases[i]["kind"] if i >= 0 else "" for i in idx])
+
+    summary = {
+        "containers": int(df["containerId"].nunique()),
+        "coldStarts": len(cold),
+        "initial": int(df["containerId"].nunique()) - len(cold),
+        "medianStartupLag": cold["startupLag"].median(),
+    }
+    for col in ["requestResponseLatency", "schedulingLatency", "executionLatency"]:
+        extra = prefixed("extra", col)
+        if extra in cold:
+            summary["median" + extra[0].upper() + extra[1:]] = cold[extra].median()
+            summary["p95" + extra[0].upper() + extra[1:]] = cold[extra].quantile(0.95)
+    if phases:
+        for kind in ["ramp-up", "steady", "ramp-down", "idle"]:
+            summary["coldStarts" + "".join(w.capitalize() for w in kind.split("-"))] = int((cold["phaseKind"] == kind).sum())
+    return cold, summary
+
+
+def plot_cold_starts(df, cold, phases, folder, name="Cold Starts"):
+    origin = df["requestTime"].min()
+    fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [1, 1]})
+
+    interval = 10
+    edges = np.arange(0, (df["requestTime"].max() - origin) + interval, interval)
+    counts, _ = np.histogram(cold["time"], bins=edges)
+    ax[0].bar(edges[:-1] + interval / 2, counts, width=interval * 0.9, label='Cold starts')
+    ax[0].set_ylabel('Cold starts per {} sec'.format(interval))
+    if "replicas" in df:
+        replicas = df[["responseTime", "replicas"]].dropna().sort_values("responseTime")
+        twin = ax[0].twinx()
+        twin.step(replicas["responseTime"] - origin, replicas["replicas"], where='post', color='tab:orange', label='Replicas')
+        twin.set_ylabel('Replicas')
+        twin.legend(loc='upper right')
+    ax[0].legend(loc='upper left')
+    ax[0].set_title('Cold starts over time')
+
+    for col, label in [("extraRequestResponseLatency", "Response latency"), ("extraSchedulingLatency", "Scheduling latency")]:
+        if col in cold:
+            ax[1].scatter(cold["time"], cold[col], label='{} overhead'.format(label), marker='.')
+    ax[1].axhline(0, color='grey', linewidth=0.5)
+    ax[1].set_ylabel('Extra latency vs. warm containers on the host (in seconds)')
+    ax[1].legend(loc='best')
+    ax[1].set_title('Cold-start overhead')
+
+    for a in ax:
+        a.set_xlabel('Time in seconds')
+        a.xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+        for p in phases or []:
+            a.axvline(p["start"], color='grey', linestyle=':', linewidth=0.8)
+
+    plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+    plt.close(fig)
+
+
+def plot_summary(summary, folder, name="Cold Starts Summary"):
+    table = summary.pivot_table(index="profile", columns="config", values="medianExtraRequestResponseLatency")
+    if table.empty:
+        return
+    fig, ax = plt.subplots(figsize=(16,8))
+    table.plot.bar(ax=ax)
+    ax.set_ylabel('Median cold-start response overhead (in seconds)')
+    ax.set_title('Cold-start overhead per cluster configuration')
+    plt.tight_layout()
+    plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+    plt.close(fig)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="result CSVs or directories of them")
+    parser.add_argument("-o", "--output", default="coldstarts", help="directory to write tables and plots to")
+    parser.add_argument("--initial", type=float, default=INITIAL, help="seconds into a run after which a container's first execution is a cold start")
+    args = parser.parse_args()
+
+    files = result_files(args.results)
+
+    rows = []
+    for e, file in enumerate(files):
+        df = load_run(file).frame()
+        if not set(EXECUTION_COLUMNS) <= set(df.columns):
+            print("[!] {}/{}: {}: no execution columns, skipping".format(e + 1, len(files), file))
+            continue
+        profile = profile_for(file)
+        phases = load_phases(profile) if profile else None
+        cold, summary = analyse(df, phases, args.initial)
+
+        folder = os.path.join(args.output, os.path.splitext(file)[0])
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        cold.to_csv(os.path.join(folder, "cold_starts.csv"), index=False)
+        plot_cold_starts(df, cold, phases, folder)
+
+        rows.append(dict(config=Path(file).parent.name, profile=Path(file).stem, **summary))
+        overhead = summary.get("medianExtraRequestResponseLatency", np.nan)
+        print("[*] {}/{}: {}: {} cold starts, median overhead {}".format(
+            e + 1, len(files), file, summary["coldStarts"], "{:.2f}s".format(overhead) if overhead == overhead else "-"))
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(args.output, "cold_starts_summary.csv"), index=False)
+    if not summary.empty:
+        plot_summary(summary, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# compare runs of the same load profiles across cluster configurations
+import os
+from argparse import ArgumentParser
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import FormatStrFormatter
+
+from aggregate import EXECUTION_COLUMNS, PERCENTILES
+from cache import result_files
+from concurrency import container_intervals, live_containers
+from plot import load_buckets
+
+INTERVAL = 10
+
+
+def load_runs(paths, interval=INTERVAL) -> list:
+    """Every result CSV under ``paths``, aggregated once on a grid relative to its start."""
+    runs = []
+    for file in result_files(paths):
+        runs.append({
+            "config": Path(file).parent.name,
+            "profile": Path(file).stem,
+            "file": file,
+            "buckets": load_buckets(file, interval),
+        })
+    return runs
+
+
+def replica_seconds(df) -> float:
+    """Area under the replicas metric over the run, held constant between samples."""
+    timeline = df[["responseTime", "replicas"]].dropna().sort_values("responseTime")
+    if len(timeline) < 2:
+        return 0.0
+    t = timeline["responseTime"].to_numpy()
+    return float(np.sum(np.diff(t) * timeline["replicas"].to_numpy()[:-1]))
+
+
+def summarize(run) -> dict:
+    agg = run["buckets"]
+    df = agg.df
+    summary = agg.get_summary()
+    duration = float(df["responseTime"].max() - df["requestTime"].min())
+    latency = summary["latency"].get("requestResponseLatency", {})
+
+    row = {
+        "config": run["config"],
+        "profile": run["profile"],
+        "requests": summary["requests"],
+        "duration": duration,
+        "throughput": summary["successful"] / duration if duration else np.nan,
+        "failureRate": summary["failed"] / summary["requests"] if summary["requests"] else np.nan,
+    }
+    for name in PERCENTILES:
+        row[name] = latency.get(name)
+    row["max"] = latency.get("max")
+    if "replicas" in df:
+        row["replicaSeconds"] = replica_seconds(df)
+        row["meanReplicas"] = row["replicaSeconds"] / duration if duration else np.nan
+    containers = summary.get("containers", {})
+    for key in ["meanBusyFraction", "maxInFlight", "medianIdleGap", "medianIdleBeforeScaleDown", "fairness"]:
+        row[key] = containers.get(key)
+    return row
+
+
+def node_mean(agg, suffix):
+    cols = [c for c in agg.df.columns if c.endswith(suffix)]
+    series = [agg.get_cpu_usage(c)['y'] if suffix == "CpuUsage" else agg.get_memory_usage(c)['y'] for c in cols]
+    return np.mean(series, axis=0) if series else None
+
+
+def live_total(agg):
+    if not set(EXECUTION_COLUMNS) <= set(agg.df.columns):
+        # runs recorded without execution columns have no containers to count
+        return None
+    intervals = container_intervals(agg.df[agg.valid], agg.request_start_time)
+    live = live_containers(intervals, agg.midpoints)
+    return np.sum(list(live.values()), axis=0) if live else np.zeros(len(agg.midpoints))
+
+
+def plot_overlay(runs, folder, name):
+    panels = [
+        ("Mean response latency (in seconds)", lambda a: a.get_latency_data("requestResponseLatency")['y']),
+        ("p95 response latency (in seconds)", lambda a: a.get_latency_percentiles("requestResponseLatency")["p95"]),
+        ("Successful requests", lambda a: a.get_status_data("statusCode")[0]['y']),
+        ("Failed requests", lambda a: a.get_status_data("statusCode")[1]['y']),
+        ("Replicas", lambda a: a.get_repliacs_data("replicas")['y'] if "replicas" in a.df else None),
+        ("Running containers", live_total),
+        ("Mean node CPU usage (cores)", lambda a: node_mean(a, "CpuUsage")),
+        ("Mean node memory usage (MiB)", lambda a: node_mean(a, "MemoryUsage")),
+    ]
+    fig, ax = plt.subplots(len(panels), 1, figsize=(16, 4 * len(panels)), sharex=True)
+
+    for e, (label, get) in enumerate(panels):
+        for run in runs:
+            y = get(run["buckets"])
+            if y is None:
+                continue
+            ax[e].plot(run["buckets"].midpoints, y, label=run["config"], marker='.')
+        ax[e].set_ylabel(label)
+        ax[e].legend(loc='best')
+        ax[e].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+    ax[0].set_title('{}: cluster configurations compared'.format(name))
+    ax[-1].set_xlabel('Time in seconds since the first request')
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(folder, 'overlay.png'))
+    plt.close(fig)
+
+
+def combine_images(images, path):
+    """Place the given PNGs side by side, padding shorter ones with white."""
+    images = [plt.imread(i) for i in images]
+    height = max(i.shape[0] for i in images)
+    padded = []
+    for i in images:
+        pad = np.ones((height - i.shape[0],) + i.shape[1:], dtype=i.dtype)
+        padded.append(np.concatenate([i, pad]))
+    plt.imsave(path, np.concatenate(padded, axis=1))
+
+
+def combine_plots(plots, profiles, folder):
+    """combinedplots/ layout: per config, each chart of ``profiles`` side by side."""
+    for config in sorted(os.listdir(plots)):
+        dirs = [os.path.join(plots, config, p) for p in profiles]
+        if not all(os.path.isdir(d) for d in dirs):
+            continue
+        out = os.path.join(folder, config)
+        Path(out).mkdir(parents=True, exist_ok=True)
+        charts = set.intersection(*(set(f for f in os.listdir(d) if f.endswith(".png")) for d in dirs))
+        for chart in sorted(charts):
+            combine_images([os.path.join(d, chart) for d in dirs], os.path.join(out, chart))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="results directories, one subdirectory per cluster configuration")
+    parser.add_argument("-o", "--output", default="comparison", help="directory to write tables and plots to")
+    parser.add_argument("--plots", help="plot tree written by plot2.py, used for --combine")
+    parser.add_argument(
+        "--combine",
+        action="append",
+        default=[],
+        metavar="NAME=PROFILE,PROFILE,...",
+        help="also write combinedplots/-style figures of these profiles side by side",
+    )
+    args = parser.parse_args()
+    if args.combine and not args.plots:
+        parser.error("--combine needs --plots, the plot tree to combine")
+
+    runs = load_runs(args.results)
+    summary = pd.DataFrame([summarize(run) for run in runs])
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    summary.to_csv(os.path.join(args.output, "summary.csv"), index=False)
+
+    for profile, group in summary.groupby("profile"):
+        folder = os.path.join(args.output, profile)
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        plot_overlay([r for r in runs if r["profile"] == profile], folder, profile)
+        print("[*] {}".format(profile))
+        print(group.drop(columns="profile").to_string(index=False, float_format="{:.2f}".format))
+
+    for combination in args.combine:
+        name, profiles = combination.split("=")
+        combine_plots(args.plots, profiles.split(","), os.path.join(args.output, name))
+
+
+if __name__ == "__main__":
+    main()
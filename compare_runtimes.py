@@ -0,0 +1,124 @@
+# latency and throughput of a handler under the classic (fork per request) and persistent templates
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TEMPLATES = {
+    "classic": "template/python3/index.py",
+    "persistent": "template/python3-persistent/index.py",
+}
+
+
+def prepare(template, handler_dir):
+    """A directory laid out like the function image: index.py next to function/.
+
+    It also holds the handler's per-container state files, so a local
+    run leaves nothing behind in /tmp.
+    """
+    workdir = tempfile.mkdtemp(prefix="runtime-")
+    shutil.copy(TEMPLATES[template], workdir)
+    os.symlink(os.path.abspath(handler_dir), os.path.join(workdir, "function"))
+    return workdir
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError("server did not start listening on port {}".format(port))
+
+
+def fire(send, requests, concurrency):
+    """Latency of every request and the overall throughput, ``concurrency`` at a time."""
+    def timed(_):
+        start = time.perf_counter()
+        send()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = np.array(list(pool.map(timed, range(requests))))
+    return latencies, requests / (time.perf_counter() - start)
+
+
+def run_classic(workdir, body, requests, concurrency):
+    env = dict(os.environ, instrumentation_dir=workdir)
+
+    def send():
+        subprocess.run([sys.executable, "index.py"], input=body, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+    return fire(send, requests, concurrency)
+
+
+def run_persistent(workdir, body, requests, concurrency, workers, threads):
+    port = free_port()
+    env = dict(os.environ, http_port=str(port), workers=str(workers), threads=str(threads), instrumentation_dir=workdir)
+    server = subprocess.Popen([sys.executable, "index.py"], cwd=workdir, env=env)
+    try:
+        wait_for(port)
+
+        def send():
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            conn.request("POST", "/", body=body.encode())
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status != 200:
+                raise RuntimeError("request failed with status {}".format(response.status))
+
+        return fire(send, requests, concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--handler", default="function/primality", help="directory of the handler package")
+    parser.add_argument("--body", default="97", help="request body sent to the handler")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1, help="pre-forked processes of the persistent server")
+    parser.add_argument("--threads", type=int, default=4, help="threads per persistent server process")
+    args = parser.parse_args()
+
+    rows = []
+    for template in TEMPLATES:
+        workdir = prepare(template, args.handler)
+        try:
+            if template == "classic":
+                latencies, throughput = run_classic(workdir, args.body, args.requests, args.concurrency)
+            else:
+                latencies, throughput = run_persistent(workdir, args.body, args.requests, args.concurrency, args.workers, args.threads)
+        finally:
+            shutil.rmtree(workdir)
+        rows.append((template, latencies, throughput))
+
+    print("{:<12}{:>10}{:>10}{:>10}{:>10}{:>14}".format("template", "mean ms", "p50 ms", "p95 ms", "p99 ms", "requests/s"))
+    for template, latencies, throughput in rows:
+        ms = latencies * 1000
+        print("{:<12}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>14.1f}".format(
+            template, ms.mean(), *np.percentile(ms, [50, 95, 99]), throughput))
+
+
+if __name__ == "__main__":
+    main()
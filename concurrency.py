@@ -0,0 +1,66 @@
+# live containers per host from execution intervals, by sweeping sorted interval ends
+import numpy as np
+import pandas as pd
+
+from aggregate import elapsed_seconds
+
+
+def container_intervals(df, origin) -> pd.DataFrame:
+    """Merge the executions of each (hostId, containerId) into disjoint live intervals.
+
+    Times are seconds since ``origin``; an interval is live on both of its
+    ends, so executions that touch are merged into a single interval.
+    """
+    rows = pd.DataFrame({
+        "hostId": df["hostId"].to_numpy(),
+        "containerId": df["containerId"].to_numpy(),
+        "start": elapsed_seconds(df["executionStartTime"], origin),
+        "end": elapsed_seconds(df["executionEndTime"], origin),
+    }).dropna()
+    rows = rows[rows["start"] <= rows["end"]]
+    rows = rows.sort_values(["hostId", "containerId", "start"], kind="mergesort")
+
+    group = ["hostId", "containerId"]
+    reach = rows.groupby(group, sort=False)["end"].cummax().to_numpy()
+    # a new interval begins with each container or once the previous ones have ended
+    begins = ~rows.duplicated(group).to_numpy()
+    begins[1:] |= rows["start"].to_numpy()[1:] > reach[:-1]
+    at = np.flatnonzero(begins)
+
+    return pd.DataFrame({
+        "hostId": rows["hostId"].to_numpy()[at],
+        "containerId": rows["containerId"].to_numpy()[at],
+        "start": rows["start"].to_numpy()[at],
+        "end": np.maximum.reduceat(reach, at) if len(at) else reach,
+    })
+
+
+def live_containers(intervals, points) -> dict:
+    """Number of distinct live containers per host at each of ``points``."""
+    points = np.asarray(points, dtype="float64")
+    live = {}
+    for host, iv in intervals.groupby("hostId", sort=False):
+        starts = np.sort(iv["start"].to_numpy())
+        ends = np.sort(iv["end"].to_numpy())
+        live[host] = np.searchsorted(starts, points, "right") - np.searchsorted(ends, points, "left")
+    return live
+
+
+def live_containers_by_step(intervals, step, start=0.0, end=None) -> tuple:
+    if end is None:
+        end = intervals["end"].max() if len(intervals) else start
+    points = np.arange(start, end + step, step)
+    return points, live_containers(intervals, points)
+
+
+def peak_concurrency(intervals) -> dict:
+    """Highest number of simultaneously live containers seen on each host."""
+    peaks = {}
+    for host, iv in intervals.groupby("hostId", sort=False):
+        times = np.concatenate([iv["start"].to_numpy(), iv["end"].to_numpy()])
+        # starts sort before ends at the same instant since intervals include their ends
+        kinds = np.concatenate([np.zeros(len(iv)), np.ones(len(iv))])
+        order = np.lexsort((kinds, times))
+        steps = np.where(kinds[order] == 0, 1, -1)
+        peaks[host] = int(np.cumsum(steps).max())
+    return peaks
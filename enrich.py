@@ -0,0 +1,177 @@
+# join cluster metrics onto result CSVs after a run, from Prometheus range queries
+import hashlib
+import json
+import os
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+
+from cache import load_run, metric_columns, result_files
+
+PROM_CACHE_DIR = os.environ.get("PROM_CACHE_DIR", ".cache/prometheus")
+# Prometheus rejects ranges of more than 11000 points per series
+MAX_POINTS = 11000
+
+# what metrics.js records per response, as range queries; node metrics are
+# the kubelet's root-cgroup usage that metrics-server also reports
+QUERIES = {
+    "replicas": "count(count by (kubernetes_pod_name) (up))",
+    "functionInvocationRate": "sum(rate(gateway_function_invocation_started[15s]))",
+    "CpuUsage": 'sum by (node) (rate(container_cpu_usage_seconds_total{id="/"}[1m]))',
+    "MemoryUsage": 'sum by (node) (container_memory_working_set_bytes{id="/"})',
+}
+
+
+def query_range(url, query, start, end, step, cache_dir=PROM_CACHE_DIR) -> list:
+    """The matrix result of a range query, fetched in chunks of at most MAX_POINTS and cached on disk."""
+    key = hashlib.sha1(json.dumps([url, query, start, end, step]).encode()).hexdigest()
+    path = os.path.join(cache_dir, key + ".json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    series = {}
+    chunk = step * (MAX_POINTS - 1)
+    lo = start
+    while lo <= end:
+        hi = min(lo + chunk, end)
+        params = urlencode({"query": query, "start": lo, "end": hi, "step": step})
+        with urlopen("{}/api/v1/query_range?{}".format(url.rstrip("/"), params)) as response:
+            body = json.load(response)
+        if body.get("status") != "success":
+            raise RuntimeError("query {!r} failed: {}".format(query, body.get("error")))
+        for result in body["data"]["result"]:
+            labels = json.dumps(result["metric"], sort_keys=True)
+            series.setdefault(labels, []).extend(result["values"])
+        lo = hi + step
+
+    result = [{"metric": json.loads(labels), "values": values} for labels, values in series.items()]
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+    return result
+
+
+def fetch(url, start, end, step=5.0, node_label="node", queries=QUERIES, cache_dir=PROM_CACHE_DIR) -> pd.DataFrame:
+    """Cluster metrics on a ``step`` grid: a time column plus one column per metrics.js column."""
+    # Prometheus timestamps have millisecond resolution
+    grid = pd.DataFrame({"time": np.round(np.arange(start, end + step, step), 3)})
+    for name, query in queries.items():
+        for result in query_range(url, query, start, end, step, cache_dir):
+            col = result["metric"].get(node_label, "") + name if name in ("CpuUsage", "MemoryUsage") else name
+            values = np.asarray(result["values"], dtype="float64").reshape(-1, 2)
+            series = pd.DataFrame({"time": np.round(values[:, 0], 3), col: values[:, 1]}).drop_duplicates("time")
+            grid = grid.merge(series, on="time", how="left")
+    return grid
+
+
+def enrich(df, series, on="responseTime") -> pd.DataFrame:
+    """``df`` with its cluster metric columns replaced by the last ``series`` sample at or before ``on``."""
+    old = [col for col, _, _ in metric_columns(df.columns)]
+    columns = [c for c in df.columns if c not in old]
+    at = columns.index("requestId") + 1 if "requestId" in columns else len(columns)
+    new = [c for c in series.columns if c != "time"]
+    nodes = list(dict.fromkeys(node for _, node, _ in metric_columns(new) if node))
+    ordered = [c for c in ["replicas"] if c in new]
+    ordered += [node + metric for node in nodes for metric in ("CpuUsage", "MemoryUsage") if node + metric in new]
+    ordered += [c for c in ["functionInvocationRate"] if c in new]
+
+    rows = df.drop(columns=old).assign(_row=np.arange(len(df))).sort_values(on, kind="mergesort")
+    joined = pd.merge_asof(rows, series.sort_values("time"), left_on=on, right_on="time", direction="backward")
+    joined = joined.sort_values("_row").reset_index(drop=True)
+    return joined[columns[:at] + ordered + columns[at:]]
+
+
+def output_path(output, file):
+    """Where the enriched copy of ``file`` goes: its relative path, or its config/file name, under ``output``."""
+    rel = os.path.relpath(file)
+    if rel.startswith(".."):
+        rel = os.path.join(Path(file).parent.name, Path(file).name)
+    return os.path.join(output, rel)
+
+
+def time_bounds(df, step):
+    return float(np.floor(df["requestTime"].min() / step) * step - step), float(np.ceil(df["responseTime"].max() / step) * step + step)
+
+
+class FakePrometheus(BaseHTTPRequestHandler):
+    """Answers the QUERIES as range queries from the metric columns of a recorded result CSV."""
+
+    frame = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if parts.path != "/api/v1/query_range":
+            self.send_error(404)
+            return
+        name = next((k for k, q in QUERIES.items() if q == params.get("query")), None)
+        start, end, step = float(params["start"]), float(params["end"]), float(params["step"])
+        grid = np.arange(start, end + step / 2, step)
+
+        frame = self.frame
+        results = []
+        for col, node, metric in metric_columns(frame.columns):
+            if metric != name:
+                continue
+            known = frame[["responseTime", col]].dropna()
+            at = np.searchsorted(known["responseTime"].to_numpy(), grid, "right") - 1
+            keep = at >= 0
+            values = known[col].to_numpy()[at[keep]]
+            results.append({
+                "metric": {"node": node} if node else {},
+                "values": [[t, repr(float(v))] for t, v in zip(grid[keep], values)],
+            })
+
+        body = json.dumps({"status": "success", "data": {"resultType": "matrix", "result": results}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enrich_parser = subparsers.add_parser("enrich", help="add cluster metrics to result CSVs")
+    enrich_parser.add_argument("results", nargs="+", help="result CSVs or directories of them")
+    enrich_parser.add_argument("--prometheus", default=os.environ.get("PROM_SERVER"), required=not os.environ.get("PROM_SERVER"))
+    enrich_parser.add_argument("-o", "--output", default="enriched", help="directory to write the enriched CSVs to")
+    enrich_parser.add_argument("--step", type=float, default=5.0, help="seconds between samples of the range queries")
+    enrich_parser.add_argument("--node-label", default="node", help="label holding the node name in the node metric series")
+
+    fake_parser = subparsers.add_parser("fake-prometheus", help="serve a result CSV's recorded metrics as a Prometheus stand-in")
+    fake_parser.add_argument("result", help="result CSV with metric columns")
+    fake_parser.add_argument("--port", type=int, default=9090)
+    args = parser.parse_args()
+
+    if args.command == "fake-prometheus":
+        FakePrometheus.frame = load_run(args.result).frame().sort_values("responseTime")
+        print("[*] fake Prometheus for {} on http://127.0.0.1:{}".format(args.result, args.port))
+        HTTPServer(("127.0.0.1", args.port), FakePrometheus).serve_forever()
+        return
+
+    for file in result_files(args.results):
+        df = pd.read_csv(file)
+        start, end = time_bounds(df, args.step)
+        series = fetch(args.prometheus, start, end, args.step, args.node_label)
+        path = output_path(args.output, file)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        enrich(df, series).to_csv(path, index=False)
+        print("[*] {}: {} samples of {} metrics".format(path, len(series), len(series.columns) - 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+#!/bin/sh
+# dry run of campaign.yml here against the fake tools, in a scratch directory
+# usage: fakes/dry-run.sh [scratch-dir], FAKE_FAIL=<profile> makes that profile's load generator fail
+set -e
+FAKES=$(cd "$(dirname "$0")" && pwd)
+REPO=$(dirname "$FAKES")
+WORK=${1:-$(mktemp -d)}
+PYTHON=${PYTHON:-python3}
+
+mkdir -p "$WORK"
+cp -r "$REPO/function" "$REPO/kubernetes" "$FAKES/campaign.yml" "$WORK"
+cd "$WORK"
+# anything written to ~ stays in the scratch directory
+export REPO PYTHON HOME="$WORK"
+export FAKE_LOG="$WORK/log" FAKE_REPLICAS="$WORK/replicas"
+export FAKE_RESULTS=${FAKE_RESULTS:-$REPO/results2/10-s-2vcpu-2gb-10-100-0.1}
+"$PYTHON" "$REPO/campaign.py" run campaign.yml --path "$FAKES"
+echo "$WORK"
@@ -1,39 +1,35 @@
+import functools
 import json
 import os
-import subprocess
+import re
 import time
-import uuid
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .instrumentation import invocation, phase
 
 DEFAULT_NUMBER = 10000019
+DEFAULT_MODE = os.environ.get("PRIMALITY_MODE", "reference")
+SEGMENT_SIZE = int(os.environ.get("PRIMALITY_SEGMENT_SIZE", 1 << 18))
+
+# deterministic for every n < 3.3 * 10**24
+MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
 
 
 def collect_metrics(func):
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        container_id = str(uuid.uuid4())
-        if os.path.exists("/tmp/container-id"):
-            with open("/tmp/container-id", "r") as f:
-                container_id = f.read()
-        else:
-            with open("/tmp/container-id", "w") as f:
-                f.write(container_id)
-        btime_line = subprocess.check_output("cat /proc/stat | grep btime", shell=True)
-        host_btime = btime_line.decode().split()[1]
-
-        output = func(*args, **kwargs)
-        end_time = time.time()
+        with invocation() as current:
+            invocation_payload, kernel_metrics = func(*args, **kwargs)
         payload = {
             "metrics": {
-                "executionStartTime": start_time,
-                "executionEndTime": end_time,
-                "executionLatency": end_time - start_time,
-                "containerId": container_id,
-                "hostId": host_btime,
+                **current.metrics(),
+                **kernel_metrics,
             },
-            "invocation": {
-                "argument": int(args[0]) if args[0] else DEFAULT_NUMBER,
-                "output": output == "True"
-            }
+            "invocation": invocation_payload
         }
         return json.dumps(payload, indent=2)
 
@@ -55,7 +51,158 @@ def if_prime(n):
     return prime[-1]
 
 
+def bytearray_sieve(n):
+    """Sieve of Eratosthenes over one byte per number, crossing off with slice assignment."""
+    if n < 2:
+        return False
+    prime = bytearray([1]) * (n + 1)
+    prime[0] = prime[1] = 0
+    for p in range(2, int(n ** 0.5) + 1):
+        if prime[p]:
+            prime[p * p::p] = bytes(len(range(p * p, n + 1, p)))
+    return bool(prime[n])
+
+
+def numpy_sieve(n):
+    if np is None:
+        raise ValueError("the numpy kernel needs numpy installed")
+    if n < 2:
+        return False
+    prime = np.ones(n + 1, dtype=bool)
+    prime[:2] = False
+    for p in range(2, int(n ** 0.5) + 1):
+        if prime[p]:
+            prime[p * p::p] = False
+    return bool(prime[n])
+
+
+def segmented_sieve(n, segment_size=SEGMENT_SIZE):
+    """The same sieve over [0, n] in fixed-size segments.
+
+    Does the full sieve's work while holding only the primes up to sqrt(n)
+    and one segment, so memory stays at about ``segment_size`` bytes.
+    """
+    if n < 2:
+        return False
+    root = int(n ** 0.5)
+    base = bytearray([1]) * (root + 1)
+    primes = []
+    for p in range(2, root + 1):
+        if base[p]:
+            primes.append(p)
+            base[p * p::p] = bytes(len(range(p * p, root + 1, p)))
+
+    prime = False
+    for low in range(2, n + 1, segment_size):
+        high = min(low + segment_size, n + 1)
+        segment = bytearray([1]) * (high - low)
+        for p in primes:
+            if p * p >= high:
+                break
+            first = max(p * p, (low + p - 1) // p * p)
+            segment[first - low::p] = bytes(len(range(first, high, p)))
+        prime = bool(segment[-1])
+    return prime
+
+
+def miller_rabin(n):
+    """Deterministic Miller-Rabin test, no sieve at all."""
+    if n < 2:
+        return False
+    for p in MILLER_RABIN_BASES:
+        if n % p == 0:
+            return n == p
+
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for a in MILLER_RABIN_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+KERNELS = {
+    "reference": if_prime,
+    "bytearray": bytearray_sieve,
+    "numpy": numpy_sieve,
+    "segmented": segmented_sieve,
+    "miller-rabin": miller_rabin,
+}
+
+
+def reset_peak_rss():
+    """Reset the kernel's high-water mark of this process's resident memory, if allowed."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def rss():
+    """Current and peak resident memory of this process, in bytes."""
+    with open("/proc/self/status") as f:
+        status = f.read()
+    current, peak = (int(re.search(field + r":\s+(\d+) kB", status).group(1)) * 1024 for field in ("VmRSS", "VmHWM"))
+    return current, peak
+
+
+def run_kernel(mode, number):
+    """Test ``number`` with the ``mode`` kernel, timing it and measuring its peak memory.
+
+    The classic watchdog forks a fresh process per request, so the peak
+    memory increase is the kernel's own; in a long-lived process memory the
+    allocator kept from earlier requests hides part of it.
+    """
+    if mode not in KERNELS:
+        raise ValueError("unknown primality mode {!r}, expected one of {}".format(mode, ", ".join(KERNELS)))
+    reset = reset_peak_rss()
+    before, _ = rss()
+    start = time.perf_counter()
+    output = KERNELS[mode](number)
+    compute_time = time.perf_counter() - start
+    _, peak = rss()
+
+    return output, {
+        "kernel": mode,
+        "kernelComputeTime": compute_time,
+        # without a reset only the lifetime peak of the process is known
+        "kernelPeakMemory": peak if reset else None,
+        "kernelPeakMemoryIncrease": peak - before if reset else None,
+    }
+
+
+def parse_request(req):
+    """The number to test and the kernel to use.
+
+    The request is either a plain number or a JSON object with ``number``
+    and ``mode``; the mode defaults to ``$PRIMALITY_MODE``.
+    """
+    req = req.strip() if req else ""
+    if req.startswith("{"):
+        body = json.loads(req)
+        return int(body.get("number", DEFAULT_NUMBER)), body.get("mode", DEFAULT_MODE)
+    return int(req) if req else DEFAULT_NUMBER, DEFAULT_MODE
+
+
 @collect_metrics
 def handle(req):
-    number = int(req) if req else DEFAULT_NUMBER
-    return str(if_prime(number))
+    with phase("parse"):
+        number, mode = parse_request(req)
+    with phase("kernel"):
+        output, kernel_metrics = run_kernel(mode, number)
+    invocation = {
+        "argument": number,
+        "mode": mode,
+        "output": output
+    }
+    return invocation, kernel_metrics
@@ -0,0 +1,104 @@
+# Persistent-process runtime: the handler is imported once and every request
+# is served over HTTP by the same process(es), behind the of-watchdog in
+# http mode, instead of a fresh interpreter per request.
+import os
+import signal
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from function import handler
+
+HOST = os.environ.get("http_host", "127.0.0.1")
+PORT = int(os.environ.get("http_port", 5000))
+WORKERS = int(os.environ.get("workers", 1))
+THREADS = int(os.environ.get("threads", 4))
+
+
+def read_body(request):
+    if request.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        body = b""
+        while True:
+            size = int(request.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                request.rfile.readline()
+                return body
+            body += request.rfile.read(size)
+            request.rfile.readline()
+    length = int(request.headers.get("Content-Length") or 0)
+    return request.rfile.read(length) if length else b""
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Hands the request body to handle(req) as a string, like the classic watchdog's stdin."""
+
+    def serve(self):
+        try:
+            ret = handler.handle(read_body(self).decode())
+            status, body = 200, "" if ret is None else str(ret)
+        except Exception:
+            status, body = 500, traceback.format_exc()
+
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer handling connections on a fixed pool of threads."""
+
+    def __init__(self, address, handler_class, threads):
+        super().__init__(address, handler_class)
+        self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(host=HOST, port=PORT, workers=WORKERS, threads=THREADS):
+    """Serve on ``threads`` threads in each of ``workers`` processes forked after binding."""
+    server = PooledHTTPServer((host, port), RequestHandler, threads)
+    if workers <= 1:
+        server.serve_forever()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            server.serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        pid, _ = os.wait()
+        children.remove(pid)
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,270 @@
+# offline what-if replay of the HPA over a recorded run's traffic, for a grid of settings at once
+import itertools
+import os
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import FormatStrFormatter
+
+from cache import load_run, result_files
+from compare import replica_seconds
+from simulate import DEFAULTS, parse_config
+
+STEP = 1.0
+# processor sharing: response time is service time / (1 - utilization), capped here short of overload
+MAX_UTILIZATION = 0.95
+
+
+def setting_grid(targets, min_replicas, max_replicas, windows) -> pd.DataFrame:
+    """Every combination of the given values, without min above max."""
+    rows = [
+        {"target": t, "minReplicas": lo, "maxReplicas": hi, "stabilizationWindow": w}
+        for t, lo, hi, w in itertools.product(targets, min_replicas, max_replicas, windows)
+        if lo <= hi
+    ]
+    grid = pd.DataFrame(rows, columns=["target", "minReplicas", "maxReplicas", "stabilizationWindow"])
+    grid.insert(0, "setting", ["{}-{}-{:g}-{:g}s".format(r.minReplicas, r.maxReplicas, r.target, r.stabilizationWindow)
+                               for r in grid.itertuples()])
+    return grid.drop_duplicates("setting").reset_index(drop=True)
+
+
+def invocation_rate(arrivals, times, window=DEFAULTS["rate_window"]) -> np.ndarray:
+    """sum(rate(gateway_function_invocation_started[15s])) at ``times``: invocations started in the window before."""
+    arrivals = np.sort(arrivals)
+    return (np.searchsorted(arrivals, times, "right") - np.searchsorted(arrivals, times - window, "right")) / window
+
+
+def recommend(rate, current, target, tolerance=DEFAULTS["tolerance"]) -> np.ndarray:
+    """Replicas the HPA asks for at an AverageValue ``target`` per pod, before min/max and behavior."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = rate / (target * current)
+    # rounded so that e.g. 0.3 / 0.1 asks for 3 pods and not 4
+    desired = np.ceil(np.round(rate / target, 9))
+    return np.where(np.abs(ratio - 1) <= tolerance, current, desired)
+
+
+def replay(rate, grid, params=DEFAULTS) -> np.ndarray:
+    """Replicas the HPA sets at each sync, one column per setting of ``grid``.
+
+    Each sync recommends replicas for the metric, clamps them to
+    min/max, holds scale-downs to the highest recommendation within the
+    stabilization window and limits scale-ups to the larger of +4 pods
+    and +100%, like the default HPA behavior. The metric does not depend
+    on the replicas, so all settings step through the syncs together.
+    """
+    target = grid["target"].to_numpy(dtype="float64")
+    lo = grid["minReplicas"].to_numpy(dtype="float64")
+    hi = grid["maxReplicas"].to_numpy(dtype="float64")
+    # recommendations made less than a window ago, counted in syncs
+    span = grid["stabilizationWindow"].to_numpy(dtype="float64") / params["sync_period"]
+    lookback = int(np.ceil(span.max())) if len(span) else 0
+
+    current = lo.copy()
+    history = np.empty((len(rate), len(grid)))
+    replicas = np.empty((len(rate), len(grid)))
+    for k, r in enumerate(rate):
+        desired = np.clip(recommend(r, current, target, params["tolerance"]), lo, hi)
+        history[k] = desired
+        first = max(k - lookback, 0)
+        recent = np.arange(first, k + 1)[:, None] > k - span[None, :]
+        # the current recommendation is always part of the window
+        peak = np.maximum(np.where(recent, history[first:k + 1], -np.inf).max(axis=0), desired)
+
+        limit = np.maximum(current + params["scale_up_pods"], current * (100 + params["scale_up_percent"]) // 100)
+        current = np.where(desired < current, np.minimum(current, peak), np.minimum(desired, limit))
+        replicas[k] = current
+    return replicas
+
+
+def ready_replicas(replicas, startup, step=STEP) -> np.ndarray:
+    """Pods that finished starting, per row of ``replicas`` sampled every ``step`` seconds.
+
+    Scale-downs remove starting pods first, so the pods that have been
+    up for ``startup`` seconds are the fewest replicas set within that
+    time, with the initial pods ready from the start.
+    """
+    width = int(round(startup / step))
+    if width == 0:
+        return replicas
+    padded = np.concatenate([np.repeat(replicas[:1], width, axis=0), replicas])
+    return np.lib.stride_tricks.sliding_window_view(padded, width + 1, axis=0).min(axis=-1)
+
+
+def latencies(arrived, ready, service, timeout=DEFAULTS["exec_timeout"], step=STEP) -> np.ndarray:
+    """Estimated response latency of a request arriving in each step, per setting.
+
+    Each ready pod serves 1 / ``service`` requests per second. Below
+    capacity requests share the pods' CPU (service / (1 - utilization));
+    above it the excess queues, and waits for the backlog to drain.
+    Requests that would wait longer than ``timeout`` time out and leave
+    the backlog.
+    """
+    capacity = ready / service
+    rate = arrived[:, None] / step
+    with np.errstate(divide="ignore", invalid="ignore"):
+        utilization = np.where(capacity > 0, rate / capacity, np.inf)
+    backlog = np.zeros(ready.shape[1])
+    waits = np.empty(ready.shape)
+    for k in range(len(arrived)):
+        backlog = np.clip(backlog + (rate[k] - capacity[k]) * step, 0, capacity[k] * timeout)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            waits[k] = np.where(capacity[k] > 0, backlog / capacity[k], np.inf)
+    return service / (1 - np.minimum(utilization, MAX_UTILIZATION)) + waits
+
+
+def weighted_quantile(values, weights, q) -> np.ndarray:
+    """Per-column ``q`` quantile of ``values`` with rows weighted by ``weights``."""
+    order = np.argsort(values, axis=0)
+    cumulative = np.cumsum(weights[order], axis=0)
+    at = np.argmax(cumulative >= q * cumulative[-1], axis=0)
+    return np.take_along_axis(values, order, axis=0)[at, np.arange(values.shape[1])]
+
+
+def evaluate(arrivals, grid, service, startup=DEFAULTS["pod_startup"], params=DEFAULTS, step=STEP):
+    """Replica curves and cost and latency estimates of every setting of ``grid`` for one request timeline.
+
+    ``arrivals`` are request times in seconds since the start of the run.
+    """
+    end = float(np.max(arrivals)) + params["exec_timeout"] if len(arrivals) else 0.0
+    syncs = np.arange(0.0, end, params["sync_period"])
+    replicas = replay(invocation_rate(arrivals, syncs, params["rate_window"]), grid, params)
+
+    times = np.arange(0.0, end, step)
+    at_sync = np.minimum((times // params["sync_period"]).astype("int64"), len(syncs) - 1)
+    spec = replicas[at_sync]
+    ready = ready_replicas(spec, startup, step)
+    arrived = np.bincount(np.minimum((arrivals // step).astype("int64"), len(times) - 1), minlength=len(times)).astype("float64")
+    latency = latencies(arrived, ready, service, params["exec_timeout"], step)
+
+    failed = latency > params["exec_timeout"]
+    requests = arrived.sum()
+    served = np.where(failed, np.nan, latency)
+    results = grid.copy()
+    results["replicaSeconds"] = spec.sum(axis=0) * step
+    results["meanReplicas"] = spec.mean(axis=0)
+    results["peakReplicas"] = spec.max(axis=0)
+    results["scaleEvents"] = (np.diff(replicas, axis=0) != 0).sum(axis=0)
+    results["failures"] = (failed * arrived[:, None]).sum(axis=0)
+    results["failureRate"] = results["failures"] / requests if requests else np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        results["meanLatency"] = np.nansum(served * arrived[:, None], axis=0) / ((~failed) * arrived[:, None]).sum(axis=0)
+    for name, q in [("p50", 0.5), ("p95", 0.95), ("p99", 0.99)]:
+        results[name] = weighted_quantile(np.where(failed, np.inf, latency), arrived, q)
+    curves = pd.DataFrame(replicas, columns=grid["setting"]).assign(time=syncs)
+    return results, curves[["time"] + list(grid["setting"])]
+
+
+def service_time(df) -> float:
+    """Per-pod service time: the median execution latency of the run's successful requests."""
+    return float(df.loc[df["statusCode"] == 200, "executionLatency"].median())
+
+
+def plot_whatif(df, results, curves, recorded, folder, name="HPA What-If"):
+    fig, ax = plt.subplots(2, 1, figsize=(16,11))
+    origin = df["requestTime"].min()
+
+    if "replicas" in df:
+        timeline = df[["responseTime", "replicas"]].dropna().sort_values("responseTime")
+        ax[0].step(timeline["responseTime"] - origin, timeline["replicas"], where='post', label='Recorded', color='black')
+    cheapest = results.sort_values(["failures", "replicaSeconds"]).iloc[0]["setting"]
+    for setting in dict.fromkeys([recorded, cheapest]):
+        if setting in curves:
+            ax[0].step(curves["time"], curves[setting], where='post', label='Replayed {}'.format(setting))
+    ax[0].set_ylabel('Replicas')
+    ax[0].set_xlabel('Time in seconds')
+    ax[0].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+    ax[0].legend(loc='best')
+    ax[0].set_title('Replica curves (min-max-averageValue-stabilization)')
+
+    finite = results[np.isfinite(results["p95"])]
+    points = ax[1].scatter(finite["replicaSeconds"], finite["p95"], c=finite["failureRate"], cmap='viridis', marker='.')
+    fig.colorbar(points, ax=ax[1], label='Predicted failure rate')
+    if recorded in set(results["setting"]):
+        mine = results[results["setting"] == recorded]
+        ax[1].scatter(mine["replicaSeconds"], mine["p95"], color='red', marker='x', s=100, label='Recorded setting')
+        ax[1].legend(loc='best')
+    ax[1].set_xlabel('Replica-seconds')
+    ax[1].set_ylabel('Predicted p95 latency (in seconds)')
+    ax[1].set_title('Cost against latency per setting')
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_").replace("-","_"))))
+    plt.close(fig)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="result CSVs or directories of them")
+    parser.add_argument("-o", "--output", default="whatif", help="directory to write tables and plots to")
+    parser.add_argument("--target", type=float, nargs="+", help="averageValue invocations per second per pod (default: the run's)")
+    parser.add_argument("--min-replicas", type=int, nargs="+", help="(default: the run's)")
+    parser.add_argument("--max-replicas", type=int, nargs="+", help="(default: the run's)")
+    parser.add_argument("--stabilization", type=float, nargs="+", default=[DEFAULTS["stabilization_window"]],
+                        help="scale-down stabilization windows in seconds")
+    parser.add_argument("--pod-startup", type=float, default=DEFAULTS["pod_startup"], help="seconds from scale-up to a ready pod")
+    parser.add_argument("--service-time", type=float, help="seconds one pod needs per request (default: the run's median execution latency)")
+    args = parser.parse_args()
+
+    files = result_files(args.results)
+
+    tables = []
+    for e, file in enumerate(files):
+        df = load_run(file).frame()
+        config = Path(file).parent.name
+        try:
+            settings = parse_config(config)
+        except ValueError:
+            settings = {}
+        if not settings and not (args.target and args.min_replicas and args.max_replicas):
+            print("[!] {}: not a configuration directory, pass --target, --min-replicas and --max-replicas".format(file))
+            continue
+
+        grid = setting_grid(
+            args.target or [settings["target"]],
+            args.min_replicas or [settings["min_replicas"]],
+            args.max_replicas or [settings["max_replicas"]],
+            args.stabilization,
+        )
+        recorded = None
+        if settings:
+            # always replay what the run actually used, to check the replay against the recording
+            mine = setting_grid([settings["target"]], [settings["min_replicas"]], [settings["max_replicas"]], [DEFAULTS["stabilization_window"]])
+            recorded = mine["setting"].iloc[0]
+            grid = pd.concat([mine, grid], ignore_index=True).drop_duplicates("setting").reset_index(drop=True)
+
+        service = args.service_time or service_time(df)
+        started = time.perf_counter()
+        arrivals = (df["requestTime"] - df["requestTime"].min()).to_numpy()
+        results, curves = evaluate(arrivals, grid, service, args.pod_startup)
+        elapsed = time.perf_counter() - started
+        results.insert(1, "recorded", results["setting"] == recorded)
+
+        folder = os.path.join(args.output, os.path.splitext(file)[0])
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        results.to_csv(os.path.join(folder, "settings.csv"), index=False)
+        curves.to_csv(os.path.join(folder, "replicas.csv"), index=False)
+        plot_whatif(df, results, curves, recorded, folder)
+        tables.append(results.assign(config=config, profile=Path(file).stem, serviceTime=service))
+
+        print("[*] {}/{}: {}: {} settings replayed in {:.2f}s".format(e + 1, len(files), file, len(grid), elapsed))
+        if recorded is not None and "replicas" in df:
+            mine = results[results["recorded"]].iloc[0]
+            print("    recorded: {:.0f} replica-seconds, {:.1%} failed; replay of {}: {:.0f} replica-seconds, {:.1%} failed".format(
+                replica_seconds(df), (df["statusCode"] != 200).mean(), recorded, mine["replicaSeconds"], mine["failureRate"]))
+
+    if tables:
+        Path(args.output).mkdir(parents=True, exist_ok=True)
+        summary = pd.concat(tables, ignore_index=True)
+        keys = ["config", "profile", "serviceTime"]
+        summary[keys + [c for c in summary.columns if c not in keys]].to_csv(os.path.join(args.output, "whatif.csv"), index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+# per-container lifecycle index: executions grouped by container, with busy intervals, idle gaps and overlaps
+import copy
+
+import numpy as np
+import pandas as pd
+
+from sketch import LogHistogram
+
+# longest a request is assumed to take from being sent until its row is written, clock skew included
+HORIZON = 300.0
+
+
+def jain_fairness(counts, axis=0):
+    """Jain's index of ``counts`` along ``axis``: 1 when all are equal, 1/n when one gets everything."""
+    counts = np.asarray(counts, dtype="float64")
+    n = np.sum(~np.isnan(counts), axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nansum(counts, axis=axis) ** 2 / (n * np.nansum(counts ** 2, axis=axis))
+
+
+class ContainerIndex:
+    """The successful executions of a run grouped by container and sorted by start.
+
+    Built once, from integer container codes so that every statistic is a
+    segmented numpy operation. Executions of container ``c`` are rows
+    ``offsets[c]:offsets[c + 1]``; times are seconds since the run's
+    first request and ``bucket`` is the request's time bucket.
+    """
+
+    def __init__(self, names, hosts, container, start, end, bucket):
+        order = np.lexsort((start, container))
+        self.names = np.asarray(names, dtype=object)
+        self.hosts = np.asarray(hosts, dtype=object)
+        self.container = np.asarray(container, dtype="int64")[order]
+        self.start = np.asarray(start, dtype="float64")[order]
+        self.end = np.asarray(end, dtype="float64")[order]
+        self.bucket = np.asarray(bucket, dtype="int64")[order]
+        self.offsets = np.searchsorted(self.container, np.arange(len(self.names) + 1))
+        self._busy = None
+
+    @classmethod
+    def from_executions(cls, container_ids, host_ids, start, end, bucket):
+        """Index of executions given as parallel arrays, container and host ids as recorded."""
+        codes, names = pd.factorize(np.asarray(container_ids, dtype=object))
+        hosts = pd.Series(np.asarray(host_ids, dtype=object)).groupby(codes).first().reindex(range(len(names)))
+        return cls(names, hosts.to_numpy(), codes, start, end, bucket)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _reach(self):
+        """Latest end of each execution and the ones before it in its container."""
+        return pd.Series(self.end).groupby(self.container).cummax().to_numpy()
+
+    def overlapping(self) -> np.ndarray:
+        """Executions that started while an earlier one of the same container was still running."""
+        reach = self._reach()
+        overlap = np.zeros(len(self.start), dtype=bool)
+        same = self.container[1:] == self.container[:-1]
+        overlap[1:] = same & (self.start[1:] <= reach[:-1])
+        return overlap
+
+    def busy_intervals(self) -> pd.DataFrame:
+        """Disjoint intervals in which each container was executing something."""
+        if self._busy is None:
+            overlap = self.overlapping()
+            at = np.flatnonzero(~overlap)
+            reach = self._reach()
+            self._busy = pd.DataFrame({
+                "container": self.container[at],
+                "start": self.start[at],
+                "end": np.maximum.reduceat(reach, at) if len(at) else reach,
+            })
+        return self._busy
+
+    def idle_gaps(self) -> pd.DataFrame:
+        """Time between consecutive busy intervals of each container."""
+        busy = self.busy_intervals()
+        c = busy["container"].to_numpy()
+        same = c[1:] == c[:-1]
+        return pd.DataFrame({
+            "container": c[1:][same],
+            "start": busy["end"].to_numpy()[:-1][same],
+            "gap": (busy["start"].to_numpy()[1:] - busy["end"].to_numpy()[:-1])[same],
+        })
+
+    def max_in_flight(self) -> np.ndarray:
+        """Highest number of simultaneous executions each container had."""
+        n = len(self.start)
+        container = np.concatenate([self.container, self.container])
+        times = np.concatenate([self.start, self.end])
+        # starts sort before ends at the same instant, like concurrency.peak_concurrency
+        kinds = np.concatenate([np.zeros(n), np.ones(n)])
+        order = np.lexsort((kinds, times, container))
+        level = np.cumsum(np.where(kinds[order] == 0, 1, -1))
+        peaks = np.zeros(len(self), dtype="int64")
+        if n:
+            # the sweep of each container starts from 0, every container ends back at 0
+            at = np.searchsorted(container[order], np.arange(len(self)))
+            present = np.diff(np.append(at, 2 * n)) > 0
+            peaks[present] = np.maximum.reduceat(level, at[present])
+        return peaks
+
+    def containers(self) -> pd.DataFrame:
+        """One row per container: its lifecycle and how busy it was."""
+        busy = self.busy_intervals()
+        gaps = self.idle_gaps()
+        per = np.arange(len(self))
+        first = np.full(len(self), np.nan)
+        last = np.full(len(self), np.nan)
+        counts = np.diff(self.offsets)
+        present = counts > 0
+        first[present] = self.start[self.offsets[:-1][present]]
+        last[present] = np.maximum.reduceat(self.end, self.offsets[:-1][present]) if present.any() else last[present]
+
+        busy_time = np.bincount(busy["container"], weights=busy["end"] - busy["start"], minlength=len(self))
+        work = np.bincount(self.container, weights=self.end - self.start, minlength=len(self))
+        gap = gaps.groupby("container")["gap"]
+        lifetime = last - first
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame({
+                "containerId": self.names,
+                "hostId": self.hosts,
+                "executions": counts,
+                "firstStart": first,
+                "lastEnd": last,
+                "lifetime": lifetime,
+                "busyTime": busy_time,
+                "busyFraction": np.where(lifetime > 0, busy_time / lifetime, 1.0),
+                # mean executions in flight while busy
+                "concurrency": work / busy_time,
+                "maxInFlight": self.max_in_flight(),
+                "overlapping": np.bincount(self.container, weights=self.overlapping(), minlength=len(self)).astype("int64"),
+                "idleGaps": gap.size().reindex(per, fill_value=0).to_numpy(),
+                "meanIdleGap": gap.mean().reindex(per).to_numpy(),
+                "maxIdleGap": gap.max().reindex(per).to_numpy(),
+            })
+
+    def gap_sketch(self) -> LogHistogram:
+        """The idle gaps of every container, as a sketch like the streamed index keeps."""
+        sketch = LogHistogram()
+        sketch.add(self.idle_gaps()["gap"].to_numpy())
+        return sketch
+
+    def heat(self, nbuckets) -> np.ndarray:
+        """Executions requested in each time bucket, one row per container."""
+        keep = self.bucket >= 0
+        flat = np.bincount(self.container[keep] * nbuckets + self.bucket[keep], minlength=len(self) * nbuckets)
+        return flat.reshape(len(self), nbuckets)
+
+    def busy_by_bucket(self, edges) -> np.ndarray:
+        """Seconds each container was busy within each [edges[i], edges[i + 1]), one row per container."""
+        edges = np.asarray(edges, dtype="float64")
+        busy = self.busy_intervals()
+        out = np.zeros((len(self), max(len(edges) - 1, 0)))
+        for c, iv in busy.groupby("container", sort=False):
+            s, e = iv["start"].to_numpy(), iv["end"].to_numpy()
+            done = np.concatenate([[0.0], np.cumsum(e - s)])
+            # busy time up to t: the intervals started before t, the last one clipped at t
+            j = np.searchsorted(s, edges, "right") - 1
+            upto = np.where(j >= 0, done[np.maximum(j, 0)] + np.clip(edges - s[np.maximum(j, 0)], 0, (e - s)[np.maximum(j, 0)]), 0.0)
+            out[c] = np.diff(upto)
+        return out
+
+    def alive(self, edges) -> np.ndarray:
+        return alive(self.containers(), edges)
+
+
+def alive(table, edges) -> np.ndarray:
+    """Whether each container had executed before the end and would execute after the start of each bucket."""
+    edges = np.asarray(edges, dtype="float64")
+    first = table["firstStart"].to_numpy()[:, None]
+    last = table["lastEnd"].to_numpy()[:, None]
+    return (first < edges[None, 1:]) & (last >= edges[None, :-1])
+
+
+class ContainerFold:
+    """The statistics of ContainerIndex, folded in as executions arrive instead of kept per execution.
+
+    Rows arrive in order of response, so an execution that starts more
+    than ``horizon`` seconds before the latest response seen is final:
+    every later row starts after it. Executions are held back until
+    then, and folded in order of start per container. Only the
+    executions still running at that point are carried over, for the
+    overlaps and in-flight counts of the next ones. Memory depends on
+    the containers, the buckets and the requests within ``horizon``,
+    not on the length of the run. Rows later than ``horizon`` are
+    folded as they come, so their busy time and gaps are approximate.
+    """
+
+    def __init__(self, interval, horizon=HORIZON):
+        self.interval = interval
+        self.horizon = horizon
+        self.watermark = -np.inf
+        self.codes = {}
+        self.names = np.zeros(0, dtype=object)
+        self.hosts = np.zeros(0, dtype=object)
+        for name, fill in [("count", 0), ("first", np.inf), ("last", -np.inf), ("work", 0.0), ("busy", 0.0),
+                           ("overlapping", 0), ("peak", 0), ("gaps", 0), ("gap_sum", 0.0), ("gap_max", np.nan),
+                           ("reach", -np.inf)]:
+            setattr(self, "_" + name, np.full(0, fill, dtype="int64" if isinstance(fill, int) else "float64"))
+        self._heat = np.zeros((0, 0), dtype="int64")
+        self._busy_buckets = np.zeros((0, 0))
+        self._gap_sketch = LogHistogram()
+        self._pending = [np.zeros(0, dtype="int64"), np.zeros(0), np.zeros(0), np.zeros(0, dtype="int64")]
+        self._open = [np.zeros(0, dtype="int64"), np.zeros(0)]
+
+    def __len__(self):
+        return len(self.names)
+
+    def _grow(self, containers, buckets=0):
+        extra = containers - len(self._count)
+        if extra > 0:
+            for name in ["count", "first", "last", "work", "busy", "overlapping", "peak", "gaps", "gap_sum", "gap_max", "reach"]:
+                a = getattr(self, "_" + name)
+                fill = {"first": np.inf, "last": -np.inf, "reach": -np.inf, "gap_max": np.nan}.get(name, 0)
+                setattr(self, "_" + name, np.concatenate([a, np.full(extra, fill, dtype=a.dtype)]))
+        for name in ["_heat", "_busy_buckets"]:
+            a = getattr(self, name)
+            rows, cols = max(containers, a.shape[0]), max(buckets, a.shape[1])
+            if (rows, cols) != a.shape:
+                grown = np.zeros((rows, cols), dtype=a.dtype)
+                grown[:a.shape[0], :a.shape[1]] = a
+                setattr(self, name, grown)
+
+    def add(self, container_ids, host_ids, start, end, bucket, seen):
+        """Executions as parallel arrays, and the latest response seen so far, in seconds since the start."""
+        local, names = pd.factorize(np.asarray(container_ids, dtype=object))
+        hosts = pd.Series(np.asarray(host_ids, dtype=object)).groupby(local).first().reindex(range(len(names))).to_numpy()
+        for name, host in zip(names, hosts):
+            if name not in self.codes:
+                self.codes[name] = len(self.codes)
+                self.names = np.append(self.names, np.array([name], dtype=object))
+                self.hosts = np.append(self.hosts, np.array([host], dtype=object))
+        code = np.array([self.codes[name] for name in names], dtype="int64")[local] if len(names) else np.zeros(0, dtype="int64")
+        parts = [code, np.asarray(start, dtype="float64"), np.asarray(end, dtype="float64"), np.asarray(bucket, dtype="int64")]
+        self._pending = [np.concatenate([p, q]) for p, q in zip(self._pending, parts)]
+        self._flush(max(self.watermark, seen - self.horizon))
+
+    def _flush(self, watermark):
+        ready = self._pending[1] < watermark
+        batch = [p[ready] for p in self._pending]
+        self._pending = [p[~ready] for p in self._pending]
+        self.watermark = watermark
+        self._fold(*batch)
+
+    def _fold(self, code, start, end, bucket):
+        self._grow(len(self.names), int(bucket.max()) + 1 if len(bucket) else 0)
+        if not len(code):
+            return
+        order = np.lexsort((start, code))
+        code, start, end, bucket = code[order], start[order], end[order], bucket[order]
+        n = len(self.names)
+
+        self._count += np.bincount(code, minlength=n)
+        np.minimum.at(self._first, code, start)
+        np.maximum.at(self._last, code, end)
+        self._work += np.bincount(code, weights=end - start, minlength=n)
+        keep = bucket >= 0
+        np.add.at(self._heat, (code[keep], bucket[keep]), 1)
+
+        # reach of the executions before each one: earlier ones of this batch, then the folded ones
+        first = np.ones(len(code), dtype=bool)
+        first[1:] = code[1:] != code[:-1]
+        before = np.empty(len(code))
+        before[1:] = pd.Series(end).groupby(code).cummax().to_numpy()[:-1]
+        before[first] = -np.inf
+        before = np.maximum(before, self._reach[code])
+        overlap = start <= before
+        self._overlapping += np.bincount(code, weights=overlap, minlength=n).astype("int64")
+
+        gap = ~overlap & np.isfinite(before)
+        gaps = start[gap] - before[gap]
+        self._gaps += np.bincount(code[gap], minlength=n)
+        self._gap_sum += np.bincount(code[gap], weights=gaps, minlength=n)
+        top = np.full(n, -np.inf)
+        np.maximum.at(top, code[gap], gaps)
+        self._gap_max = np.where(np.isfinite(top), np.fmax(self._gap_max, top), self._gap_max)
+        self._gap_sketch.add(gaps)
+
+        # busy intervals: a new one where an execution starts after everything before it ended;
+        # the first of a container may extend the interval folded before
+        at = np.flatnonzero(first | ~overlap)
+        busy_start = np.maximum(start[at], before[at])
+        busy_end = np.maximum(np.maximum.reduceat(end, at), busy_start)
+        self._busy += np.bincount(code[at], weights=busy_end - busy_start, minlength=n)
+        self._spread(code[at], busy_start, busy_end)
+        np.maximum.at(self._reach, code, end)
+
+        # in-flight sweep over the executions carried over, which all started before this batch, and the batch
+        carried, carried_end = self._open
+        codes = np.concatenate([carried, code, carried, code])
+        times = np.concatenate([np.full(len(carried), -np.inf), start, carried_end, end])
+        kinds = np.concatenate([np.zeros(len(carried) + len(code)), np.ones(len(carried) + len(code))])
+        order = np.lexsort((kinds, times, codes))
+        level = np.cumsum(np.where(kinds[order] == 0, 1, -1))
+        np.maximum.at(self._peak, codes[order], level)
+
+        running = np.concatenate([carried_end, end]) >= self.watermark
+        self._open = [np.concatenate([carried, code])[running], np.concatenate([carried_end, end])[running]]
+
+    def _spread(self, code, start, end):
+        """Add busy intervals to the busy seconds per container and bucket."""
+        width = self.interval
+        lo = np.maximum(np.floor(start / width), 0).astype("int64")
+        hi = np.floor(end / width).astype("int64")
+        keep = hi >= lo
+        code, start, end, lo, hi = code[keep], start[keep], end[keep], lo[keep], hi[keep]
+        spans = hi - lo + 1
+        if not len(spans):
+            return
+        k = np.repeat(lo - np.cumsum(spans) + spans, spans) + np.arange(spans.sum())
+        s, e = np.repeat(start, spans), np.repeat(end, spans)
+        piece = np.clip(np.minimum(e, (k + 1) * width) - np.maximum(s, k * width), 0, None)
+        self._grow(len(self.names), int(k.max()) + 1)
+        np.add.at(self._busy_buckets, (np.repeat(code, spans), k), piece)
+
+    def snapshot(self) -> "ContainerFold":
+        """A copy with every held-back execution folded in, for results while more rows may come."""
+        done = copy.deepcopy(self)
+        done._flush(np.inf)
+        return done
+
+    def containers(self) -> pd.DataFrame:
+        """One row per container, as ContainerIndex.containers."""
+        lifetime = self._last - self._first
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame({
+                "containerId": self.names,
+                "hostId": self.hosts,
+                "executions": self._count,
+                "firstStart": self._first,
+                "lastEnd": self._last,
+                "lifetime": lifetime,
+                "busyTime": self._busy,
+                "busyFraction": np.where(lifetime > 0, self._busy / lifetime, 1.0),
+                "concurrency": self._work / self._busy,
+                "maxInFlight": self._peak,
+                "overlapping": self._overlapping,
+                "idleGaps": self._gaps,
+                "meanIdleGap": np.where(self._gaps > 0, self._gap_sum / self._gaps, np.nan),
+                "maxIdleGap": self._gap_max,
+            })
+
+    def gap_sketch(self) -> LogHistogram:
+        return self._gap_sketch
+
+    def heat(self, nbuckets) -> np.ndarray:
+        out = np.zeros((len(self), nbuckets), dtype="int64")
+        cols = min(nbuckets, self._heat.shape[1])
+        out[:, :cols] = self._heat[:len(self), :cols]
+        return out
+
+    def busy_by_bucket(self, edges) -> np.ndarray:
+        """Busy seconds per container within buckets of ``interval`` seconds from 0, the grid ``edges`` must be."""
+        out = np.zeros((len(self), max(len(edges) - 1, 0)))
+        cols = min(out.shape[1], self._busy_buckets.shape[1])
+        out[:, :cols] = self._busy_buckets[:len(self), :cols]
+        return out
+
+    def alive(self, edges) -> np.ndarray:
+        return alive(self.containers(), edges)
+
+
+def idle_before_scale_down(table, times, replicas) -> np.ndarray:
+    """Seconds each container sat idle after its last execution until a replica decrease removed it.
+
+    Decreases are matched in order to the containers that had been idle
+    the longest before them; containers never matched were still running
+    when the run ended, or went away unobserved, and get NaN.
+    """
+    times = np.asarray(times, dtype="float64")
+    replicas = np.asarray(replicas, dtype="float64")
+    step = np.diff(replicas, prepend=np.nan)
+    down = step < 0
+    decreases = np.repeat(times[down], (-step[down]).astype("int64"))
+
+    last = table["lastEnd"].to_numpy()
+    order = np.argsort(last, kind="mergesort")
+    idle = np.full(len(last), np.nan)
+    pending = 0
+    for t in decreases:
+        if pending < len(order) and last[order[pending]] <= t:
+            idle[order[pending]] = t - last[order[pending]]
+            pending += 1
+    return idle
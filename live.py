@@ -0,0 +1,205 @@
+# live analysis of a result CSV while the load generator is still appending to it
+import io
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregate import elapsed_seconds
+from plot import CHARTS, StreamBucket, add_output_arguments, chart_output, render_charts
+
+INTERVAL = 10
+# seconds between chart refreshes, between polls of the file, and of recent responses the status line covers
+REFRESH = 15.0
+POLL = 1.0
+WINDOW = 30.0
+# the first rows are held back until their responses span this many seconds past their earliest request,
+# so that requests sent earlier but answered later are in when the buckets are laid out
+HOLD = 10.0
+# bytes read per poll at most, so catching up on a long file stays in bounded memory
+READ_BYTES = 64 << 20
+# charts refreshed during the run; all of them are rendered once it ends
+LIVE_CHARTS = ["plot_latency_percentiles", "plot_status_graphs", "plot_replicas", "plot_fn_invocation_rate"]
+STATUS_COLUMNS = ["responseTime", "statusCode", "requestResponseLatency", "replicas"]
+
+
+class Tail:
+    """Follows a CSV by byte offset, returning only complete rows appended since the last read."""
+
+    def __init__(self, path, read_bytes=READ_BYTES):
+        self.path = path
+        self.read_bytes = read_bytes
+        self.offset = 0
+        self.header = None
+
+    def read(self, final=False):
+        """New complete rows, or None if there are none yet; ``final`` also takes a last row without a newline."""
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    raise RuntimeError("{} was truncated, start over on a new run".format(self.path))
+                f.seek(self.offset)
+                data = f.read(self.read_bytes)
+        except FileNotFoundError:
+            return None
+
+        # a row still being written is left for the next read
+        end = len(data) if final else data.rfind(b"\n") + 1
+        if not end:
+            return None
+        data = data[:end]
+        self.offset += end
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        if self.header is None:
+            first = data.index(b"\n") + 1
+            self.header, data = data[:first], data[first:]
+        if not data.strip():
+            return None
+        return pd.read_csv(io.BytesIO(self.header + data), low_memory=False)
+
+
+class Live:
+    """Per-bucket aggregates of a growing run, updated with each batch of new rows only."""
+
+    def __init__(self, file, folder, interval=INTERVAL, window=WINDOW, output=None, hold=HOLD):
+        self.tail = Tail(file)
+        self.folder = folder
+        self.interval = interval
+        self.window = window
+        self.output = output
+        self.hold = hold
+        self.held = []
+        self.buck = None
+        self.recent = pd.DataFrame(columns=STATUS_COLUMNS)
+        self.rows = 0
+        self.failed = 0
+        self.early = 0
+
+    def poll(self, final=False) -> int:
+        """Aggregate the rows appended since the last poll, returning how many there were."""
+        chunk = self.tail.read(final)
+        if self.buck is None:
+            if chunk is not None:
+                self.held.append(chunk)
+            if not self.held:
+                return 0
+            held = pd.concat(self.held, ignore_index=True)
+            # responses arrive out of order: the buckets start at the first request once no earlier one is likely to come
+            if not final and held["responseTime"].max() - held["requestTime"].min() < self.hold:
+                return len(chunk) if chunk is not None else 0
+            self.held, chunk = [], held
+            self.buck = StreamBucket(0, self.interval, self.interval)
+            self.buck.begin(list(chunk.columns), chunk["requestTime"].min())
+            if self.output is not None:
+                self.buck.output = self.output
+        elif chunk is None:
+            return 0
+        # a request sent before the first bucket is left out of them
+        self.early += int((chunk["requestTime"] < self.buck.request_start_time).sum())
+
+        ends = [chunk["requestTime"].max()]
+        if "executionEndTime" in chunk:
+            ends.append(chunk["executionEndTime"].max())
+        self.buck.grow(elapsed_seconds([np.nanmax(ends)], self.buck.request_start_time)[0])
+        self.buck.add_chunk(chunk)
+
+        self.rows += len(chunk)
+        self.failed += int((chunk["statusCode"] != 200).sum())
+        recent = chunk.reindex(columns=STATUS_COLUMNS)
+        self.recent = pd.concat([self.recent, recent]) if len(self.recent) else recent
+        self.recent = self.recent[self.recent["responseTime"] >= self.recent["responseTime"].max() - self.window]
+        return len(chunk)
+
+    def status(self) -> str:
+        """One line: responses per second, failures and p95 latency over the last window, and replicas."""
+        recent = self.recent
+        latest = recent["responseTime"].max()
+        span = min(self.window, latest - self.buck.request_start_time) or self.window
+        ok = recent["statusCode"] == 200
+        p95 = recent.loc[ok, "requestResponseLatency"].quantile(0.95)
+        replicas = recent["replicas"].dropna()
+        return "+{:d}:{:02d}  rows {}  rps {:.1f}  failed {:.1%} (total {:.1%})  p95 {}  replicas {}".format(
+            *divmod(int(latest - self.buck.request_start_time), 60),
+            self.rows,
+            len(recent) / span,
+            1 - ok.mean() if len(recent) else 0.0,
+            self.failed / self.rows,
+            "{:.2f}s".format(p95) if p95 == p95 else "-",
+            int(replicas.iloc[-1]) if len(replicas) else "-",
+        )
+
+    def refresh(self, charts=LIVE_CHARTS):
+        Path(self.folder).mkdir(parents=True, exist_ok=True)
+        titles = dict(CHARTS)
+        # the charts' progress lines would bury the status line
+        with redirect_stdout(io.StringIO()):
+            self.buck.prepare(containers=False)
+            for method in charts:
+                getattr(self.buck, method)(self.folder, titles[method])
+
+    def finish(self, jobs=1):
+        """Every chart, the summary and the container table, as plot.py writes them."""
+        Path(self.folder).mkdir(parents=True, exist_ok=True)
+        self.buck.write_summary(self.folder)
+        render_charts(self.buck, self.folder, jobs=jobs)
+        self.buck.write_container_table(self.folder)
+
+
+def follow(live, refresh=REFRESH, poll=POLL, idle=None, jobs=1):
+    """Poll the file and refresh until it has been idle for ``idle`` seconds, or until interrupted."""
+    line_end = "\r" if sys.stdout.isatty() else "\n"
+    last_data = last_refresh = time.time()
+    pending = False
+    try:
+        while True:
+            new = live.poll()
+            now = time.time()
+            if new:
+                last_data, pending = now, True
+            if pending and live.buck is not None and now - last_refresh >= refresh:
+                live.refresh()
+                print("[*] " + live.status(), end=line_end, flush=True)
+                last_refresh, pending = now, False
+            if idle is not None and (live.buck is not None or live.held) and now - last_data > idle:
+                break
+            if not new:
+                time.sleep(poll)
+    except KeyboardInterrupt:
+        pass
+    # the writer is done, so a last row without a newline is complete
+    while live.poll(final=True):
+        pass
+    print()
+    if live.buck is None:
+        print("[!] {}: no rows to analyse".format(live.tail.path))
+        return
+    print("[*] " + live.status())
+    if live.early:
+        print("[!] {} requests sent before the first bucket were left out, try a longer --hold".format(live.early))
+    live.finish(jobs)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("file", help="result CSV being written, e.g. by metrics.js")
+    parser.add_argument("dirpath", help="directory to write the plots to")
+    parser.add_argument("--refresh", type=float, default=REFRESH, help="seconds between chart refreshes")
+    parser.add_argument("--window", type=float, default=WINDOW, help="seconds of recent responses the status line covers")
+    parser.add_argument("--hold", type=float, default=HOLD, help="seconds of responses to wait for before laying out the buckets")
+    parser.add_argument("--idle", type=float, help="stop once the file has not grown for this many seconds (default: run until interrupted)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="processes rendering the final charts concurrently")
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    live = Live(args.file, args.dirpath, window=args.window, output=chart_output(args), hold=args.hold)
+    follow(live, refresh=args.refresh, idle=args.idle, jobs=args.jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,17 +15,23 @@ module.exports = {
 const kubeContext = process.env.KUBE_CONTEXT;
 const promServer = process.env.PROM_SERVER;
 const outputDir = process.env.OUTPUT_DIR;
+// with ENRICH_LATER=1 only request facts are recorded; cluster metrics are
+// joined on after the run by enrich.py from Prometheus range queries
+const enrichLater = process.env.ENRICH_LATER === "1";
 
 const csvStream = csv.format({headers: true});
 let writableStream = fs.createWriteStream(`${outputDir}/result-${Date.now()}.csv`, {flags: 'a'});
 csvStream.pipe(writableStream);
 
-const kc = new k8s.KubeConfig();
-kc.loadFromDefault();
-kc.setCurrentContext(kubeContext);
 const opts = {};
-kc.applyToRequest(opts);
-const kubeServer = kc.getCurrentCluster().server;
+let kubeServer;
+if (!enrichLater) {
+    const kc = new k8s.KubeConfig();
+    kc.loadFromDefault();
+    kc.setCurrentContext(kubeContext);
+    kc.applyToRequest(opts);
+    kubeServer = kc.getCurrentCluster().server;
+}
 
 
 function beforeRequest(requestParams, context, ee, next) {
@@ -47,32 +53,34 @@ async function afterResponse(requestParams, response, context, ee, next) {
     metrics.responseTime = Date.now() / 1000
     metrics.requestId = context.requestId
 
-    try {
-        let promResponse = await axios.get(
-            `${promServer}/api/v1/query`, {
-                params: {
-                    query: 'count(count by (kubernetes_pod_name) (up))'
+    if (!enrichLater) {
+        try {
+            let promResponse = await axios.get(
+                `${promServer}/api/v1/query`, {
+                    params: {
+                        query: 'count(count by (kubernetes_pod_name) (up))'
+                    }
                 }
-            }
-        );
-        metrics.replicas = promResponse.data.data.result[0].value[1];
-    } catch (err) {
-    }
+            );
+            metrics.replicas = promResponse.data.data.result[0].value[1];
+        } catch (err) {
+        }
 
-    try {
-        let nodeMetrics = JSON.parse(await request.get(`${kubeServer}/apis/metrics.k8s.io/v1beta1/nodes`, opts))
-        for (const item of nodeMetrics.items) {
-            metrics[`${item.metadata.name}CpuUsage`] = item.usage.cpu;
-            metrics[`${item.metadata.name}MemoryUsage`] = item.usage.memory;
+        try {
+            let nodeMetrics = JSON.parse(await request.get(`${kubeServer}/apis/metrics.k8s.io/v1beta1/nodes`, opts))
+            for (const item of nodeMetrics.items) {
+                metrics[`${item.metadata.name}CpuUsage`] = item.usage.cpu;
+                metrics[`${item.metadata.name}MemoryUsage`] = item.usage.memory;
+            }
+        } catch (err) {
         }
-    } catch (err) {
-    }
 
-    try {
-        let invocationMetrics = JSON.parse(await request.get(`${kubeServer}/apis/external.metrics.k8s.io/v1beta1/namespaces/openfaas-fn/gateway_function_invocation_per_second`, opts))
-        metrics.functionInvocationRate = invocationMetrics.items[0].value;
-    } catch (err) {
-        metrics.functionInvocationRate = null;
+        try {
+            let invocationMetrics = JSON.parse(await request.get(`${kubeServer}/apis/external.metrics.k8s.io/v1beta1/namespaces/openfaas-fn/gateway_function_invocation_per_second`, opts))
+            metrics.functionInvocationRate = invocationMetrics.items[0].value;
+        } catch (err) {
+            metrics.functionInvocationRate = null;
+        }
     }
 
     if (response.statusCode < 300) {
@@ -0,0 +1,376 @@
+# open-loop asyncio load generator for the load-generator/*.yml profiles, writing metrics.js-style CSVs
+import asyncio
+import json
+import os
+import time
+import uuid
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from profiles import arrival_times, load_phases, load_profile
+
+REPLICAS_QUERY = "count(count by (kubernetes_pod_name) (up))"
+NODE_METRICS_PATH = "/apis/metrics.k8s.io/v1beta1/nodes"
+INVOCATION_RATE_PATH = "/apis/external.metrics.k8s.io/v1beta1/namespaces/openfaas-fn/gateway_function_invocation_per_second"
+# connections per worker; the test300s peaks keep about 600 requests in flight
+CONNECTIONS = 1000
+# p99 milliseconds spent waiting for a connection before the run is reported as held back by -c
+QUEUE_WARNING = 10.0
+
+# metrics.js column order, with the function's own metrics in front
+COLUMNS = ["statusCode", "requestResponseLatency", "requestTime", "responseTime", "requestId", "replicas"]
+
+
+def scenario_request(profile) -> dict:
+    """Method, url and body of the first step of the profile's first scenario."""
+    step = profile["scenarios"][0]["flow"][0]
+    method = next(m for m in ("get", "post", "put", "delete") if m in step)
+    spec = step[method]
+    body = spec.get("json", spec.get("body"))
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    return {"method": method.upper(), "url": spec["url"], "body": body}
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one host, at most ``size`` at a time."""
+
+    def __init__(self, target, size):
+        parts = urlsplit(target)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def request(self, method, path, body=None, on_sent=None):
+        """Status and body of one request; ``on_sent`` is called as it is written to a connection."""
+        async with self.slots:
+            reader, writer = self.idle.pop() if self.idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                status, headers, payload = await self.exchange(reader, writer, method, path, body, on_sent)
+            except BaseException:
+                writer.close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self.idle.append((reader, writer))
+            return status, payload
+
+    async def exchange(self, reader, writer, method, path, body, on_sent=None):
+        data = body.encode() if body else b""
+        head = "{} {} HTTP/1.1\r\nHost: {}:{}\r\nContent-Length: {}\r\n\r\n".format(method, path, self.host, self.port, len(data))
+        # the write only buffers, so the moment before it is when the request leaves
+        if on_sent:
+            on_sent()
+        writer.write(head.encode() + data)
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            payload = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                payload += await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            payload = await reader.readexactly(int(headers["content-length"]))
+        else:
+            payload = await reader.read()
+            headers["connection"] = "close"
+        return status, headers, payload
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+async def fire(pool, request, scheduled, timeout, rows, jitter):
+    queued = time.time()
+    row = {"requestId": str(uuid.uuid4()), "scheduledTime": scheduled}
+    start = None
+
+    def sent():
+        # timed from the write, after any wait for a free connection
+        nonlocal start
+        start = time.perf_counter()
+        row["requestTime"] = time.time()
+
+    try:
+        status, payload = await asyncio.wait_for(pool.request(request["method"], request["url"], request["body"], sent), timeout)
+        row["statusCode"] = status
+        if status < 300:
+            try:
+                row.update(json.loads(payload)["metrics"])
+            except (ValueError, KeyError, TypeError):
+                pass
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+        row["error"] = type(e).__name__
+    row["responseTime"] = time.time()
+    # a request that never got a connection counts as sent when it gave up
+    row.setdefault("requestTime", row["responseTime"])
+    row["queueLatency"] = row["requestTime"] - queued
+    row["requestResponseLatency"] = time.perf_counter() - start if start is not None else np.nan
+    jitter.append(row["requestTime"] - scheduled)
+    rows.append(row)
+
+
+async def generate(target, request, offsets, start, timeout=120, connections=CONNECTIONS):
+    """Send one request at each of ``offsets`` seconds after the wall-clock ``start``.
+
+    Requests are started on schedule whether or not earlier ones have been
+    answered; ``jitter`` is how late each one was actually written to a
+    connection, including any wait for one to come free.
+    """
+    pool = ConnectionPool(target, connections)
+    rows, jitter, tasks = [], [], set()
+    loop = asyncio.get_running_loop()
+    origin = loop.time() + (start - time.time())
+
+    for offset in offsets:
+        delay = origin + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(fire(pool, request, start + offset, timeout, rows, jitter))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    pool.close()
+    return rows, jitter
+
+
+def run_shard(target, request, offsets, start, timeout, connections):
+    return asyncio.run(generate(target, request, offsets, start, timeout, connections))
+
+
+async def kubectl_raw(context, path):
+    proc = await asyncio.create_subprocess_exec(
+        "kubectl", "--context", context, "get", "--raw", path,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    out, _ = await proc.communicate()
+    return json.loads(out) if proc.returncode == 0 else None
+
+
+async def cluster_snapshot(prometheus, context):
+    """The cluster metrics metrics.js records next to every response, as raw quantity strings."""
+    snapshot = {"time": time.time()}
+    if prometheus:
+        pool = ConnectionPool(prometheus, 1)
+        try:
+            _, payload = await pool.request("GET", "/api/v1/query?query=" + REPLICAS_QUERY.replace(" ", "%20"))
+            snapshot["replicas"] = json.loads(payload)["data"]["result"][0]["value"][1]
+        except (OSError, ValueError, KeyError, IndexError):
+            pass
+        pool.close()
+    if context:
+        nodes = await kubectl_raw(context, NODE_METRICS_PATH)
+        for item in (nodes or {}).get("items", []):
+            snapshot[item["metadata"]["name"] + "CpuUsage"] = item["usage"]["cpu"]
+            snapshot[item["metadata"]["name"] + "MemoryUsage"] = item["usage"]["memory"]
+        rate = await kubectl_raw(context, INVOCATION_RATE_PATH)
+        snapshot["functionInvocationRate"] = rate["items"][0]["value"] if rate and rate.get("items") else None
+    return snapshot
+
+
+async def poll_cluster(prometheus, context, interval, snapshots):
+    while True:
+        snapshots.append(await cluster_snapshot(prometheus, context))
+        await asyncio.sleep(interval)
+
+
+async def run(target, request, offsets, workers=1, timeout=120, connections=CONNECTIONS, prometheus=None, context=None, interval=5.0):
+    """Run the schedule, sharded round-robin over ``workers`` processes, polling cluster metrics meanwhile."""
+    start = time.time() + (1.0 if workers > 1 else 0.1)
+    snapshots = []
+    poller = asyncio.create_task(poll_cluster(prometheus, context, interval, snapshots)) if prometheus or context else None
+
+    if workers <= 1:
+        results = [await generate(target, request, offsets, start, timeout, connections)]
+    else:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(workers) as executor:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, run_shard, target, request, offsets[i::workers], start, timeout, connections)
+                for i in range(workers)
+            ))
+    if poller:
+        poller.cancel()
+
+    rows = [row for shard, _ in results for row in shard]
+    jitter = np.concatenate([np.asarray(j, dtype="float64") for _, j in results])
+    return result_frame(rows, snapshots), jitter
+
+
+def result_frame(rows, snapshots) -> pd.DataFrame:
+    """Rows in the metrics.js layout, each with the last cluster snapshot taken before its response."""
+    df = pd.DataFrame(rows).sort_values("responseTime", kind="mergesort").reset_index(drop=True)
+    if snapshots:
+        cluster = pd.DataFrame(snapshots).sort_values("time")
+        df = pd.merge_asof(df, cluster, left_on="responseTime", right_on="time", direction="backward").drop(columns="time")
+    if "executionStartTime" in df:
+        df["schedulingLatency"] = df["executionStartTime"] - df["requestTime"]
+
+    for col in ["statusCode", "replicas"]:
+        if col not in df:
+            df[col] = np.nan
+    node = [c for c in df.columns if c.endswith(("CpuUsage", "MemoryUsage"))]
+    tail = node + [c for c in ["functionInvocationRate", "schedulingLatency"] if c in df]
+    extra = [c for c in ["scheduledTime", "queueLatency", "error"] if c in df]
+    front = [c for c in df.columns if c not in COLUMNS + tail + extra]
+    return df[front + COLUMNS + tail + extra]
+
+
+def report(df, jitter, elapsed):
+    ms = jitter * 1000
+    failed = int((df["statusCode"] != 200).sum())
+    print("[*] {} requests in {:.1f}s ({:.1f} req/s), {} failed".format(len(df), elapsed, len(df) / elapsed, failed))
+    if len(ms):
+        print("[*] send jitter: p50 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms".format(*np.percentile(ms, [50, 99]), ms.max()))
+    queued = df["queueLatency"].to_numpy(dtype="float64") * 1000 if "queueLatency" in df else np.zeros(0)
+    # opening a connection counts as queueing too, so only a backlog is worth a warning
+    if len(queued) and np.percentile(queued, 99) > QUEUE_WARNING:
+        print("[!] waited for a free connection: p99 {:.2f}ms, max {:.2f}ms, raise -c".format(np.percentile(queued, 99), queued.max()))
+
+
+def find_max_rate(target, request, workers, connections, start_rate=100.0, step=5.0, max_jitter=10.0, timeout=10):
+    """Double a steady rate until sending falls behind or requests fail; return the last rate that held.
+
+    Sending falls behind both when the event loop is late and when
+    requests wait for one of the ``connections`` to come free.
+    """
+    rate, sustained = start_rate, None
+    while True:
+        offsets = arrival_times([{"start": 0.0, "end": step, "duration": step, "from_rate": rate, "to_rate": rate}])
+        started = time.perf_counter()
+        df, jitter = asyncio.run(run(target, request, offsets, workers, timeout, connections))
+        elapsed = time.perf_counter() - started
+        p99 = np.percentile(jitter, 99) * 1000
+        queued = np.percentile(df["queueLatency"], 99) * 1000
+        ok = (df["statusCode"] == 200).mean()
+        print("[*] {:.0f} req/s: p99 jitter {:.2f}ms (queued {:.2f}ms), {:.1%} ok, {:.1f}s".format(rate, p99, queued, ok, elapsed))
+        if p99 > max_jitter or ok < 0.99:
+            return sustained
+        sustained = rate
+        rate *= 2
+
+
+async def stand_in(port, latency):
+    """A stand-in gateway answering every request with a function-like metrics payload after ``latency`` seconds."""
+    container = str(uuid.uuid4())
+
+    async def serve(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = header.decode().partition(":")
+                    if key.strip().lower() == "content-length":
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+
+                start = time.time()
+                if latency:
+                    await asyncio.sleep(latency)
+                end = time.time()
+                body = json.dumps({"metrics": {
+                    "executionStartTime": start,
+                    "executionEndTime": end,
+                    "executionLatency": end - start,
+                    "containerId": container,
+                    "hostId": "0",
+                }}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", port)
+    print("[*] stand-in gateway listening on http://127.0.0.1:{}".format(port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run a load-generator/*.yml profile")
+    run_parser.add_argument("profile")
+    run_parser.add_argument("-t", "--target", help="gateway URL, like artillery's -t (default: config.target)")
+    run_parser.add_argument("-o", "--output", default=os.environ.get("OUTPUT_DIR", "."), help="directory for result-<ms>.csv")
+    run_parser.add_argument("--poisson", action="store_true", help="Poisson instead of evenly spaced arrivals")
+    run_parser.add_argument("--seed", type=int)
+    run_parser.add_argument("-w", "--workers", type=int, default=1, help="processes to shard the schedule over")
+    run_parser.add_argument("-c", "--connections", type=int, default=CONNECTIONS, help="connection pool size per worker")
+    run_parser.add_argument("--prometheus", default=os.environ.get("PROM_SERVER"), help="Prometheus URL for the replicas metric")
+    run_parser.add_argument("--kube-context", default=os.environ.get("KUBE_CONTEXT"), help="kubectl context for node and HPA metrics")
+    run_parser.add_argument("--metrics-interval", type=float, default=5.0, help="seconds between cluster metric snapshots")
+
+    rate_parser = subparsers.add_parser("max-rate", help="find the highest steady rate sent on schedule")
+    rate_parser.add_argument("-t", "--target", required=True)
+    rate_parser.add_argument("--url", default="/function/primality")
+    rate_parser.add_argument("-w", "--workers", type=int, default=1)
+    rate_parser.add_argument("-c", "--connections", type=int, default=CONNECTIONS)
+    rate_parser.add_argument("--max-jitter", type=float, default=10.0, help="p99 send jitter in ms still counted as on schedule")
+
+    stand_in_parser = subparsers.add_parser("stand-in", help="serve a local stand-in gateway to test against")
+    stand_in_parser.add_argument("--port", type=int, default=8080)
+    stand_in_parser.add_argument("--latency", type=float, default=0.0, help="seconds every request takes")
+    args = parser.parse_args()
+
+    if args.command == "stand-in":
+        asyncio.run(stand_in(args.port, args.latency))
+        return
+    if args.command == "max-rate":
+        request = {"method": "GET", "url": args.url, "body": None}
+        rate = find_max_rate(args.target, request, args.workers, args.connections, max_jitter=args.max_jitter)
+        print("[*] sustained max rate: {}".format("below the start rate" if rate is None else "{:.0f} req/s".format(rate)))
+        return
+
+    profile = load_profile(args.profile)
+    target = args.target or profile["config"].get("target")
+    timeout = profile["config"].get("http", {}).get("timeout", 120)
+    offsets = arrival_times(load_phases(args.profile), args.poisson, np.random.default_rng(args.seed))
+
+    started = time.perf_counter()
+    df, jitter = asyncio.run(run(
+        target, scenario_request(profile), offsets, args.workers, timeout, args.connections,
+        args.prometheus, args.kube_context, args.metrics_interval,
+    ))
+    report(df, jitter, time.perf_counter() - started)
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(args.output, "result-{}.csv".format(int(time.time() * 1000)))
+    df.to_csv(path, index=False)
+    print("[*] wrote {}".format(path))
+
+
+if __name__ == "__main__":
+    main()
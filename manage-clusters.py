@@ -1,9 +1,16 @@
+import asyncio
+import csv
 import logging
+import os
 import subprocess
+import sys
+import tempfile
 import time
+from abc import ABC, abstractmethod
 from argparse import ArgumentParser
+from io import StringIO
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence
 
 import coloredlogs
 from ruamel.yaml import YAML
@@ -12,114 +19,517 @@ logger = logging.getLogger()
 coloredlogs.install(level="DEBUG", logger=logger)
 yaml = YAML()
 
+COMMAND_TIMEOUT = 30 * 60
+READY_TIMEOUT = 10 * 60
+KUBECONFIG_DIR = "~/.kube"
+
 
 def run_command(
     command: str,
     capture_output: bool = False,
     success_condition: Optional[Callable[[str], bool]] = None,
+    timeout: float = READY_TIMEOUT,
 ) -> Optional[str]:
     logger.debug(f"Executing: {command}")
     if success_condition:
+        deadline = time.monotonic() + timeout
+        delay = 1.0
         while True:
             cp = subprocess.run(command, shell=True, capture_output=True)
             if success_condition(cp.stdout.decode("UTF-8")):
                 break
-            time.sleep(10)
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"{command!r} did not succeed within {timeout:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
     else:
         cp = subprocess.run(command, shell=True, capture_output=capture_output)
     if capture_output:
         return cp.stdout.decode("UTF-8")
 
 
-def create_cluster(
-    size: str, count: int, min_replicas: int, max_replicas: int, target_fips: float
-) -> None:
-    logger.info(f"Creating cluster with {count} {size} nodes")
+class CommandFailed(Exception):
+    def __init__(self, command: str, returncode: Optional[int], stderr: str = ""):
+        reason = "timed out" if returncode is None else f"exited with {returncode}"
+        super().__init__(f"{command!r} {reason}" + (f": {stderr.strip()}" if stderr.strip() else ""))
+        self.command = command
+        self.returncode = returncode
+
+
+class Backend(ABC):
+    """Where provisioning commands run and how time passes for them.
+
+    Steps only talk to a backend, so the same dependency graph drives
+    real clusters (``ShellBackend``) and simulated ones (``FakeBackend``).
+    """
+
+    @abstractmethod
+    async def run(
+        self,
+        command: str,
+        env: Optional[Dict[str, str]] = None,
+        stdin: Optional[str] = None,
+        timeout: float = COMMAND_TIMEOUT,
+    ) -> str:
+        """Stdout of ``command``; raises CommandFailed on a non-zero exit or timeout."""
+
+    def time(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class ShellBackend(Backend):
+    async def run(self, command, env=None, stdin=None, timeout=COMMAND_TIMEOUT):
+        logger.debug(f"Executing: {command}")
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={**os.environ, **env} if env else None,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(stdin.encode() if stdin is not None else None), timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise CommandFailed(command, None)
+        if process.returncode:
+            raise CommandFailed(command, process.returncode, stderr.decode("UTF-8"))
+        return stdout.decode("UTF-8")
+
+
+class FakeBackend(Backend):
+    """Pretends to provision, offline: commands take typical DigitalOcean times, ``speed`` times faster.
+
+    LoadBalancer services stay pending for ``pending`` seconds after they
+    are first asked for, and any command containing one of ``failures``
+    fails, to exercise the orchestration's timing and error handling.
+    """
+
+    LATENCIES = [
+        ("cluster create", 300),
+        ("arkade install openfaas", 60),
+        ("arkade install metrics-server", 20),
+        ("helm repo update", 10),
+        ("helm install", 25),
+        ("faas-cli deploy", 10),
+        ("", 1),
+    ]
+
+    def __init__(self, speed: float = 1.0, pending: float = 90, failures: Sequence[str] = ()):
+        self.speed = speed
+        self.pending = pending
+        self.failures = list(failures)
+        self.asked = {}
+        self.nodes = {}
+
+    def time(self) -> float:
+        return time.monotonic() * self.speed
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed)
+
+    async def run(self, command, env=None, stdin=None, timeout=COMMAND_TIMEOUT):
+        logger.debug(f"Faking: {command}")
+        latency = next(seconds for pattern, seconds in self.LATENCIES if pattern in command)
+        if latency > timeout:
+            await self.sleep(timeout)
+            raise CommandFailed(command, None)
+        await self.sleep(latency)
+        if any(failure in command for failure in self.failures):
+            raise CommandFailed(command, 1, "injected failure")
+
+        if "cluster create" in command:
+            self.nodes[command.split()[-1]] = int(command.split()[command.split().index("--count") + 1])
+        if "get nodes" in command:
+            # kubeconfigs are named after the cluster's context, do-blr1-<name>
+            name = Path((env or {}).get("KUBECONFIG", "")).stem[len("do-blr1-"):]
+            return "".join(f"node-{i}   Ready   <none>   1m   v1.21.2\n" for i in range(self.nodes.get(name, 0)))
+        if "--format ID" in command:
+            return f"fake-{command.split()[3]}\n"
+        if "kubeconfig show" in command:
+            return f"apiVersion: v1\nkind: Config\ncurrent-context: {command.split()[-1]}\n"
+        if "basic-auth-password" in command:
+            return "fake-password\n"
+        if "get service" in command:
+            # pending until a while after the first look, per cluster and service
+            key = ((env or {}).get("KUBECONFIG"), command)
+            first = self.asked.setdefault(key, self.time())
+            ip = "<pending>" if self.time() - first < self.pending else "203.0.113.10"
+            return f"service   LoadBalancer   10.245.0.10   {ip}   8080:31112/TCP   1m\n"
+        return ""
+
+
+class StepTimeout(Exception):
+    pass
+
+
+async def wait_until(
+    backend: Backend,
+    command: str,
+    condition: Callable[[str], bool],
+    env: Optional[Dict[str, str]] = None,
+    timeout: float = READY_TIMEOUT,
+    initial: float = 1.0,
+    factor: float = 2.0,
+    max_delay: float = 30.0,
+) -> str:
+    """Output of ``command`` once it satisfies ``condition``, polling with exponential backoff."""
+    deadline = backend.time() + timeout
+    delay = initial
+    while True:
+        try:
+            output = await backend.run(command, env=env, timeout=max(deadline - backend.time(), 1.0))
+            if condition(output):
+                return output
+        except CommandFailed as err:
+            # the API server may not answer yet, which is what we are waiting for
+            logger.debug(f"Not ready: {err}")
+        remaining = deadline - backend.time()
+        if remaining <= 0:
+            raise StepTimeout(f"{command!r} not ready after {timeout:.0f}s")
+        await backend.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_delay)
+
+
+class Step(NamedTuple):
+    name: str
+    needs: Sequence[str]
+    action: Callable[[], Awaitable[None]]
+
+
+class ProvisioningFailed(Exception):
+    def __init__(self, cluster: str, step: str, error: BaseException, timings: List[Dict]):
+        super().__init__(f"{cluster}: step {step} failed: {error}")
+        self.cluster = cluster
+        self.step = step
+        self.timings = timings
+
+
+async def run_steps(cluster: str, steps: Sequence[Step], backend: Backend) -> List[Dict]:
+    """Run every step once all it needs is done, as many at a time as the graph allows.
+
+    Returns one timing row per step. The first failure cancels the steps
+    still running or waiting and raises ProvisioningFailed.
+    """
+    started = backend.time()
+    timings = {s.name: {"cluster": cluster, "step": s.name, "status": "waiting"} for s in steps}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_step(step: Step):
+        await asyncio.gather(*(tasks[name] for name in step.needs))
+        timing = timings[step.name]
+        timing.update(status="running", start=backend.time() - started)
+        try:
+            await step.action()
+        finally:
+            timing["end"] = backend.time() - started
+            timing["seconds"] = timing["end"] - timing["start"]
+        timing["status"] = "done"
+
+    for step in steps:
+        unknown = [name for name in step.needs if name not in tasks]
+        if unknown:
+            raise ValueError(f"step {step.name} needs {unknown}, which do not come before it")
+        tasks[step.name] = asyncio.ensure_future(run_step(step))
+
+    pending = set(tasks.values())
+    failed = None
+    while pending and failed is None:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+        failed = next((t for t in tasks.values() if t in done and t.exception()), None)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    rows = [timings[s.name] for s in steps]
+    if failed is not None:
+        step = next(name for name, task in tasks.items() if task is failed)
+        for row in rows:
+            if row["status"] == "running":
+                row["status"] = "failed" if row["step"] == step else "cancelled"
+            elif row["status"] == "waiting":
+                row["status"] = "skipped"
+        raise ProvisioningFailed(cluster, step, failed.exception(), rows)
+    return rows
+
+
+def external_ip(output: str) -> Optional[str]:
+    fields = output.split()
+    if len(fields) > 3 and "pending" not in fields[3]:
+        return fields[3]
+    return None
+
+
+def cluster_steps(
+    backend: Backend,
+    cluster: Dict,
+    size: str,
+    count: int,
+    min_replicas: int,
+    max_replicas: int,
+    target_fips: float,
+    kubeconfig_dir: str = KUBECONFIG_DIR,
+) -> List[Step]:
+    """Provisioning of one SUT as a dependency graph; steps fill in ``cluster`` as they learn things."""
+    name = cluster["name"]
+    secrets = {}
+    kubeconfig = Path(os.path.expanduser(kubeconfig_dir)) / f"{cluster['context']}.yml"
+    # every cluster gets a kubeconfig of its own, so that concurrent installs do not race on the current context
+    env = {"KUBECONFIG": str(kubeconfig)}
+
+    async def run(command: str, **kwargs) -> str:
+        return await backend.run(command, env=env, **kwargs)
+
+    async def create():
+        logger.info(f"Creating cluster with {count} {size} nodes")
+        # the kubeconfig step writes this cluster's own kubeconfig, the shared one is left alone
+        await backend.run(
+            f"doctl kubernetes cluster create --count {count} --region blr1 --size {size} "
+            f"--update-kubeconfig=false --set-current-context=false {name}"
+        )
+
+    async def cluster_id():
+        output = await backend.run(f"doctl kubernetes cluster get {name} --format ID --no-header")
+        cluster["id"] = output.strip()
+        logger.info(f"Cluster created, name: {name}, ID: {cluster['id']}")
+
+    async def write_kubeconfig():
+        config = await backend.run(f"doctl kubernetes cluster kubeconfig show {name}")
+        kubeconfig.parent.mkdir(parents=True, exist_ok=True)
+        kubeconfig.write_text(config)
+        cluster["kubeconfig"] = str(kubeconfig)
+
+    async def api_ready():
+        await wait_until(backend, "kubectl get nodes --no-headers", lambda x: x.count(" Ready") >= count, env=env)
+
+    async def openfaas():
+        logger.info("Installing OpenFaaS on cluster")
+        await run("arkade install openfaas --load-balancer --gateways 3 "
+                  "--set gateway.directFunctions=false --set async=false "
+                  "--set faasnetes.readTimeout=2m --set faasnetes.writeTimeout=2m "
+                  "--set gateway.readTimeout=2m --set gateway.writeTimeout=2m "
+                  "--set gateway.upstreamTimeout=2m")
+
+    async def metrics_server():
+        logger.info("Installing metrics-server on cluster")
+        await run("arkade install metrics-server")
+
+    async def helm_repo():
+        await backend.run("helm repo update")
+
+    async def prometheus_adapter():
+        logger.info("Installing prometheus-adapter on cluster")
+        await run(
+            "helm install prometheus-adapter prometheus-community/prometheus-adapter "
+            "-f kubernetes/prometheus-adapter-values.yml"
+        )
+
+    async def expose_prometheus():
+        logger.info("Exposing Prometheus service of OpenFaaS")
+        await run(
+            "kubectl expose service prometheus -n openfaas --port=9090 --target-port=9090 "
+            "--type=LoadBalancer --name=prometheus-external"
+        )
+
+    async def prometheus_ready():
+        output = await wait_until(
+            backend, "kubectl get service prometheus-external -n openfaas --no-headers", external_ip, env=env
+        )
+        cluster["prometheus"] = f"http://{external_ip(output)}:9090"
+        logger.info(f"OpenFaaS Prometheus is available at: {cluster['prometheus']}")
+
+    async def gateway_ready():
+        output = await wait_until(
+            backend, "kubectl get services -n openfaas gateway-external --no-headers", external_ip, env=env
+        )
+        cluster["gateway"] = f"http://{external_ip(output)}:8080"
+        logger.info(f"OpenFaaS gateway is available at: {cluster['gateway']}")
+
+    async def password():
+        output = await wait_until(
+            backend,
+            "echo $(kubectl -n openfaas get secret basic-auth -o "
+            'jsonpath="{.data.basic-auth-password}" | base64 --decode)',
+            lambda x: bool(x.strip()),
+            env=env,
+        )
+        secrets["password"] = output.strip()
+        logger.info(f"OpenFaaS password is: {secrets['password']}")
+
+    async def login():
+        logger.info("Log into OpenFaaS CLI")
+        # the gateway answers a while after its LoadBalancer gets an address
+        await wait_until(
+            backend,
+            f"faas-cli login -g {cluster['gateway']} -u admin -p {secrets['password']}",
+            lambda x: True,
+            env=env,
+        )
+
+    async def deploy_function():
+        logger.info("Deploying function to OpenFaaS")
+        await run(f"faas-cli deploy -f function/primality.yml --gateway {cluster['gateway']}")
+
+    async def hpa():
+        logger.info("Deploying HPA")
+        hpa_config = yaml.load(Path("kubernetes/hpa-function-invocation-per-second.yml"))
+        hpa_config["spec"]["minReplicas"] = min_replicas
+        hpa_config["spec"]["maxReplicas"] = max_replicas
+        hpa_config["spec"]["metrics"][0]["external"]["target"]["averageValue"] = target_fips
+        # piped rather than written back, so concurrent clusters with other settings do not clash
+        manifest = StringIO()
+        yaml.dump(hpa_config, manifest)
+        await run("kubectl apply -f -", stdin=manifest.getvalue())
+
+    return [
+        Step("create", [], create),
+        Step("helm-repo", [], helm_repo),
+        Step("cluster-id", ["create"], cluster_id),
+        Step("kubeconfig", ["create"], write_kubeconfig),
+        Step("api-ready", ["kubeconfig"], api_ready),
+        Step("openfaas", ["api-ready"], openfaas),
+        Step("metrics-server", ["api-ready"], metrics_server),
+        Step("prometheus-adapter", ["api-ready", "helm-repo"], prometheus_adapter),
+        Step("expose-prometheus", ["openfaas"], expose_prometheus),
+        Step("prometheus-ready", ["expose-prometheus"], prometheus_ready),
+        Step("gateway-ready", ["openfaas"], gateway_ready),
+        Step("password", ["openfaas"], password),
+        Step("login", ["gateway-ready", "password"], login),
+        Step("deploy-function", ["login"], deploy_function),
+        Step("hpa", ["deploy-function", "metrics-server", "prometheus-adapter"], hpa),
+    ]
+
+
+async def provision(
+    backend: Backend,
+    size: str,
+    count: int,
+    min_replicas: int,
+    max_replicas: int,
+    target_fips: float,
+    kubeconfig_dir: str = KUBECONFIG_DIR,
+) -> Dict:
+    """Bring up a SUT and return its cluster name and ID, kube context, endpoints and step timings."""
     cluster_name = f"{size}-{count}"
-    run_command(
-        "doctl kubernetes cluster create "
-        f"--count {count} --region blr1 --size {size} {cluster_name}"
-    )
-    cluster_id = run_command(
-        f"doctl kubernetes cluster get {cluster_name} --format ID --no-header",
-        capture_output=True,
-    ).strip()
-    logger.info(f"Cluster created, name: {cluster_name}, ID: {cluster_id}")
-    time.sleep(10)
-
-    logging.info("Installing OpenFaaS on cluster")
-    run_command("arkade install openfaas --load-balancer --gateways 3 "
-                "--set gateway.directFunctions=false --set async=false "
-                "--set faasnetes.readTimeout=2m --set faasnetes.writeTimeout=2m "
-                "--set gateway.readTimeout=2m --set gateway.writeTimeout=2m "
-                "--set gateway.upstreamTimeout=2m")
-    logging.info("Installing metrics-server on cluster")
-    run_command("arkade install metrics-server")
-
-    logger.info(f"Installing prometheus-adapter on cluster")
-    run_command("helm repo update")
-    run_command(
-        "helm install prometheus-adapter prometheus-community/prometheus-adapter "
-        "-f kubernetes/prometheus-adapter-values.yml",
-    )
+    cluster = {"name": cluster_name, "context": f"do-blr1-{cluster_name}"}
+    steps = cluster_steps(backend, cluster, size, count, min_replicas, max_replicas, target_fips, kubeconfig_dir)
+    cluster["timings"] = await run_steps(cluster_name, steps, backend)
 
-    logger.info("Exposing Prometheus service of OpenFaaS")
-    run_command(
-        "kubectl expose service prometheus -n openfaas --port=9090 --target-port=9090 "
-        "--type=LoadBalancer --name=prometheus-external"
+    logger.info("SUT up and running.")
+    logger.info(
+        f"Run the following to benchmark: $ KUBECONFIG={cluster['kubeconfig']} KUBE_CONTEXT={cluster['context']} "
+        f'PROM_SERVER={cluster["prometheus"]} OUTPUT_DIR="results" '
+        f"artillery run -t {cluster['gateway']} load-generator/<test-definition>.yml"
     )
+    return cluster
 
-    output = run_command(
-        "kubectl get service prometheus-external -n openfaas --no-headers",
-        capture_output=True,
-        success_condition=lambda x: "pending" not in x,
-    )
-    prometheus = f"http://{output.split()[3]}:9090"
-    logger.info(f"OpenFaaS Prometheus is available at: {prometheus}")
 
-    logger.info("Log into OpenFaaS CLI")
-    passwd = run_command(
-        "echo $(kubectl -n openfaas get secret basic-auth -o "
-        'jsonpath="{.data.basic-auth-password}" | base64 --decode)',
-        capture_output=True,
-    )
-    if passwd:
-        logger.info(f"OpenFaaS password is: {passwd}")
-    output = run_command(
-        "kubectl get services -n openfaas gateway-external --no-headers",
-        capture_output=True,
-        success_condition=lambda x: "pending" not in x,
+async def provision_many(backend: Backend, configs: Sequence[Dict], kubeconfig_dir: str = KUBECONFIG_DIR) -> List:
+    """Provision every config (keyword arguments of ``provision``) concurrently; a cluster dict or exception each."""
+    return await asyncio.gather(
+        *(provision(backend, kubeconfig_dir=kubeconfig_dir, **config) for config in configs), return_exceptions=True
     )
-    gateway = f"http://{output.split()[3]}:8080"
-    logger.info(f"OpenFaaS gateway is available at: {gateway}")
-    run_command(f"faas-cli login -g {gateway} -u admin -p {passwd}")
 
-    logger.info("Deploying function to OpenFaaS")
-    run_command(f"faas-cli deploy -f function/primality.yml --gateway {gateway}")
 
-    logger.info("Deploying HPA")
-    hpa_config = yaml.load(Path("kubernetes/hpa-function-invocation-per-second.yml"))
-    hpa_config["spec"]["minReplicas"] = min_replicas
-    hpa_config["spec"]["maxReplicas"] = max_replicas
-    hpa_config["spec"]["metrics"][0]["external"]["target"]["averageValue"] = target_fips
-    yaml.dump(hpa_config, Path("kubernetes/hpa-function-invocation-per-second.yml"))
-    run_command(f"kubectl apply -f kubernetes/hpa-function-invocation-per-second.yml")
+def timing_report(timings: List[Dict]) -> str:
+    """Start, end and duration of every step, with how much of the wall time the steps overlapped."""
+    lines = [f"{'cluster':20} {'step':20} {'start':>8} {'end':>8} {'seconds':>8}  status"]
+    for row in timings:
+        times = [f"{row[k]:8.1f}" if k in row else f"{'-':>8}" for k in ("start", "end", "seconds")]
+        lines.append(f"{row['cluster']:20} {row['step']:20} {' '.join(times)}  {row['status']}")
+    busy = sum(row.get("seconds", 0) for row in timings)
+    wall = max((row["end"] for row in timings if "end" in row), default=0)
+    lines.append(f"{len(timings)} steps, {busy:.1f}s of work in {wall:.1f}s")
+    return "\n".join(lines)
 
-    logger.info("SUT up and running.")
-    logger.info(
-        f"Run the following to benchmark: $ KUBE_CONTEXT=do-blr1-{cluster_name} "
-        f'PROM_SERVER={prometheus} OUTPUT_DIR="results" '
-        f"artillery run -t {gateway} load-generator/<test-definition>.yml"
+
+def write_timings(path: str, timings: List[Dict]):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, ["cluster", "step", "start", "end", "seconds", "status"])
+        writer.writeheader()
+        writer.writerows(timings)
+
+
+def make_backend(fake: bool = False, fake_speed: float = 60.0, fake_fail: Sequence[str] = ()) -> Backend:
+    return FakeBackend(speed=fake_speed, failures=fake_fail) if fake else ShellBackend()
+
+
+def create_cluster(
+    size: str,
+    count: int,
+    min_replicas: int,
+    max_replicas: int,
+    target_fips: float,
+    backend: Optional[Backend] = None,
+    kubeconfig_dir: str = KUBECONFIG_DIR,
+) -> Dict:
+    """Bring up a SUT and return its cluster name and ID, kube context, kubeconfig and endpoints."""
+    cluster = asyncio.run(
+        provision(backend or ShellBackend(), size, count, min_replicas, max_replicas, target_fips, kubeconfig_dir)
     )
+    logger.info("Provisioning steps:\n" + timing_report(cluster["timings"]))
+    return cluster
+
+
+def provision_clusters(configs: List[str], timings: Optional[str] = None, keep_failed: bool = False, **backend):
+    """Provision clusters for results directory names like 10-s-2vcpu-2gb-10-100-0.1, all at once."""
+    from simulate import parse_config
+
+    params = [parse_config(config) for config in configs]
+    names = [f"{p['size']}-{p['nodes']}" for p in params]
+    if len(set(names)) < len(names):
+        sys.exit("Clusters are named <size>-<count>, so configurations differing only in the HPA cannot be provisioned at once")
+
+    backend = make_backend(**backend)
+    # simulated kubeconfigs must not replace real ones
+    kubeconfig_dir = tempfile.mkdtemp(prefix="fake-kube-") if isinstance(backend, FakeBackend) else KUBECONFIG_DIR
+    results = asyncio.run(provision_many(backend, [
+        {"size": p["size"], "count": p["nodes"], "min_replicas": p["min_replicas"],
+         "max_replicas": p["max_replicas"], "target_fips": p["target"]}
+        for p in params
+    ], kubeconfig_dir))
+
+    rows = []
+    for name, result in zip(names, results):
+        if isinstance(result, ProvisioningFailed):
+            logger.error(str(result))
+            rows += result.timings
+            if not keep_failed:
+                delete_cluster(name, backend)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            rows += result["timings"]
+    logger.info("Provisioning steps:\n" + timing_report(rows))
+    if timings:
+        write_timings(timings, rows)
 
 
 def list_clusters():
     run_command("doctl kubernetes cluster list --format ID,Name,Status")
 
 
-def delete_cluster(cid: str):
+def cluster_exists(cid: str) -> bool:
+    output = run_command(
+        f"doctl kubernetes cluster get {cid} --format ID --no-header",
+        capture_output=True,
+    )
+    return bool(output and output.strip())
+
+
+def delete_cluster(cid: str, backend: Optional[Backend] = None):
     logger.info(f"Deleting cluster {cid}")
-    run_command(f"doctl kubernetes cluster delete {cid} --dangerous")
+    command = f"doctl kubernetes cluster delete {cid} --dangerous"
+    if backend is None:
+        run_command(command)
+    else:
+        asyncio.run(backend.run(command))
 
 
 def main():
@@ -127,6 +537,7 @@ def main():
     subparsers = parser.add_subparsers(help="actions")
     function_map = {
         "create": create_cluster,
+        "provision": provision_clusters,
         "delete": delete_cluster,
         "list": list_clusters,
     }
@@ -153,6 +564,25 @@ def main():
         help="target average function invocations per second",
     )
 
+    provision_parser = subparsers.add_parser("provision")
+    provision_parser.set_defaults(which="provision")
+    provision_parser.add_argument(
+        "configs", nargs="+", help="configurations like 10-s-2vcpu-2gb-10-100-0.1, provisioned concurrently"
+    )
+    provision_parser.add_argument("--timings", help="CSV to write the per-step timings to")
+    provision_parser.add_argument(
+        "--keep-failed", action="store_true", help="leave clusters that failed to provision up for inspection"
+    )
+    provision_parser.add_argument(
+        "--fake", action="store_true", help="simulate the commands instead of running them, to time the orchestration"
+    )
+    provision_parser.add_argument(
+        "--fake-speed", type=float, default=60.0, help="how much faster than real time the simulation runs"
+    )
+    provision_parser.add_argument(
+        "--fake-fail", action="append", default=[], metavar="TEXT", help="make simulated commands containing TEXT fail"
+    )
+
     list_clusters_parser = subparsers.add_parser("list")
     list_clusters_parser.set_defaults(which="list")
 
@@ -1,193 +1,121 @@
 # for plotting metrics
-import sys
+import argparse
 import math
-import pandas as pd
-import matplotlib.pyplot as plt
+import json
+import matplotlib
+matplotlib.use("Agg")
+import multiprocessing
 import os
 import shutil
 import numpy as np
 
-from collections import Counter
 import datetime
-from matplotlib.ticker import FormatStrFormatter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from matplotlib.figure import Figure
+from matplotlib.ticker import FormatStrFormatter, MaxNLocator
 from itertools import cycle
 
+from aggregate import LATENCY_COLUMNS, PERCENTILES, Aggregator
+from cache import load_run
+from stream import CHUNKSIZE, StreamAggregator, stream_file
+from concurrency import container_intervals, live_containers, peak_concurrency
+from profiling import Profiler, print_report
+import clocksync
+
+# integer ticks beyond this many are left to a locator, or drawing them takes minutes
+MAX_TICKS = 50
+
 def fts(x):
 	return datetime.datetime.fromtimestamp(x)
 
-class Bucket:
-	def __init__(self, _min, _max, _bucket):
-		self.bin_size = (_max - _min) // _bucket
 
-		self.buckets = []
-		for i in range(_min, _max, _bucket):
-			self.buckets.append({
-				"min": i,
-				"max": i + _bucket,
-				"data": []
-				})
+def integer_ticks(axis, lo, hi):
+	if hi - lo <= MAX_TICKS:
+		axis.set_ticks(range(lo, hi))
+	else:
+		axis.set_major_locator(MaxNLocator(integer=True))
 
-	def print(self):
-		print(self.buckets)
 
-	def add(self, secs, row):
-		for i in self.buckets:
-			if secs >= i["min"] and secs < i["max"]:
-				i["data"].append(row)
-
-	def get_data_list(self, colname, value):
-		data_list = []
-		for b in self.buckets:
-			for d in b["data"]: 
-				if d[colname] == value:
-					data_list.append(b["min"])
-		return data_list
-
-	def get_data_list_avg(self, colname, value):
-		data_list = []
-		for b in self.buckets:
-			for d in b["data"]: 
-				if d[colname] == value:
-					data_list.append(b["min"])
-		return data_list
-
-	def get_latency_data(self, colname):
-		data = {'x': [], 'y': []}
-
-		for b in self.buckets:
-			data['x'].append((b["min"] + b["max"]) / 2)
-
-			_sum, j = 0, 0
-			for d in b["data"]:
-				if d["statusCode"] == 200:
-					_sum += float(d[colname])
-					j += 1
-			data['y'].append(_sum / j if j != 0 else 0)
-		return data
-
-	def get_status_data(self, colname):
-		data1 = {'x': [], 'y': []}
-		data2 = {'x': [], 'y': []}
-
-		for b in self.buckets:
-			data1['x'].append((b["min"] + b["max"]) / 2)
-			data2['x'].append((b["min"] + b["max"]) / 2)
-
-			data1['y'].append(len(list(filter(lambda x: x[colname]==200, b["data"]))))
-			data2['y'].append(len(list(filter(lambda x: x[colname]!=200, b["data"]))))
-		return data1, data2
+class ChartOutput:
+	"""Formats and resolution charts are saved in, overridable per chart.
 
-	def get_heat_data(self):
-		hdata = {}
+	``charts`` maps a chart's file name (e.g. "latency_heatmap") to a
+	``(formats, dpi)`` pair; a None in it keeps the default. A dpi of None
+	saves at the figure's own resolution.
+	"""
 
-		host_list = [h for h in list(set(self.df["hostId"])) if not pd.isna(h)]
-
-		for host in host_list:
-			hdata[host] = {'x': [], 'y': []}
-
-			for b in self.buckets:
-				hdata[host]['x'].append((b["min"] + b["max"]) / 2)
-				hdata[host]['y'].append([])
-
-		for host in host_list:
-			contain = {}
-			for b in self.buckets:
-				for d in b["data"]:
-					try:
-						exec_start = (fts(d['executionStartTime']) - fts(self.request_start_time)).total_seconds()
-						exec_end = (fts(d['executionEndTime']) - fts(self.request_start_time)).total_seconds()
-
-						for e, j in enumerate(hdata[host]['x']):
-							if j >= exec_start and j <= exec_end:
-								if str(d["hostId"]) == str(host):
-									hdata[host]['y'][e].append(d["containerId"])
-					except Exception as e:
-						# print(e)
-						continue
-		for host in hdata:
-			yvals = []
-			for j in range(len(hdata[host]['y'])):
-				yvals.append(len([k for k in list(set(hdata[host]['y'][j])) if k != []]))
-			hdata[host]['y'] = yvals
-		return hdata
+	def __init__(self, formats=("png",), dpi=None, charts=None):
+		self.formats = tuple(formats)
+		self.dpi = dpi
+		self.charts = charts or {}
 
-	def get_container_heat(self):
-		hdata = {}
+	def options(self, name):
+		formats, dpi = self.charts.get(name, (None, None))
+		return formats or self.formats, dpi or self.dpi
 
-		contain_list = [h for h in list(set(self.df["containerId"])) if not pd.isna(h)]
-		for cont in contain_list:
-			hdata[cont] = {'x': [], 'y': []}
-			contain = {}
-			for b in self.buckets:
-				hdata[cont]['x'].append((b["min"] + b["max"]) / 2)
-
-				l = []
-				for d in b["data"]:
-					if str(d["containerId"]) == str(cont):
-						l.append(d["requestId"])
-				hdata[cont]['y'].append(len(set(l)))
-		return hdata
+	def save(self, fig, folder, name):
+		formats, dpi = self.options(name)
+		for f in formats:
+			fig.savefig(os.path.join(folder, '{}.{}'.format(name, f)), format=f, dpi=dpi or 'figure')
 
-	def get_repliacs_data(self, name):
-		hdata = {'x': [], 'y': []}
-
-		for b in self.buckets:
-			hdata['x'].append((b["min"] + b["max"]) / 2)
-			
-			val = 0
-			j = 0
-			for d in b["data"]:
-				val += d["replicas"]
-				j += 1
-			if j==0:
-				hdata['y'].append(0)
-			else:
-				hdata['y'].append(val//j)
 
-		return hdata
+def parse_chart_output(text):
+	"""NAME=FORMAT[,FORMAT...][@DPI] or NAME=@DPI, as given to --chart."""
+	name, _, spec = text.partition("=")
+	formats, _, dpi = spec.partition("@")
+	return name, (tuple(f for f in formats.split(",") if f) or None, int(dpi) if dpi else None)
 
-	def get_fn_invocation_rate(self, name):
-		hdata = {'x': [], 'y': []}
-
-		for b in self.buckets:
-			hdata['x'].append((b["min"] + b["max"]) / 2)
-			
-			val = 0
-			j = 0
-			for d in b["data"]:
-				time = d["functionInvocationRate"]
-				try:
-					if time.endswith("m"):
-						time = float(time[:-1]) * 0.001
-					elif time.endswith("n"):
-						time = float(time[:-1]) * 0.000000001
-					else:
-						time = float(time)
-
-					val += time
-					j += 1
-				except Exception as e:
-					# print(e)
-					continue
-
-			if j==0:
-				hdata['y'].append(0)
-			else:
-				hdata['y'].append(val/j)
 
-		return hdata
+class Plots:
+	"""Charts of a run, each one drawn on a figure of its own that is freed once saved.
+
+	Figures are not registered with pyplot, so nothing keeps them alive
+	after ``_save``, and the series several charts draw are computed once
+	by ``prepare``.
+	"""
+	output = ChartOutput()
+	_shared = None
+
+	def prepare(self, containers=True):
+		"""Compute the series shared between charts, before rendering any (or forking renderers).
+
+		Without ``containers`` the container table is left to the charts
+		that need it, for renders that skip them.
+		"""
+		self._shared = {
+			"requests": self.get_requests_data(),
+			"xlabel": 'Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))),
+		}
+		if containers:
+			# cached by the aggregator for the container charts, table and summary
+			self.get_container_stats()
+		return self._shared
+
+	def _shared_series(self):
+		return self._shared if self._shared is not None else self.prepare()
 
-	def get_requests_data(self):
-		data = {'x': [], 'y': []}
+	def _xlabel(self):
+		return self._shared_series()["xlabel"]
 
-		for b in self.buckets:
-			data['x'].append((b["min"] + b["max"]) / 2)
-			data['y'].append(len(b["data"]))
-		return data
+	def _figure(self, nrows, ncols, figsize, **kwargs):
+		fig = Figure(figsize=figsize)
+		return fig, fig.subplots(nrows, ncols, **kwargs)
+
+	def _requests_panel(self, ax):
+		data = self._shared_series()["requests"]
+		ax.plot(data['x'], data['y'], marker='.')
+		ax.set_xlabel(self._xlabel())
+		ax.set_ylabel('Number of requests')
+		ax.set_title('Requests per second')
+		ax.xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+
+	def _save(self, fig, folder, name):
+		self.output.save(fig, folder, name.lower().replace(" ","_"))
 
 	def plot_latency_graphs(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		for g in ["executionLatency", "requestResponseLatency", "schedulingLatency"]:
 			print("[*] {}".format(g))
@@ -198,7 +126,7 @@ class Bucket:
 				continue
 			ax[0].plot(data['x'], data['y'], label='{}'.format(g), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Latency (in seconds)')
 		ax[0].legend(loc='best')
 
@@ -206,18 +134,71 @@ class Bucket:
 		ax[0].yaxis.set_major_formatter(FormatStrFormatter('%d sec'))
 		ax[0].set_title('Latency Plots')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		self._requests_panel(ax[1])
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+		self._save(fig, folder, name)
+
+	def plot_latency_percentiles(self, folder, name):
+		fig, ax = self._figure(4, 1, figsize=(16,20), gridspec_kw={'height_ratios': [2, 2, 2, 1]})
+
+		for e, g in enumerate(LATENCY_COLUMNS):
+			print("[*] {} percentiles".format(g))
+			try:
+				data = self.get_latency_percentiles(g)
+			except Exception as err:
+				print(err)
+				continue
+			for p in list(PERCENTILES) + ['max']:
+				ax[e].plot(data['x'], data[p], label=p, marker='.')
+
+			ax[e].set_xlabel(self._xlabel())
+			ax[e].set_ylabel('Latency (in seconds)')
+			ax[e].legend(loc='best')
+			ax[e].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+			ax[e].set_title('{} percentiles'.format(g))
+
+		self._requests_panel(ax[3])
+
+		self._save(fig, folder, name)
+
+	def plot_latency_heatmap(self, folder, name):
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+
+		g = "requestResponseLatency"
+		print("[*] {} heatmap".format(g))
+		try:
+			sketch = self.get_latency_sketch(g)
+		except Exception as err:
+			print(err)
+			return
+
+		# merge sketch bins into ~10% wide latency bands
+		edges, counts = sketch.positive_bins(factor=5)
+		used = np.flatnonzero(counts.sum(axis=0))
+		if not len(used):
+			return
+		lo, hi = used[0], used[-1] + 1
+		x = [b["min"] for b in self.buckets] + [self.buckets[-1]["max"]]
+
+		mesh = ax[0].pcolormesh(x, edges[lo:hi + 1], np.ma.masked_equal(counts[:, lo:hi].T, 0), cmap='viridis')
+		fig.colorbar(mesh, ax=ax[0], label='Successful requests')
+		ax[0].set_yscale('log')
+		ax[0].set_xlabel(self._xlabel())
+		ax[0].set_ylabel('{} (in seconds)'.format(g))
+		ax[0].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		ax[0].set_title('Latency distribution over time')
+
+		self._requests_panel(ax[1])
+
+		self._save(fig, folder, name)
+
+	def write_summary(self, folder, name="summary"):
+		with open(os.path.join(folder, '{}.json'.format(name)), 'w') as f:
+			json.dump(self.get_summary(), f, indent=2)
 
 	def plot_status_graphs(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		g = "statusCode"
 		print("[*] {}".format(g))
@@ -226,27 +207,22 @@ class Bucket:
 		ax[0].plot(data1['x'], data1['y'], label='{}'.format("Successful Requests"), marker='.')
 		ax[0].plot(data2['x'], data2['y'], label='{}'.format("Failed Requests"), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Number of requests')
 		ax[0].legend(loc='best')
 
 		ax[0].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
-		ax[0].set_yticks(range(min(min(data1['y']), min(data2['y'])), math.ceil(max(max(data1['y']), max(data2['y'])))+1+10))
+		integer_ticks(ax[0].yaxis, min(min(data1['y']), min(data2['y'])), math.ceil(max(max(data1['y']), max(data2['y'])))+1+10)
 
 		ax[0].set_title('Successful and Failed Requests Plot')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		self._requests_panel(ax[1])
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+		self._save(fig, folder, name)
 
 	def plot_replicas(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		g = "replicas"
 		if g not in list(self.df.columns):
@@ -257,89 +233,155 @@ class Bucket:
 
 		ax[0].plot(data['x'], data['y'], label='{}'.format("Replicas"), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Replicas')
 		ax[0].legend(loc='best')
 
 		ax[0].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
-		ax[0].set_yticks(range(min(data['y']), math.ceil(max(data['y']))+1+5))
+		# runs recorded without Prometheus have no replicas metric
+		if not np.isnan(np.asarray(data['y'], dtype=float)).all():
+			integer_ticks(ax[0].yaxis, int(np.nanmin(data['y'])), math.ceil(np.nanmax(data['y']))+1+5)
 		ax[0].set_title('Kube Metric: running pod replicas per sec')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		self._requests_panel(ax[1])
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+		self._save(fig, folder, name)
 
 	def plot_heat_graphs(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		print("[*] containers per host")
 		try:
 			hdata = self.get_heat_data()
 		except:
 			return
+		# runs recorded without execution columns have no containers to plot
+		if not hdata:
+			return
 
 		res = [j for i in hdata for j in hdata[i]['y']]
 
 		for e, host in enumerate(hdata):
-			ax[0].plot(hdata[host]['x'], hdata[host]['y'], label='host-{}: {}'.format(e, host), marker='.')
+			ax[0].plot(hdata[host]['x'], hdata[host]['y'], label='host-{}: {} (peak {})'.format(e, host, self.peak_containers[host]), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Running containers')
 
 		ax[0].legend(loc='best')
-		ax[0].set_yticks(range(int(min(res)), math.ceil(max(res))+1))
+		integer_ticks(ax[0].yaxis, int(min(res)), math.ceil(max(res))+1)
 		ax[0].set_title('Running containers per host heat plot')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		self._requests_panel(ax[1])
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+		self._save(fig, folder, name)
 
 	def plot_container_heat_graphs(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		print("[*] requests per container")
 		try:
 			hdata = self.get_container_heat()
 		except:
 			return
+		# runs recorded without execution columns have no containers to plot
+		if not hdata:
+			return
 
 		res = [j for i in hdata for j in hdata[i]['y']]
 
 		for e, host in enumerate(hdata):
 			ax[0].plot(hdata[host]['x'], hdata[host]['y'], label='container-{}: {}'.format(e, host), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Requests per container')
 
 		ax[0].legend(loc='best')
-		ax[0].set_yticks(range(int(min(res)), math.ceil(max(res))+1))
+		integer_ticks(ax[0].yaxis, int(min(res)), math.ceil(max(res))+1)
 		ax[0].set_title('Requests per container heat plot')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
+		self._requests_panel(ax[1])
+
+		self._save(fig, folder, name)
+
+	def plot_container_utilization(self, folder, name):
+		fig, ax = self._figure(3, 1, figsize=(16,15), gridspec_kw={'height_ratios': [2, 1, 1]})
+
+		print("[*] container utilization")
+		data = self.get_container_utilization()
+		if not len(data['busy']):
+			return
+
+		x = [b["min"] for b in self.buckets] + [self.buckets[-1]["max"]]
+		# containers in order of their first execution
+		order = np.argsort(self.get_container_stats()["firstStart"].to_numpy(), kind="mergesort")
+		mesh = ax[0].pcolormesh(x, np.arange(len(order) + 1), np.ma.masked_invalid(data['busy'][order]), cmap='viridis', vmin=0, vmax=1)
+		fig.colorbar(mesh, ax=ax[0], label='Busy fraction')
+		ax[0].set_xlabel(self._xlabel())
+		ax[0].set_ylabel('Containers (by first execution)')
+		ax[0].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		ax[0].set_title('Busy fraction per container')
+
+		ax[1].plot(data['x'], data['meanBusy'], label='Mean busy fraction of live containers', marker='.')
+		ax[1].plot(data['x'], data['fairness'], label="Jain's fairness of requests across live containers", marker='.')
+		ax[1].set_xlabel(self._xlabel())
+		ax[1].set_ylim(0, 1.05)
+		ax[1].legend(loc='best')
 		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		ax[1].set_title('Utilization and load balancing')
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+		self._requests_panel(ax[2])
+
+		fig.tight_layout()
+		self._save(fig, folder, name)
+
+	def plot_container_lifecycles(self, folder, name):
+		print("[*] container lifecycles")
+		table = self.get_container_stats()
+		if not len(table):
+			return
+		# the gaps as sketched: each bin's value, weighted by how many gaps fell in it
+		sketch = self.get_container_index().gap_sketch()
+		values = sketch.values[sketch.keys % sketch.width]
+		positive = values > 0
+		gaps, weights = values[positive], sketch.weights[positive]
+
+		fig, ax = self._figure(2, 2, figsize=(16,11))
+		ax[0][0].hist(table["busyFraction"], bins=np.linspace(0, 1, 21))
+		ax[0][0].set_xlabel('Busy fraction between first and last execution')
+		ax[0][0].set_ylabel('Containers')
+		ax[0][0].set_title('How busy containers were')
+
+		peaks = table["maxInFlight"].to_numpy()
+		ax[0][1].bar(*np.unique(peaks, return_counts=True))
+		ax[0][1].set_xlabel('Most requests in flight at once')
+		ax[0][1].set_ylabel('Containers')
+		ax[0][1].set_title('Concurrent executions per container')
+
+		if len(gaps):
+			ax[1][0].hist(gaps, weights=weights, bins=np.geomspace(max(gaps.min(), 1e-3), max(gaps.max(), 2e-3), 30))
+			ax[1][0].set_xscale('log')
+		ax[1][0].set_xlabel('Idle gap (in seconds)')
+		ax[1][0].set_ylabel('Gaps')
+		ax[1][0].set_title('Idle gaps between busy periods')
+
+		idle = table["idleBeforeScaleDown"].dropna()
+		ax[1][1].hist(idle, bins=30)
+		ax[1][1].set_xlabel('Idle time after the last execution until a replica decrease (in seconds)')
+		ax[1][1].set_ylabel('Containers')
+		ax[1][1].set_title('Idle time before scale-down ({} of {} containers matched)'.format(len(idle), len(table)))
+
+		fig.tight_layout()
+		self._save(fig, folder, name)
+
+	def write_container_table(self, folder, name="containers"):
+		self.get_container_stats().to_csv(os.path.join(folder, '{}.csv'.format(name)), index=False)
 
 
 	def plot_fn_invocation_rate(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		g = "functionInvocationRate"
 		if g not in list(self.df.columns):
@@ -350,7 +392,7 @@ class Bucket:
 
 		ax[0].plot(data['x'], data['y'], label='{}'.format("Function Invocation Rate (in secs)"), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Function inovcation rate')
 		ax[0].legend(loc='best')
 		ax[0].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
@@ -358,47 +400,13 @@ class Bucket:
 		# ax[0].yticks(range(int(min(data['y'])), math.ceil(int(max(data['y']))+1+5)))
 		ax[0].set_title('Function Invocation Rate')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		self._requests_panel(ax[1])
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
-
-	def get_memory_usage(self, name):
-		if name not in list(self.df.columns):
-			return {}
-		data = {'x': [], 'y': []}
-
-		for b in self.buckets:
-			data['x'].append((b["min"] + b["max"]) / 2)
-			
-			val = 0
-			j = 0
-			for d in b["data"]:
-				v = d[name]
-
-				if not pd.isna(v):
-					if v.endswith("Ki"):
-						v = (float(v[:-2]) / 1024)
-					elif v.endswith("Mi"):
-						v = (float(v[:-2]))
-					else:
-						v = float(v) / (1024*1024)
-
-					val += v
-					j += 1
-			if j==0:
-				data['y'].append(0)
-			else:
-				data['y'].append(val/j)
-		return data
+		self._save(fig, folder, name)
 
 	def plot_memory_usage(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		g = "MemoryUsage"
 		print("[*] {}".format(g))
@@ -414,7 +422,7 @@ class Bucket:
 				continue
 			ax[0].plot(data['x'], data['y'], label='{}'.format(n[:2]), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('Memory Usage (in Kb)')
 		ax[0].legend(loc='best')
 
@@ -423,50 +431,13 @@ class Bucket:
 		# ax[0].set_yticks(range(int(min(data['y'])), math.ceil(int(max(data['y']))+1)))
 		ax[0].set_title('Memory Usage per host-node')
  
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
-
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
-
-	def get_cpu_usage(self, name):
-		if name not in list(self.df.columns):
-			return {}
-
-		data = {'x': [], 'y': []}
-
-		for b in self.buckets:
-			data['x'].append((b["min"] + b["max"]) / 2)
-			
-			val = 0
-			j = 0
-			for d in b["data"]:
-				v = d[name]
-
-				if not pd.isna(v):
-					if v.endswith("n"):
-						v = (float(v[:-1])) / 1000000000
-					elif v.endswith("u"):
-						v = (float(v[:-1])) / 1000000
-					else:
-						v = float(v)
-						# print(v)
-
-					val += v
-					j += 1
+		self._requests_panel(ax[1])
 
-			if j==0:
-				data['y'].append(0)
-			else:
-				data['y'].append(val/j)
-		return data
+		self._save(fig, folder, name)
 
 	def plot_cpu_usage(self, folder, name):
 		# plt.figure(figsize=(15,8))
-		fig, ax = plt.subplots(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
+		fig, ax = self._figure(2, 1, figsize=(16,11), gridspec_kw={'height_ratios': [2, 1]})
 
 		g = "CpuUsage"
 		print("[*] {}".format(g))
@@ -483,7 +454,7 @@ class Bucket:
 			# print(data)
 			ax[0].plot(data['x'], data['y'], label='{}'.format(n[:2]), marker='.')
 
-		ax[0].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
+		ax[0].set_xlabel(self._xlabel())
 		ax[0].set_ylabel('CPU Usage')
 		ax[0].legend(loc='best')
 
@@ -492,53 +463,149 @@ class Bucket:
 		ax[0].set_yticks([round(x,5) for x in np.arange(0, 4, 0.1)])
 		ax[0].set_title('CPU Usage per host-node')
 
-		data = self.get_requests_data()
-		ax[1].plot(data['x'], data['y'], marker='.')
-		ax[1].set_xlabel('Time in seconds (start-time: {})'.format(str(fts(self.request_start_time))))
-		ax[1].set_ylabel('Number of requests')
-		ax[1].set_title('Requests per second')
-		ax[1].xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+		self._requests_panel(ax[1])
 
-		plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+		self._save(fig, folder, name)
 
 
-if __name__ == '__main__':
+class Bucket(Aggregator, Plots):
+	def print(self):
+		print(self.buckets)
 
-	file = sys.argv[1]
-	dirpath = sys.argv[2]
-	df = pd.read_csv(file)
+	def get_heat_data(self):
+		intervals = container_intervals(self.df[self.valid], self.request_start_time)
+		self.peak_containers = peak_concurrency(intervals)
 
+		hdata = {}
+		for host, y in live_containers(intervals, self.midpoints).items():
+			hdata[host] = {'x': list(self.midpoints), 'y': [int(v) for v in y]}
+		return hdata
 
-	reqtime = sorted(list(Counter(df['requestTime'])))
-	time = [((fts(i)-fts(reqtime[0])).total_seconds(), i) for i in list(reqtime)]
 
-	request_start_time = reqtime[0]
-	request_end_time = reqtime[-1]
+class StreamBucket(StreamAggregator, Plots):
+	pass
 
-	START_TIME = 0
-	END_TIME = int((fts(request_end_time) - fts(request_start_time)).total_seconds())+1
-	INTERVAL = 10
 
-	buck = Bucket(START_TIME, END_TIME, INTERVAL) 
-	buck.df = df
+def load_buckets(file, interval=10, clock=False):
+	df = load_run(file).frame()
+	if clock:
+		df = clocksync.correct(df, clocksync.estimate(df))
 
-	buck.request_start_time = request_start_time
+	request_start_time = df['requestTime'].min()
+	request_end_time = df['requestTime'].max()
 
-	for i, row in df.iterrows():
-		secs = (fts(row['requestTime']) - fts(request_start_time)).total_seconds()
-		buck.add(secs, row)
+	START_TIME = 0
+	END_TIME = int((fts(request_end_time) - fts(request_start_time)).total_seconds())+1
 
-	# dirpath = "./" + (file.split("/")[-1]).split(".")[0]
+	buck = Bucket(START_TIME, END_TIME, interval)
+	buck.load(df, request_start_time)
+	return buck
+
+
+# charts plot_file renders, in order: the Plots method and the chart's title
+CHARTS = [
+	("plot_latency_graphs", "Latency Plots"),
+	("plot_latency_percentiles", "Latency Percentiles"),
+	("plot_latency_heatmap", "Latency Heatmap"),
+	("plot_status_graphs", "Status Code"),
+	("plot_heat_graphs", "Containers Per Hosts"),
+	("plot_container_heat_graphs", "Requests Per Container"),
+	("plot_container_utilization", "Container Utilization"),
+	("plot_container_lifecycles", "Container Lifecycles"),
+	("plot_replicas", "Pod Replicas"),
+	("plot_fn_invocation_rate", "Function Invocation Rate"),
+	("plot_memory_usage", "Nodes Memory Usage"),
+	("plot_cpu_usage", "Nodes CPU Usage"),
+]
+
+# the run whose charts forked workers render
+_rendering = None
+
+
+def _render_chart(chart, dirpath):
+	method, title = chart
+	getattr(_rendering, method)(dirpath, title)
+
+
+def render_charts(buck, dirpath, jobs=1):
+	"""Render every chart of ``buck`` into ``dirpath``, in ``jobs`` forked processes if more than one.
+
+	Shared series are computed first, so workers inherit them instead of
+	recomputing them. Without fork (e.g. on Windows) charts are rendered
+	one after another.
+	"""
+	global _rendering
+	buck.prepare()
+	if jobs <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+		for method, title in CHARTS:
+			getattr(buck, method)(dirpath, title)
+		return
+
+	_rendering = buck
+	try:
+		with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as pool:
+			# results are collected so that a failing chart raises here
+			list(pool.map(_render_chart, CHARTS, [dirpath] * len(CHARTS)))
+	finally:
+		_rendering = None
+
+
+def plot_file(file, dirpath, stream=False, chunksize=CHUNKSIZE, clock=False, profiler=None, jobs=1, output=None):
+	stage = profiler.stage if profiler else lambda name: nullcontext()
+	with stage("load"):
+		if stream:
+			prepare = None
+			if clock:
+				offsets = clocksync.estimate_file(file, chunksize=chunksize)
+				prepare = lambda chunk: clocksync.correct(chunk, offsets)
+			buck = stream_file(StreamBucket, file, chunksize=chunksize, prepare=prepare)
+		else:
+			buck = load_buckets(file, clock=clock)
+	if output is not None:
+		buck.output = output
+	if profiler:
+		# every get_*, plot_* and write_* call becomes a stage of its own
+		profiler.instrument(buck)
 
 	if os.path.exists(dirpath) and os.path.isdir(dirpath):
 		shutil.rmtree(dirpath)
-	os.mkdir(dirpath)
-
-	buck.plot_latency_graphs(dirpath, "Latency Plots")
-	buck.plot_status_graphs(dirpath, "Status Code")
-	buck.plot_heat_graphs(dirpath, "Containers Per Hosts")
-	buck.plot_container_heat_graphs(dirpath, "Requests Per Container")
-	buck.plot_replicas(dirpath, "Pod Replicas")
-	buck.plot_fn_invocation_rate(dirpath, "Function Invocation Rate")
-	buck.plot_memory_usage(dirpath, "Nodes Memory Usage")
-	buck.plot_cpu_usage(dirpath, "Nodes CPU Usage")
\ No newline at end of file
+	os.makedirs(dirpath)
+
+	buck.write_summary(dirpath)
+	# charts rendered by workers are timed as a whole
+	with stage("render") if jobs > 1 else nullcontext():
+		render_charts(buck, dirpath, jobs=jobs)
+	buck.write_container_table(dirpath)
+
+
+def add_output_arguments(parser):
+	parser.add_argument("--format", nargs="+", default=["png"], help="formats to save charts in, e.g. png svg")
+	parser.add_argument("--dpi", type=int, help="resolution of raster charts (default: the figure's, 100)")
+	parser.add_argument("--chart", action="append", default=[], metavar="NAME=FORMAT[,FORMAT][@DPI]",
+		help="formats and resolution of one chart, by file name, e.g. latency_heatmap=svg or status_code=png@200")
+
+
+def chart_output(args):
+	return ChartOutput(args.format, args.dpi, dict(parse_chart_output(c) for c in args.chart))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument("file", help="result CSV")
+	parser.add_argument("dirpath", help="directory to write the plots to")
+	parser.add_argument("--stream", action="store_true", help="read the CSV in chunks, with memory bounded by the number of buckets")
+	parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows per chunk in --stream mode")
+	parser.add_argument("--clock-correct", action="store_true", help="move execution times to the load generator's clock, per host")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="processes rendering charts concurrently")
+	add_output_arguments(parser)
+	parser.add_argument("--profile", action="store_true", help="report wall time and peak traced memory of every stage")
+	parser.add_argument("--profile-dump", metavar="PATH", help="also write cProfile stats to PATH (implies --profile)")
+	args = parser.parse_args()
+
+	options = dict(stream=args.stream, chunksize=args.chunksize, clock=args.clock_correct, jobs=args.jobs, output=chart_output(args))
+	if args.profile or args.profile_dump:
+		with Profiler(dump=args.profile_dump) as profiler:
+			plot_file(args.file, args.dirpath, profiler=profiler, **options)
+		print_report(profiler.report())
+	else:
+		plot_file(args.file, args.dirpath, **options)
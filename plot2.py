@@ -1,29 +1,87 @@
-import os
-import sys
-import subprocess
-from os import listdir
-from os.path import isfile, join
-from pathlib import Path
-
-mypath = str(sys.argv[1])
-plotfoldname = str(sys.argv[2])
-
-# onlyfiles = [f for f in listdir(mypath) if isfile(join(mypath, f))]
-allfiles = ([os.path.join(r,file) for r,d,f in os.walk(mypath) for file in f])
-
-for e, file in enumerate(allfiles):
-	if file.endswith(".csv"):
-		folds = file[:-4]
-
-	folds = folds.split("/")
-	folds[0] = plotfoldname
-
-	newfolderpath = "/".join(folds)
-
-	path = Path(newfolderpath)
-	path.mkdir(parents=True, exist_ok=True)
-
-	call = ["python3", "plot.py", file, newfolderpath]
-	subprocess.call(call, stdout=open(os.devnull, 'wb'))
-
-	print("[*] {}/{}: {}".format(e, len(allfiles), " ".join(call)))
+import json
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+
+def init_worker():
+	# import matplotlib and the plotting code once per worker process
+	import matplotlib
+	matplotlib.use("Agg")
+	global plot
+	import plot
+
+
+# written into a plot directory once all of its charts are, with the options they were rendered with
+MARKER = ".plotted"
+
+
+def render_options(clock, output):
+	return json.dumps({"clock": clock, "formats": output.formats, "dpi": output.dpi, "charts": output.charts}, sort_keys=True)
+
+
+def render(file, newfolderpath, clock=False, output=None):
+	start = time.perf_counter()
+	marker = Path(newfolderpath, MARKER)
+	# a render that dies halfway leaves no marker, so it is redone
+	if marker.exists():
+		marker.unlink()
+	plot.plot_file(file, newfolderpath, clock=clock, output=output)
+	marker.write_text(render_options(clock, output or plot.ChartOutput()))
+	return time.perf_counter() - start
+
+
+def up_to_date(file, newfolderpath, options):
+	marker = Path(newfolderpath, MARKER)
+	if not marker.is_file() or marker.read_text() != options:
+		return False
+	return marker.stat().st_mtime > Path(file).stat().st_mtime
+
+
+def plot_folder(path, newfolderpath):
+	folds = path.split("/")
+	folds[0] = newfolderpath
+	return "/".join(folds)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument("results", help="results directory to walk")
+	parser.add_argument("plots", help="directory to write the plots to")
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+	parser.add_argument("-f", "--force", action="store_true", help="replot runs whose plots are up to date")
+	parser.add_argument("--clock-correct", action="store_true", help="move execution times to the load generator's clock, per host")
+	from plot import add_output_arguments, chart_output
+	add_output_arguments(parser)
+	args = parser.parse_args()
+	output = chart_output(args)
+
+	allfiles = sorted([os.path.join(r,file) for r,d,f in os.walk(args.results) for file in f if file.endswith(".csv")])
+
+	todo = []
+	options = render_options(args.clock_correct, output)
+	for file in allfiles:
+		newfolderpath = plot_folder(file[:-4], args.plots)
+		if not args.force and up_to_date(file, newfolderpath, options):
+			print("[*] skipping {}: plots are up to date".format(file))
+			continue
+		todo.append((file, newfolderpath))
+
+	timings = {}
+	start = time.perf_counter()
+	with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker) as pool:
+		futures = {pool.submit(render, file, newfolderpath, args.clock_correct, output): file for file, newfolderpath in todo}
+		for e, future in enumerate(as_completed(futures)):
+			file = futures[future]
+			try:
+				timings[file] = future.result()
+				print("[*] {}/{}: {} ({:.2f}s)".format(e + 1, len(todo), file, timings[file]))
+			except Exception as err:
+				print("[!] {}/{}: {} failed: {}".format(e + 1, len(todo), file, err), file=sys.stderr)
+
+	print("\n[*] plotted {} of {} runs in {:.2f}s ({} up to date)".format(len(timings), len(todo), time.perf_counter() - start, len(allfiles) - len(todo)))
+	for file, secs in sorted(timings.items(), key=lambda x: -x[1]):
+		print("    {:8.2f}s  {}".format(secs, file))
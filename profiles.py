@@ -0,0 +1,126 @@
+# artillery load profiles (load-generator/*.yml) as phase timelines
+import os
+from pathlib import Path
+
+import numpy as np
+from ruamel.yaml import YAML
+
+PROFILE_DIR = "load-generator"
+
+
+def load_profile(path) -> dict:
+    return YAML(typ="safe").load(Path(path))
+
+
+def load_phases(path) -> list:
+    """Phases of a profile with absolute start/end seconds and arrival rates.
+
+    Each phase ramps linearly from ``from_rate`` to ``to_rate`` requests
+    per second, like artillery's ``arrivalRate``/``rampTo``.
+    """
+    config = load_profile(path)["config"]
+    phases, start = [], 0.0
+    for e, phase in enumerate(config["phases"]):
+        duration = float(phase.get("duration", phase.get("pause", 0)))
+        if "pause" in phase:
+            from_rate = to_rate = 0.0
+        elif "arrivalCount" in phase:
+            from_rate = to_rate = float(phase["arrivalCount"]) / duration if duration else 0.0
+        else:
+            from_rate = float(phase.get("arrivalRate", 0))
+            to_rate = float(phase.get("rampTo", from_rate))
+
+        if to_rate > from_rate:
+            kind = "ramp-up"
+        elif to_rate < from_rate:
+            kind = "ramp-down"
+        elif from_rate > 0:
+            kind = "steady"
+        else:
+            kind = "idle"
+
+        phases.append({
+            "phase": e,
+            "kind": kind,
+            "start": start,
+            "end": start + duration,
+            "duration": duration,
+            "from_rate": from_rate,
+            "to_rate": to_rate,
+        })
+        start += duration
+    return phases
+
+
+def artillery_steps(phases) -> list:
+    """Phases as artillery runs them, with every ramp cut into steady steps.
+
+    Artillery ramps from ``arrivalRate`` one request per second at a
+    time, in ceil(|rampTo - arrivalRate|) + 1 equal steps, so a ramp down
+    to 0.1 ends on a step at 0. Within a ramp it sends at random ticks,
+    so only the number of arrivals per step follows the profile.
+    """
+    steps = []
+    for p in phases:
+        difference = p["to_rate"] - p["from_rate"]
+        if not difference or not p["duration"]:
+            steps.append(p)
+            continue
+        n = int(np.ceil(abs(difference))) + 1
+        length = p["duration"] / n
+        for i in range(n):
+            rate = p["from_rate"] + i if difference > 0 else max(p["from_rate"] - i, 0.0)
+            steps.append(dict(p, start=p["start"] + i * length, end=p["start"] + (i + 1) * length,
+                              duration=length, from_rate=rate, to_rate=rate))
+    return steps
+
+
+def phase_of(secs, phases) -> np.ndarray:
+    """Index of the phase each time (seconds since the run start) falls in, -1 past the end."""
+    ends = np.array([p["end"] for p in phases])
+    idx = np.searchsorted(ends, np.asarray(secs, dtype="float64"), "right")
+    return np.where(idx < len(phases), idx, -1)
+
+
+def expected_arrivals(phases, secs) -> np.ndarray:
+    """Requests the profile asks for from its start up to each of ``secs``: the intended arrival curve."""
+    secs = np.asarray(secs, dtype="float64")
+    total = np.zeros(secs.shape)
+    for p in phases:
+        dt = np.clip(secs - p["start"], 0.0, p["duration"])
+        slope = (p["to_rate"] - p["from_rate"]) / p["duration"] if p["duration"] else 0.0
+        total += p["from_rate"] * dt + slope * dt ** 2 / 2
+    return total
+
+
+def arrival_times(phases, poisson=False, rng=None, step=0.001) -> np.ndarray:
+    """Request times in seconds since the start of the profile.
+
+    The expected number of arrivals up to t is the integral of the phases'
+    linearly ramping rate; deterministic arrivals are spaced evenly on that
+    scale, Poisson arrivals by exponential gaps.
+    """
+    end = phases[-1]["end"] if phases else 0.0
+    t = np.arange(0.0, end + step, step)
+    expected = expected_arrivals(phases, t)
+
+    # the closed form, as the grid's last point may fall short of or past the end
+    total = expected_arrivals(phases, [end])[0]
+    if poisson:
+        gaps = (rng or np.random.default_rng()).exponential(1.0, int(total * 1.5) + 100)
+        marks = np.cumsum(gaps)
+        marks = marks[marks < total]
+    else:
+        marks = np.arange(0.0, np.floor(total + 1e-9)) + 0.5
+    # expected is non-decreasing; interpolate on its strictly increasing part
+    keep = np.concatenate([[True], np.diff(expected) > 0])
+    return np.interp(marks, expected[keep], t[keep])
+
+
+def profile_for(csv_path, profile_dir=PROFILE_DIR):
+    """The load profile a result CSV was recorded with, going by its file name."""
+    name = Path(csv_path).stem
+    if name.startswith("result-"):
+        name = name[len("result-"):]
+    path = os.path.join(profile_dir, name + ".yml")
+    return path if os.path.exists(path) else None
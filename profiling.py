@@ -0,0 +1,105 @@
+# per-stage wall time and peak traced memory of the analysis pipeline
+import cProfile
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+STAGE_PREFIXES = ("get_", "plot_", "write_")
+
+
+class Profiler:
+    """Times named, possibly nested stages.
+
+    Each stage's calls are summed: ``seconds`` includes nested stages,
+    ``selfSeconds`` does not. With ``memory`` the peak of memory traced by
+    tracemalloc above what was allocated when the stage began is kept too;
+    tracing slows Python down, so times taken with it are only comparable
+    with each other.
+    """
+
+    def __init__(self, memory=True, dump=None):
+        self.memory = memory
+        self.dump = dump
+        self.stats = {}
+        self.order = []
+        self._stack = []
+        self._cprofile = None
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.dump:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.dump)
+            self._cprofile = None
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # the enclosing stage keeps the peak seen so far before it is reset for this one
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        frame = {"start": time.perf_counter(), "children": 0.0, "base": current if tracing else 0, "peak": 0}
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame["start"]
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1]) if tracing else 0
+            if self._stack:
+                self._stack[-1]["children"] += elapsed
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+
+            if name not in self.stats:
+                self.stats[name] = {"calls": 0, "seconds": 0.0, "selfSeconds": 0.0, "peakMemory": 0}
+                self.order.append(name)
+            stats = self.stats[name]
+            stats["calls"] += 1
+            stats["seconds"] += elapsed
+            stats["selfSeconds"] += elapsed - frame["children"]
+            stats["peakMemory"] = max(stats["peakMemory"], peak - frame["base"])
+
+    def instrument(self, obj, prefixes=STAGE_PREFIXES):
+        """Time every method of ``obj`` whose name starts with one of ``prefixes`` as a stage of that name."""
+        for name in dir(obj):
+            method = getattr(obj, name)
+            if name.startswith(prefixes) and callable(method):
+                setattr(obj, name, self._timed(name, method))
+        return obj
+
+    def _timed(self, name, method):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return timed
+
+    def report(self) -> pd.DataFrame:
+        rows = [dict(stage=name, **self.stats[name]) for name in self.order]
+        return pd.DataFrame(rows, columns=["stage", "calls", "seconds", "selfSeconds", "peakMemory"])
+
+
+def print_report(report):
+    table = report.assign(peakMemory=report["peakMemory"] / (1024 * 1024)).rename(columns={"peakMemory": "peakMiB"})
+    print(table.to_string(index=False, float_format="{:.3f}".format))
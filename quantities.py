@@ -0,0 +1,54 @@
+# vectorized parsing of the kubernetes quantity strings found in result CSVs
+import re
+
+import numpy as np
+import pandas as pd
+
+CPU_SUFFIXES = {"": 1.0, "n": 1e-9, "u": 1e-6, "m": 1e-3}
+MEMORY_SUFFIXES = {
+    "": 1.0,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+    "Ki": 1024.0,
+    "Mi": 1024.0 ** 2,
+    "Gi": 1024.0 ** 3,
+}
+RATE_SUFFIXES = {"": 1.0, "n": 1e-9, "u": 1e-6, "m": 1e-3}
+
+QUANTITY_RE = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([A-Za-z]*)\s*$")
+
+
+def parse_quantity(values, suffixes: dict) -> np.ndarray:
+    """Convert quantities like ``102292649n`` or ``520276Ki`` to float64.
+
+    Missing values and unknown suffixes become NaN. Only the distinct
+    values are parsed, metric snapshots repeat on many consecutive rows.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.to_numpy(dtype="float64", na_value=np.nan)
+
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    parsed = np.full(len(uniques) + 1, np.nan)
+    for i, v in enumerate(uniques):
+        if isinstance(v, (int, float, np.number)):
+            parsed[i] = float(v)
+            continue
+        m = QUANTITY_RE.match(str(v))
+        if m and m.group(2) in suffixes:
+            parsed[i] = float(m.group(1)) * suffixes[m.group(2)]
+    # the NaN sentinel -1 indexes the trailing NaN slot
+    return parsed[codes]
+
+
+def cpu_cores(values) -> np.ndarray:
+    return parse_quantity(values, CPU_SUFFIXES)
+
+
+def memory_bytes(values) -> np.ndarray:
+    return parse_quantity(values, MEMORY_SUFFIXES)
+
+
+def invocation_rate(values) -> np.ndarray:
+    return parse_quantity(values, RATE_SUFFIXES)
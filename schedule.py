@@ -0,0 +1,316 @@
+# intended against achieved arrival schedule per run: send lag, shortfall, stalls and latency corrected for coordinated omission
+import os
+from argparse import ArgumentParser
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import FormatStrFormatter
+
+from autoscale import config_columns, offered_load, profile_origin
+from cache import load_run, result_files
+from profiles import arrival_times, artillery_steps, expected_arrivals, load_phases, load_profile, profile_for
+
+BUCKET = 10.0
+# a bucket short of more than this share of its intended requests is flagged ...
+SHORTFALL = 0.1
+# ... if it was meant to have at least this many
+MIN_INTENDED = 5
+# a pause in sending is a stall once the schedule meant to send this many requests in it
+STALL_REQUESTS = 5
+STALL_SECONDS = 1.0
+# a run is trustworthy with at least this share of its requests sent ...
+MIN_SENT = 0.95
+# ... sent at most this late at the p99 and this early at the p1 ...
+MAX_P99_LAG = 1.0
+MAX_P1_LEAD = 1.0
+# ... and at most this share of its buckets short
+MAX_SHORT_BUCKETS = 0.05
+DEFAULT_TIMEOUT = 120.0
+# an artillery request is matched to a slot at most this many seconds after it
+TOLERANCE = 2.0
+# seconds either way the profile's start is searched for on an artillery run
+ALIGN_SEARCH = 120.0
+
+
+def match_schedule(sent, intended, horizon, tolerance=TOLERANCE):
+    """The intended slot of each sent request, -1 for requests with none, and the slots never sent.
+
+    In order of sending, each request takes the nearest unused slot after
+    the last one taken, if that slot is at most ``tolerance`` seconds
+    ahead of it. A slot more than ``horizon`` seconds overdue was omitted,
+    and a request without a slot in reach is one the schedule did not
+    ask for, so neither shifts every later match.
+    """
+    sent = np.asarray(sent, dtype="float64")
+    order = np.argsort(sent, kind="mergesort")
+    times = sent[order]
+    nearest = np.searchsorted(intended, times, "left")
+    # the first slot not yet expired when each request goes out
+    expired = np.searchsorted(intended, times - horizon, "left")
+    slots = intended.tolist()
+    taken = np.full(len(sent), -1, dtype="int64")
+    free = 0
+    for k, (t, j, first) in enumerate(zip(times.tolist(), nearest.tolist(), expired.tolist())):
+        if 0 < j and (j == len(slots) or t - slots[j - 1] <= slots[j] - t):
+            j -= 1
+        j = max(j, free, first)
+        if j < len(slots) and slots[j] - t <= tolerance:
+            taken[k] = j
+            free = j + 1
+
+    slot = np.full(len(sent), -1, dtype="int64")
+    slot[order] = taken
+    omitted = np.ones(len(intended), dtype=bool)
+    omitted[taken[taken >= 0]] = False
+    return slot, omitted
+
+
+def align_origin(sent, phases, search=ALIGN_SEARCH, step=0.5):
+    """When the profile started, on the clock of ``sent``: the shift that best lines the sends up with the profile.
+
+    Artillery records no schedule, and its first requests say little
+    about when the profile started, so the origin is the one that puts
+    the count of requests sent closest to the count intended, on average
+    over the profile.
+    """
+    sent = np.sort(np.asarray(sent, dtype="float64"))
+    grid = np.arange(0.0, phases[-1]["end"], 1.0) if phases else np.zeros(1)
+    intended = expected_arrivals(phases, grid)
+    offsets = arrival_times(phases)
+    # searched around the origin the first request alone would give
+    first = sent[0] - (offsets[0] if len(offsets) else 0.0) if len(sent) else 0.0
+    shifts = first + np.arange(-search, search + step, step)
+    error = [np.abs(np.searchsorted(sent, grid + shift, "right") - intended).mean() for shift in shifts]
+    return shifts[int(np.argmin(error))]
+
+
+def schedule_requests(df, phases, horizon, tolerance=TOLERANCE):
+    """Per request: seconds since the profile started when it was meant and when it was sent, and its latencies.
+
+    Runs from loadgen.py record every request's ``scheduledTime``, so
+    their send lag is exact. Artillery runs are compared to the profile
+    as artillery runs it (profiles.artillery_steps): their evenly spaced
+    slots are matched to the sent requests, from an origin fitted to the
+    whole run. Within a ramp artillery sends at random, so their lag is
+    only an estimate, and a run that started late is indistinguishable
+    from one that did not. Also returns the phases compared against.
+    """
+    sent = df["requestTime"].to_numpy(dtype="float64")
+    exact = "scheduledTime" in df and df["scheduledTime"].notna().all()
+    if exact:
+        origin = profile_origin(df, phases)
+        intended = df["scheduledTime"].to_numpy(dtype="float64") - origin
+        slots = np.sort(intended)
+        omitted = np.zeros(0, dtype=bool)
+    else:
+        phases = artillery_steps(phases)
+        slots = arrival_times(phases)
+        origin = align_origin(sent, phases)
+        slot, omitted = match_schedule(sent - origin, slots, horizon, tolerance)
+        intended = np.where(slot >= 0, slots[np.maximum(slot, 0)], np.nan)
+    sent = sent - origin
+
+    latency = df["requestResponseLatency"].to_numpy(dtype="float64")
+    lag = sent - intended
+    requests = pd.DataFrame({
+        "sent": sent,
+        "intended": intended,
+        "lag": lag,
+        "latency": latency,
+        # time from when the request was meant to go out, never less than measured
+        "correctedLatency": latency + np.clip(np.nan_to_num(lag), 0, None),
+        "ok": (df["statusCode"] == 200).to_numpy(),
+    })
+    return requests.sort_values("sent", kind="mergesort").reset_index(drop=True), phases, slots, omitted, exact
+
+
+def intended_by(phases, slots, exact):
+    """Cumulative count of requests meant to be sent by each of the given times."""
+    if exact:
+        return lambda secs: np.searchsorted(slots, np.asarray(secs, dtype="float64"), "right").astype("float64")
+    return lambda secs: expected_arrivals(phases, secs)
+
+
+def find_stalls(sent, intended_by, stall_requests=STALL_REQUESTS, min_seconds=STALL_SECONDS) -> pd.DataFrame:
+    """Pauses between consecutive sends in which the schedule meant to send at least ``stall_requests``."""
+    sent = np.sort(sent)
+    if len(sent) < 2:
+        return pd.DataFrame(columns=["start", "end", "duration", "missed"])
+    missed = np.diff(intended_by(sent))
+    gap = np.diff(sent)
+    stalled = (missed >= stall_requests) & (gap >= min_seconds)
+    return pd.DataFrame({
+        "start": sent[:-1][stalled],
+        "end": sent[1:][stalled],
+        "duration": gap[stalled],
+        "missed": missed[stalled],
+    })
+
+
+def schedule_buckets(requests, phases, intended_by, width=BUCKET) -> pd.DataFrame:
+    """Intended and achieved sends, send lag and raw and corrected latency per bucket of ``width`` seconds."""
+    end = max(phases[-1]["end"] if phases else 0.0, requests["sent"].max() if len(requests) else 0.0)
+    edges = np.arange(0.0, end + width, width)
+    intended = np.diff(intended_by(edges))
+    index = np.clip(np.searchsorted(edges, requests["sent"].to_numpy(), "right") - 1, 0, len(edges) - 2)
+    by = requests.assign(bucket=index).groupby("bucket")
+    achieved = by.size().reindex(range(len(edges) - 1), fill_value=0).to_numpy()
+
+    def quantile(col, q):
+        return by[col].quantile(q).reindex(range(len(edges) - 1)).to_numpy()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shortfall = np.where(intended > 0, 1 - achieved / intended, 0.0)
+    return pd.DataFrame({
+        "start": edges[:-1],
+        "intended": intended,
+        "achieved": achieved,
+        "intendedRate": intended / width,
+        "achievedRate": achieved / width,
+        "shortfall": shortfall,
+        "short": (intended >= MIN_INTENDED) & (shortfall > SHORTFALL),
+        "p95Lag": quantile("lag", 0.95),
+        "p95Latency": quantile("latency", 0.95),
+        "p95CorrectedLatency": quantile("correctedLatency", 0.95),
+    })
+
+
+def verdict(summary):
+    """Whether the run's latencies can be trusted, and why not.
+
+    Send lag only counts for runs with an exact schedule; for artillery
+    runs it is bounded by the matching and says little.
+    """
+    reasons = []
+    if summary["sentShare"] < MIN_SENT:
+        reasons.append("sent {:.0%} of the intended requests".format(summary["sentShare"]))
+    if summary["exact"] and summary["p99Lag"] > MAX_P99_LAG:
+        reasons.append("p99 send lag {:.1f}s".format(summary["p99Lag"]))
+    if summary["exact"] and summary["p1Lag"] < -MAX_P1_LEAD:
+        reasons.append("ahead of schedule, p1 send lag {:.1f}s".format(summary["p1Lag"]))
+    if summary["shortBuckets"] > MAX_SHORT_BUCKETS:
+        reasons.append("{:.0%} of buckets short".format(summary["shortBuckets"]))
+    if summary["stalls"]:
+        reasons.append("{} stalls, longest {:.1f}s".format(summary["stalls"], summary["longestStall"]))
+    return not reasons, reasons
+
+
+def analyse(df, phases, horizon=DEFAULT_TIMEOUT, width=BUCKET, tolerance=TOLERANCE):
+    """Requests, buckets, stalls and summary of a run, and the phases it was compared against."""
+    requests, phases, slots, omitted, exact = schedule_requests(df, phases, horizon, tolerance)
+    intended_at = intended_by(phases, slots, exact)
+    buckets = schedule_buckets(requests, phases, intended_at, width)
+    stalls = find_stalls(requests["sent"].to_numpy(), intended_at)
+
+    lag = requests["lag"].dropna()
+    if exact:
+        intended = float(len(slots))
+    else:
+        intended = float(expected_arrivals(phases, [phases[-1]["end"]])[0]) if phases else float(len(requests))
+    considered = buckets[buckets["intended"] >= MIN_INTENDED]
+    summary = {
+        "exact": exact,
+        "intended": intended,
+        "sent": len(requests),
+        "sentShare": len(requests) / intended if intended else 1.0,
+        "omitted": int(omitted.sum()),
+        "p1Lag": float(lag.quantile(0.01)) if len(lag) else np.nan,
+        "p50Lag": float(lag.quantile(0.5)) if len(lag) else np.nan,
+        "p99Lag": float(lag.quantile(0.99)) if len(lag) else np.nan,
+        "maxLag": float(lag.max()) if len(lag) else np.nan,
+        "shortBuckets": float(considered["short"].mean()) if len(considered) else 0.0,
+        "stalls": len(stalls),
+        "longestStall": float(stalls["duration"].max()) if len(stalls) else 0.0,
+        "missedInStalls": float(stalls["missed"].sum()),
+    }
+    ok = requests[requests["ok"]]
+    for q in (0.5, 0.95, 0.99):
+        name = "p{}".format(int(q * 100))
+        summary[name] = float(ok["latency"].quantile(q)) if len(ok) else np.nan
+        summary[name + "Corrected"] = float(ok["correctedLatency"].quantile(q)) if len(ok) else np.nan
+    summary["trusted"], reasons = verdict(summary)
+    summary["reasons"] = "; ".join(reasons)
+    return requests, buckets, stalls, summary, phases
+
+
+def plot_schedule(buckets, stalls, phases, folder, name="Arrival Schedule"):
+    fig, ax = plt.subplots(3, 1, figsize=(16,11), sharex=True)
+    t = buckets["start"]
+
+    grid = np.linspace(0, t.iloc[-1] + (t.iloc[1] - t.iloc[0] if len(t) > 1 else BUCKET), 2000)
+    ax[0].plot(grid, offered_load(phases, grid), label='Intended (profile)')
+    ax[0].step(t, buckets["achievedRate"], where='post', label='Achieved (sent)')
+    short = buckets["short"].to_numpy()
+    ax[0].fill_between(t, 0, buckets["intendedRate"].max(), where=short, step='post', alpha=0.2, color='tab:red', label='Short of schedule')
+    ax[0].set_ylabel('Requests per second')
+    ax[0].set_title('Intended and achieved arrival rate')
+
+    ax[1].step(t, buckets["p95Lag"], where='post', label='p95 send lag')
+    for e, s in stalls.iterrows():
+        ax[1].axvspan(s["start"], s["end"], color='tab:red', alpha=0.3, label='Stall' if e == 0 else None)
+    ax[1].set_ylabel('Seconds behind schedule')
+    ax[1].set_title('Send lag')
+
+    ax[2].step(t, buckets["p95Latency"], where='post', label='p95 latency as measured')
+    ax[2].step(t, buckets["p95CorrectedLatency"], where='post', label='p95 latency from intended send time')
+    ax[2].set_ylabel('Latency (in seconds)')
+    ax[2].set_title('Latency corrected for coordinated omission')
+
+    for a in ax:
+        a.legend(loc='best')
+        a.xaxis.set_major_formatter(FormatStrFormatter('%d sec'))
+        for p in phases:
+            a.axvline(p["start"], color='grey', linestyle=':', linewidth=0.8)
+    ax[-1].set_xlabel('Time in seconds since the start of the profile')
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(folder, '{}.png'.format(name.lower().replace(" ","_"))))
+    plt.close(fig)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("results", nargs="+", help="result CSVs or directories of them")
+    parser.add_argument("-o", "--output", default="schedule", help="directory to write tables and plots to")
+    parser.add_argument("--bucket", type=float, default=BUCKET, help="seconds per bucket")
+    parser.add_argument("--horizon", type=float, help="seconds overdue after which an unsent request counts as omitted (default: the profile's http timeout)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="seconds ahead of an artillery request its slot may be")
+    args = parser.parse_args()
+
+    files = result_files(args.results)
+    runs = []
+    for e, file in enumerate(files):
+        profile = profile_for(file)
+        if not profile:
+            print("[!] {}/{}: {}: no load profile named like it, skipping".format(e + 1, len(files), file))
+            continue
+        phases = load_phases(profile)
+        timeout = load_profile(profile)["config"].get("http", {}).get("timeout", DEFAULT_TIMEOUT)
+        requests, buckets, stalls, summary, phases = analyse(load_run(file).frame(), phases, args.horizon or timeout, args.bucket, args.tolerance)
+
+        folder = os.path.join(args.output, os.path.splitext(file)[0])
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        buckets.to_csv(os.path.join(folder, "schedule.csv"), index=False)
+        stalls.to_csv(os.path.join(folder, "stalls.csv"), index=False)
+        plot_schedule(buckets, stalls, phases, folder)
+
+        config = Path(file).parent.name
+        runs.append(dict(config=config, **config_columns(config), profile=Path(file).stem, **summary))
+        print("[{}] {}/{}: {}: {}".format("*" if summary["trusted"] else "!", e + 1, len(files), file,
+            "on schedule" if summary["trusted"] else "NOT TRUSTWORTHY: " + summary["reasons"]))
+
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    summary = pd.DataFrame(runs)
+    summary.to_csv(os.path.join(args.output, "schedule_summary.csv"), index=False)
+    if len(summary):
+        columns = ["config", "profile", "sentShare", "p99Lag", "stalls", "p99", "p99Corrected", "trusted"]
+        print(summary[columns].to_string(index=False, float_format="{:.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+# discrete-event simulation of the OpenFaaS gateway, function pods and HPA under a load profile
+import heapq
+import math
+import os
+import re
+import time
+import uuid
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiles import arrival_times, load_phases
+
+MIB = 1024 ** 2
+GIB = 1024 ** 3
+
+# results directories are named <nodes>-<droplet size>-<minReplicas>-<maxReplicas>-<averageValue>
+CONFIG_RE = re.compile(r"^(\d+)-(s-(\d+)vcpu-(\d+)gb)-(\d+)-(\d+)-([\d.]+)$")
+
+DEFAULTS = {
+    "start_time": 1600000000.0,
+    # kube-proxy to the pod, fork of the classic watchdog and interpreter start
+    "dispatch_delay": 0.6,
+    "pod_startup": 8.0,
+    "exec_timeout": 120.0,
+    "node_reserved_memory": 512 * MIB,
+    "node_base_memory": 420 * MIB,
+    "node_base_cpu": 0.04,
+    "pod_memory": 10 * MIB,
+    "exec_memory": 150 * MIB,
+    "max_pods_per_node": 110,
+    # HPA defaults: sync period, tolerance, scale-down stabilization, scale-up policy
+    "sync_period": 15.0,
+    "tolerance": 0.1,
+    "stabilization_window": 300.0,
+    "scale_up_pods": 4,
+    "scale_up_percent": 100,
+    # prometheus-adapter-values.yml: rate(gateway_function_invocation_started[15s])
+    "rate_window": 15.0,
+    "metrics_resolution": 15.0,
+}
+
+
+def parse_config(name) -> dict:
+    """Cluster and HPA settings from a results directory name like 10-s-2vcpu-2gb-10-100-0.1."""
+    match = CONFIG_RE.match(name)
+    if not match:
+        raise ValueError("cannot parse configuration {!r}, expected e.g. 10-s-2vcpu-2gb-10-100-0.1".format(name))
+    nodes, size, vcpu, memory, min_replicas, max_replicas, target = match.groups()
+    return {
+        "name": name,
+        "nodes": int(nodes),
+        "size": size,
+        "vcpu": int(vcpu),
+        "memory": int(memory) * GIB,
+        "min_replicas": int(min_replicas),
+        "max_replicas": int(max_replicas),
+        "target": float(target),
+    }
+
+
+def service_times(files, n, rng) -> np.ndarray:
+    """Uncontended execution times, resampled from successful executions of result CSVs."""
+    samples = []
+    for file in files:
+        df = pd.read_csv(file, usecols=["statusCode", "executionLatency"])
+        samples.append(df.loc[df["statusCode"] == 200, "executionLatency"].dropna().to_numpy())
+    samples = np.concatenate(samples) if samples else np.zeros(0)
+    if not len(samples):
+        raise ValueError("no successful executions to sample execution times from")
+    return rng.choice(samples, n)
+
+
+class Node:
+    """A worker node whose cores are shared equally by the executions running on it.
+
+    Processor sharing is tracked with a virtual clock that advances at
+    min(1, vcpu / running) per second; an execution needing ``work``
+    seconds of a core finishes when the clock has advanced by ``work``.
+    """
+
+    def __init__(self, name, host_id, vcpu, capacity):
+        self.name = name
+        self.host_id = host_id
+        self.vcpu = vcpu
+        self.capacity = capacity
+        self.pods = 0
+        self.running = {}
+        self.finishes = []
+        self.clock = 0.0
+        self.busy = 0.0
+        self.last = 0.0
+        self.version = 0
+
+    def rate(self):
+        return min(1.0, self.vcpu / len(self.running)) if self.running else 1.0
+
+    def advance(self, now):
+        dt = now - self.last
+        if self.running:
+            self.clock += dt * self.rate()
+            self.busy += dt * min(len(self.running), self.vcpu)
+        self.last = now
+
+    def next_finish(self, now):
+        while self.finishes and self.finishes[0][1] not in self.running:
+            heapq.heappop(self.finishes)
+        if not self.finishes:
+            return None
+        return now + max(self.finishes[0][0] - self.clock, 0.0) / self.rate()
+
+
+class Simulator:
+    def __init__(self, config, arrivals, work, params, rng):
+        self.config = config
+        self.params = params
+        self.rng = rng
+        self.arrivals = arrivals
+        self.work = work
+
+        capacity = config["memory"] - params["node_reserved_memory"]
+        pool = "{}-{}-default-pool".format(config["size"], config["nodes"])
+        self.nodes = [
+            Node("{}-{:05x}".format(pool, e), int(params["start_time"]) - 7200 + e, config["vcpu"], capacity)
+            for e in range(config["nodes"])
+        ]
+        self.node_usage = {node.name: (params["node_base_cpu"], self.node_memory(node)) for node in self.nodes}
+        self.last_busy = [0.0] * len(self.nodes)
+
+        self.events = []
+        self.sequence = 0
+        self.pods = {}
+        self.ready = []
+        self.recommendations = []
+        self.started = []
+        self.invocation_rate = None
+        self.waiting = []
+        self.jobs = {}
+        self.rows = []
+
+    def uuid(self):
+        return str(uuid.UUID(int=int(self.rng.integers(0, 2 ** 63)) << 64 | int(self.rng.integers(0, 2 ** 63)), version=4))
+
+    def schedule(self, at, kind, *payload):
+        self.sequence += 1
+        heapq.heappush(self.events, (at, self.sequence, kind, payload))
+
+    def node_memory(self, node):
+        p = self.params
+        return p["node_base_memory"] + node.pods * p["pod_memory"] + len(node.running) * p["exec_memory"]
+
+    def reschedule(self, node, now):
+        node.version += 1
+        at = node.next_finish(now)
+        if at is not None:
+            self.schedule(at, "finish", node, node.version)
+
+    # pods
+
+    def add_pod(self, now, ready_at):
+        node = min((n for n in self.nodes if n.pods < self.params["max_pods_per_node"]), key=lambda n: n.pods, default=None)
+        if node is None:
+            return
+        node.pods += 1
+        pod = {"id": self.uuid(), "node": node, "ready": False}
+        self.pods[pod["id"]] = pod
+        self.schedule(ready_at, "ready", pod)
+
+    def remove_pod(self):
+        # the newest pods go first, not-ready ones before ready ones
+        pod = next((p for p in reversed(list(self.pods.values())) if not p["ready"]), None)
+        if pod is None:
+            pod = self.ready.pop()
+        pod["node"].pods -= 1
+        pod["ready"] = False
+        del self.pods[pod["id"]]
+
+    def on_ready(self, now, pod):
+        if pod["id"] not in self.pods:
+            return
+        pod["ready"] = True
+        self.ready.append(pod)
+        waiting, self.waiting = self.waiting, []
+        for request in waiting:
+            self.dispatch(now, request)
+
+    # requests
+
+    def on_arrival(self, now, request):
+        # the gateway counts the invocation as started whether or not a pod is ready for it
+        self.started.append(now)
+        if not self.ready:
+            self.waiting.append(request)
+            return
+        self.dispatch(now, request)
+
+    def dispatch(self, now, request):
+        pod = self.ready[int(self.rng.integers(len(self.ready)))]
+        self.schedule(now + self.params["dispatch_delay"], "start", request, pod)
+
+    def on_start(self, now, request, pod):
+        node = pod["node"]
+        node.advance(now)
+        job = {
+            "request": request,
+            "pod": pod,
+            "node": node,
+            "start": now,
+            # an execution that does not fit in the node's memory is killed eventually
+            "oom": self.node_memory(node) + self.params["exec_memory"] > node.capacity,
+        }
+        self.jobs[request] = job
+        node.running[request] = job
+        heapq.heappush(node.finishes, (node.clock + self.work[request], request))
+        self.schedule(now + self.params["exec_timeout"], "timeout", request)
+        self.reschedule(node, now)
+
+    def on_finish(self, now, node, version):
+        if version != node.version:
+            return
+        node.advance(now)
+        while node.finishes and node.finishes[0][0] <= node.clock + 1e-9:
+            _, request = heapq.heappop(node.finishes)
+            job = node.running.pop(request, None)
+            if job is not None:
+                self.complete(now, job, 500 if job["oom"] else 200)
+        self.reschedule(node, now)
+
+    def on_timeout(self, now, request):
+        job = self.jobs.get(request)
+        if job is None or request not in job["node"].running:
+            return
+        job["node"].advance(now)
+        del job["node"].running[request]
+        self.complete(now, job, 500)
+        self.reschedule(job["node"], now)
+
+    def complete(self, now, job, status):
+        request = job["request"]
+        del self.jobs[request]
+        row = {"request": request, "statusCode": status, "responseTime": now}
+        if status == 200:
+            row.update({
+                "executionStartTime": job["start"],
+                "executionEndTime": now,
+                "containerId": job["pod"]["id"],
+                "hostId": job["node"].host_id,
+            })
+        self.rows.append(row)
+
+    # control loops
+
+    def on_sync(self, now):
+        p, c = self.params, self.config
+        window = p["rate_window"]
+        recent = len(self.started) - np.searchsorted(self.started, now - window, "right")
+        self.invocation_rate = recent / window
+
+        current = len(self.pods)
+        ratio = self.invocation_rate / (c["target"] * current) if current else 0.0
+        desired = current if abs(ratio - 1) <= p["tolerance"] else math.ceil(self.invocation_rate / c["target"])
+        desired = min(max(desired, c["min_replicas"]), c["max_replicas"])
+
+        self.recommendations.append((now, desired))
+        self.recommendations = [(t, d) for t, d in self.recommendations if t > now - p["stabilization_window"]]
+        if desired < current:
+            desired = min(current, max(d for _, d in self.recommendations))
+        else:
+            limit = max(current + p["scale_up_pods"], current * (100 + p["scale_up_percent"]) // 100)
+            desired = min(desired, limit)
+
+        for _ in range(desired - current):
+            self.add_pod(now, now + p["pod_startup"])
+        for _ in range(current - desired):
+            self.remove_pod()
+
+        if self.events:
+            self.schedule(now + p["sync_period"], "sync")
+
+    def on_sample(self, now):
+        resolution = self.params["metrics_resolution"]
+        for e, node in enumerate(self.nodes):
+            node.advance(now)
+            cpu = self.params["node_base_cpu"] + (node.busy - self.last_busy[e]) / resolution
+            self.last_busy[e] = node.busy
+            self.node_usage[node.name] = (cpu, self.node_memory(node))
+        self.sample_rows(now)
+        if self.events:
+            self.schedule(now + resolution, "sample")
+
+    def sample_rows(self, now):
+        # requests answered since the last sample see this sample's cluster metrics
+        for row in self.rows[self.sampled:]:
+            row["replicas"] = len(self.ready)
+            row["nodes"] = dict(self.node_usage)
+            row["functionInvocationRate"] = self.invocation_rate
+        self.sampled = len(self.rows)
+
+    def run(self):
+        for _ in range(self.config["min_replicas"]):
+            self.add_pod(0.0, 0.0)
+        for request, at in enumerate(self.arrivals):
+            self.schedule(at, "arrival", request)
+        self.schedule(0.0, "sync")
+        self.schedule(0.0, "sample")
+        self.sampled = 0
+
+        handlers = {
+            "arrival": self.on_arrival,
+            "ready": self.on_ready,
+            "start": self.on_start,
+            "finish": self.on_finish,
+            "timeout": self.on_timeout,
+            "sync": self.on_sync,
+            "sample": self.on_sample,
+        }
+        while self.events:
+            now, _, kind, payload = heapq.heappop(self.events)
+            handlers[kind](now, *payload)
+            # stop the control loops once every request is answered
+            if len(self.rows) == len(self.arrivals):
+                self.sample_rows(now)
+                break
+        return self.frame()
+
+    def frame(self) -> pd.DataFrame:
+        """The answered requests in metrics.js's CSV layout and units, in order of response."""
+        start = self.params["start_time"]
+        records = []
+        for row in self.rows:
+            request = row["request"]
+            request_time = start + self.arrivals[request]
+            record = {}
+            if row["statusCode"] == 200:
+                record.update({
+                    "executionStartTime": start + row["executionStartTime"],
+                    "executionEndTime": start + row["executionEndTime"],
+                    "executionLatency": row["executionEndTime"] - row["executionStartTime"],
+                    "containerId": row["containerId"],
+                    "hostId": row["hostId"],
+                })
+            record.update({
+                "statusCode": row["statusCode"],
+                "requestResponseLatency": row["responseTime"] - self.arrivals[request],
+                "requestTime": request_time,
+                "responseTime": start + row["responseTime"],
+                "requestId": self.uuid(),
+                "replicas": row["replicas"],
+            })
+            for name, (cpu, memory) in row["nodes"].items():
+                record[name + "CpuUsage"] = "{}n".format(int(cpu * 1e9))
+                record[name + "MemoryUsage"] = "{}Ki".format(int(memory // 1024))
+            rate = row["functionInvocationRate"]
+            record["functionInvocationRate"] = None if rate is None else "{}m".format(int(round(rate * 1000)))
+            if row["statusCode"] == 200:
+                record["schedulingLatency"] = record["executionStartTime"] - request_time
+            records.append(record)
+
+        columns = ["executionStartTime", "executionEndTime", "executionLatency", "containerId", "hostId",
+                   "statusCode", "requestResponseLatency", "requestTime", "responseTime", "requestId", "replicas"]
+        for node in self.nodes:
+            columns += [node.name + "CpuUsage", node.name + "MemoryUsage"]
+        columns += ["functionInvocationRate", "schedulingLatency"]
+        return pd.DataFrame.from_records(records, columns=columns)
+
+
+def simulate(config, profile, latency_from, poisson=False, seed=0, **overrides) -> pd.DataFrame:
+    params = dict(DEFAULTS, **{k: v for k, v in overrides.items() if v is not None})
+    rng = np.random.default_rng(seed)
+    arrivals = arrival_times(load_phases(profile), poisson, rng)
+    work = service_times(latency_from, len(arrivals), rng)
+    return Simulator(config, arrivals, work, params, rng).run()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("config", help="configuration as in results directory names, e.g. 10-s-2vcpu-2gb-10-100-0.1")
+    parser.add_argument("profile", help="load-generator/*.yml profile")
+    parser.add_argument("--latency-from", nargs="+", required=True, help="result CSVs to resample execution times from")
+    parser.add_argument("-o", "--output", default="results-sim", help="results directory to write <config>/<profile>.csv to")
+    parser.add_argument("--poisson", action="store_true", help="Poisson instead of evenly spaced arrivals")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-replicas", type=int)
+    parser.add_argument("--max-replicas", type=int)
+    parser.add_argument("--target", type=float, help="HPA averageValue of the invocation rate per pod")
+    parser.add_argument("--pod-startup", type=float, help="seconds from scale-up to a ready pod")
+    parser.add_argument("--dispatch-delay", type=float, help="seconds from request to execution start")
+    parser.add_argument("--exec-memory", type=float, help="MiB used by one running execution")
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    for key in ("min_replicas", "max_replicas", "target"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    name = "{nodes}-{size}-{min_replicas}-{max_replicas}-{target:g}".format(**config)
+
+    started = time.perf_counter()
+    df = simulate(
+        config, args.profile, args.latency_from, args.poisson, args.seed,
+        pod_startup=args.pod_startup,
+        dispatch_delay=args.dispatch_delay,
+        exec_memory=args.exec_memory * MIB if args.exec_memory is not None else None,
+    )
+
+    folder = os.path.join(args.output, name)
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(folder, Path(args.profile).stem + ".csv")
+    df.to_csv(path, index=False)
+    failed = (df["statusCode"] != 200).sum()
+    print("[*] {}: {} requests, {} failed, simulated in {:.2f}s".format(path, len(df), failed, time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    main()
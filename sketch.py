@@ -0,0 +1,110 @@
+# mergeable quantile sketch: a log-bucketed histogram with bounded relative error
+import numpy as np
+
+
+class LogHistogram:
+    """Counts of values in logarithmic bins, one histogram per row.
+
+    Every quantile is within ``accuracy`` relative error of the exact one
+    for magnitudes in [min_value, max_value]; smaller magnitudes count as
+    zero. Negative values are kept in mirrored bins. Only occupied bins are
+    stored, as sorted flat ``row * width + bin`` keys with their counts.
+    Sketches with the same parameters merge by adding counts, so per-bucket
+    sketches combine into whole-run ones.
+    """
+
+    def __init__(self, rows=1, accuracy=0.01, min_value=1e-4, max_value=1e4):
+        self.rows = rows
+        self.accuracy = accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.offset = int(np.floor(np.log(min_value) / np.log(self.gamma)))
+        self.nbins = int(np.ceil(np.log(max_value) / np.log(self.gamma))) - self.offset + 1
+
+        # layout: negative bins by decreasing magnitude, the zero bin, positive bins
+        magnitudes = 2 * self.gamma ** (np.arange(self.nbins) + self.offset) / (self.gamma + 1)
+        self.values = np.concatenate([-magnitudes[::-1], [0.0], magnitudes])
+        self.width = len(self.values)
+
+        self.keys = np.zeros(0, dtype="int64")
+        self.weights = np.zeros(0, dtype="int64")
+        self.min = np.full(rows, np.inf)
+        self.max = np.full(rows, -np.inf)
+
+    def _like(self, rows):
+        return LogHistogram(rows, self.accuracy, self.min_value, self.max_value)
+
+    def bin_of(self, values) -> np.ndarray:
+        magnitude = np.clip(np.abs(values), self.min_value, self.max_value)
+        k = np.ceil(np.log(magnitude) / np.log(self.gamma)).astype("int64") - self.offset
+        k = np.clip(k, 0, self.nbins - 1)
+        return np.where(
+            np.abs(values) < self.min_value,
+            self.nbins,
+            np.where(values > 0, self.nbins + 1 + k, self.nbins - 1 - k),
+        )
+
+    def _insert(self, keys, weights):
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.weights = np.bincount(inverse, weights=np.concatenate([self.weights, weights]), minlength=len(keys)).astype("int64")
+        self.keys = keys
+
+    def add(self, values, rows=None):
+        values = np.asarray(values, dtype="float64")
+        rows = np.zeros(len(values), dtype="int64") if rows is None else np.asarray(rows, dtype="int64")
+        keep = ~np.isnan(values)
+        values, rows = values[keep], rows[keep]
+        if not len(values):
+            return
+
+        self._insert(rows * self.width + self.bin_of(values), np.ones(len(values), dtype="int64"))
+        np.minimum.at(self.min, rows, values)
+        np.maximum.at(self.max, rows, values)
+
+    def merge(self, other):
+        self._insert(other.keys, other.weights)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def total(self):
+        """All rows merged into a single-row sketch."""
+        merged = self._like(1)
+        merged._insert(self.keys % self.width, self.weights)
+        merged.min[0] = self.min.min(initial=np.inf)
+        merged.max[0] = self.max.max(initial=-np.inf)
+        return merged
+
+    def count(self) -> np.ndarray:
+        return np.bincount(self.keys // self.width, weights=self.weights, minlength=self.rows).astype("int64")
+
+    def positive_bins(self, factor=1):
+        """Bin edges and rows x bins counts of the positive values, merging ``factor`` bins."""
+        rows = self.keys // self.width
+        k = self.keys % self.width - (self.nbins + 1)
+        keep = k >= 0
+        groups = (self.nbins + factor - 1) // factor
+
+        counts = np.zeros((self.rows, groups), dtype="int64")
+        np.add.at(counts, (rows[keep], k[keep] // factor), self.weights[keep])
+        edges = self.gamma ** (np.arange(groups + 1) * factor + self.offset - 1)
+        return edges, counts
+
+    def quantile(self, q) -> np.ndarray:
+        """The q-quantile of every row, NaN for empty rows."""
+        n = self.count()
+        if q <= 0 or q >= 1:
+            value = self.min if q <= 0 else self.max
+            return np.where(n == 0, np.nan, value)
+
+        # keys are sorted by row then bin, so one running total serves every row
+        cumulative = np.cumsum(self.weights)
+        before = np.cumsum(n) - n
+        rank = np.floor(q * np.maximum(n - 1, 0))
+        at = np.searchsorted(cumulative, before + rank, "right")
+        at = np.minimum(at, max(len(self.keys) - 1, 0))
+
+        value = self.values[self.keys[at] % self.width] if len(self.keys) else np.zeros(self.rows)
+        value = np.clip(value, self.min, self.max)
+        return np.where(n == 0, np.nan, value)
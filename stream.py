@@ -0,0 +1,270 @@
+# bounded-memory aggregation of result CSVs read in chunks
+import numpy as np
+import pandas as pd
+
+from aggregate import EXECUTION_COLUMNS, LATENCY_COLUMNS, MIB, Aggregator, bucket_index, elapsed_seconds
+from lifecycle import ContainerFold
+from quantities import cpu_cores, invocation_rate, memory_bytes
+from sketch import LogHistogram
+
+CHUNKSIZE = 100000
+
+
+def time_range(file, chunksize=CHUNKSIZE):
+    """First and last requestTime of a result CSV, reading only that column."""
+    first, last = np.inf, -np.inf
+    for chunk in pd.read_csv(file, usecols=["requestTime"], chunksize=chunksize):
+        first = min(first, chunk["requestTime"].min())
+        last = max(last, chunk["requestTime"].max())
+    return first, last
+
+
+class StreamAggregator(Aggregator):
+    """Aggregator fed chunk by chunk, keeping running per-bucket accumulators only.
+
+    Memory grows with the number of buckets (and containers), not with the
+    number of requests. Container lifecycles are folded in as executions
+    arrive (lifecycle.ContainerFold), which holds back only the executions
+    of the last few minutes of responses.
+    """
+
+    def begin(self, columns, request_start_time):
+        n = len(self.edges)
+        self.df = pd.DataFrame(columns=columns)
+        self.request_start_time = request_start_time
+
+        self._counts = np.zeros(n, dtype="int64")
+        self._ok = np.zeros(n, dtype="int64")
+        self._latency = {}
+        for col in LATENCY_COLUMNS:
+            self._latency[col] = {
+                "sum": np.zeros(n),
+                "count": np.zeros(n, dtype="int64"),
+                "sketch": LogHistogram(n),
+            }
+        self._replicas = [np.zeros(n), np.zeros(n, dtype="int64")]
+        self._rate = [np.zeros(n), np.zeros(n, dtype="int64")]
+        self._nodes = {col: [np.zeros(n), np.zeros(n, dtype="int64")] for col in columns if col.endswith(("CpuUsage", "MemoryUsage"))}
+
+        self._pairs = {}
+        self._pair_hosts = []
+        self._hosts = set()
+        self._float_hosts = False
+        self._live = [set() for _ in range(n)]
+        self._fold = ContainerFold(self.interval)
+        self._timeline = []
+        self._last_replicas = np.nan
+        self._containers = None
+        self._container_stats = None
+
+    def grow(self, end):
+        """Extend the bucket grid to cover ``end`` seconds, for runs whose length is not known up front."""
+        n = len(self.edges)
+        start = self.edges[0] if n else 0
+        if start + n * self.interval > end:
+            return
+        extra = int((end - start) // self.interval) + 1 - n
+        df = self.df
+        # the grid, buckets and midpoints as if the aggregator had been made this long
+        Aggregator.__init__(self, start, start + (n + extra) * self.interval, self.interval)
+        self.df = df
+        pad = lambda a: np.concatenate([a, np.zeros(extra, dtype=a.dtype)])
+
+        self._counts, self._ok = pad(self._counts), pad(self._ok)
+        for acc in self._latency.values():
+            acc["sum"], acc["count"] = pad(acc["sum"]), pad(acc["count"])
+            # keys are row * width + bin, so existing rows keep theirs
+            sketch = acc["sketch"]
+            sketch.rows += extra
+            sketch.min = np.concatenate([sketch.min, np.full(extra, np.inf)])
+            sketch.max = np.concatenate([sketch.max, np.full(extra, -np.inf)])
+        for acc in [self._replicas, self._rate] + list(self._nodes.values()):
+            acc[0], acc[1] = pad(acc[0]), pad(acc[1])
+        self._live.extend(set() for _ in range(extra))
+        self._containers = None
+        self._container_stats = None
+
+    def _accumulate(self, acc, values, mask):
+        mask = mask & (self.index >= 0)
+        acc[0] += np.bincount(self.index[mask], weights=values[mask], minlength=len(self.edges))
+        acc[1] += np.bincount(self.index[mask], minlength=len(self.edges))
+
+    def add_chunk(self, chunk):
+        n = len(self.edges)
+        self.index = bucket_index(elapsed_seconds(chunk["requestTime"], self.request_start_time), self.edges[0] if n else 0, self.interval, n)
+        valid = self.index >= 0
+        idx = self.index[valid]
+
+        self._counts += np.bincount(idx, minlength=n)
+        ok = (chunk["statusCode"] == 200).to_numpy()
+        self._ok += np.bincount(self.index[valid & ok], minlength=n)
+
+        for col, acc in self._latency.items():
+            if col not in chunk:
+                continue
+            values = chunk[col].to_numpy(dtype="float64", na_value=np.nan)
+            self._accumulate([acc["sum"], acc["count"]], values, ok)
+            acc["sketch"].add(values[valid & ok], self.index[valid & ok])
+
+        if "replicas" in chunk:
+            values = chunk["replicas"].to_numpy(dtype="float64", na_value=np.nan)
+            self._accumulate(self._replicas, values, np.ones(len(chunk), dtype=bool))
+        if "functionInvocationRate" in chunk:
+            values = invocation_rate(chunk["functionInvocationRate"])
+            self._accumulate(self._rate, values, ~np.isnan(values))
+        for col, acc in self._nodes.items():
+            values = cpu_cores(chunk[col]) if col.endswith("CpuUsage") else memory_bytes(chunk[col]) / MIB
+            self._accumulate(acc, values, ~np.isnan(values))
+
+        if set(EXECUTION_COLUMNS) <= set(chunk.columns):
+            self._add_live_containers(chunk)
+            self._add_executions(chunk, ok)
+        self._containers = None
+        self._container_stats = None
+
+        if "replicas" in chunk:
+            # only the changes of the replicas metric, in order of response
+            timeline = chunk[["responseTime", "replicas"]].dropna()
+            values = timeline["replicas"].to_numpy(dtype="float64")
+            changed = np.diff(values, prepend=self._last_replicas) != 0
+            if len(values):
+                self._last_replicas = values[-1]
+            self._timeline.append((elapsed_seconds(timeline["responseTime"].to_numpy()[changed], self.request_start_time), values[changed]))
+
+    def _add_executions(self, chunk, ok):
+        executed = ok & (chunk["containerId"].notna() & chunk["executionStartTime"].notna()).to_numpy()
+        self._fold.add(
+            chunk["containerId"].to_numpy()[executed],
+            chunk["hostId"].to_numpy()[executed],
+            elapsed_seconds(chunk["executionStartTime"].to_numpy()[executed], self.request_start_time),
+            elapsed_seconds(chunk["executionEndTime"].to_numpy()[executed], self.request_start_time),
+            self.index[executed],
+            elapsed_seconds([chunk["responseTime"].max()], self.request_start_time)[0],
+        )
+
+    @staticmethod
+    def _host_key(host):
+        # chunks with missing hostIds read them as floats, keep one key per host
+        if isinstance(host, (float, np.floating)) and float(host).is_integer():
+            return int(host)
+        return host
+
+    def _add_live_containers(self, chunk):
+        mid = np.asarray(self.midpoints)
+        rows = pd.DataFrame({
+            "hostId": chunk["hostId"].to_numpy(),
+            "containerId": chunk["containerId"].to_numpy(),
+            "start": elapsed_seconds(chunk["executionStartTime"], self.request_start_time),
+            "end": elapsed_seconds(chunk["executionEndTime"], self.request_start_time),
+        })[self.index >= 0].dropna()
+        rows = rows[rows["start"] <= rows["end"]]
+        # every host that executed anything gets a series, as in the batch path, keyed the way it reads the column
+        self._float_hosts |= chunk["hostId"].dtype.kind == "f"
+        self._hosts.update(self._host_key(h) for h in rows["hostId"].unique())
+
+        lo = np.searchsorted(mid, rows["start"].to_numpy(), "left")
+        hi = np.searchsorted(mid, rows["end"].to_numpy(), "right")
+        covered = hi > lo
+        if not covered.any():
+            return
+
+        rows, lo, hi = rows[covered], lo[covered], hi[covered]
+        ids = np.empty(len(rows), dtype="int64")
+        for e, (host, cont) in enumerate(zip(rows["hostId"], rows["containerId"])):
+            pair = (self._host_key(host), cont)
+            if pair not in self._pairs:
+                self._pairs[pair] = len(self._pairs)
+                self._pair_hosts.append(pair[0])
+            ids[e] = self._pairs[pair]
+
+        spans = hi - lo
+        points = np.repeat(lo - np.cumsum(spans) + spans, spans) + np.arange(spans.sum())
+        for k, pair in set(zip(points.tolist(), np.repeat(ids, spans).tolist())):
+            self._live[k].add(pair)
+
+    def get_latency_data(self, colname):
+        if colname not in self.df.columns:
+            raise KeyError(colname)
+        acc = self._latency[colname]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._series(np.where(acc["count"] == 0, 0, acc["sum"] / np.maximum(acc["count"], 1)))
+
+    def get_latency_sketch(self, colname):
+        if colname not in self.df.columns:
+            raise KeyError(colname)
+        return self._latency[colname]["sketch"]
+
+    def get_status_data(self, colname):
+        return self._series(self._ok), self._series(self._counts - self._ok)
+
+    def get_requests_data(self):
+        return self._series(self._counts)
+
+    def get_repliacs_data(self, name):
+        s, n = self._replicas
+        with np.errstate(invalid="ignore"):
+            y = np.where(n == 0, 0, np.floor_divide(s, np.maximum(n, 1)))
+        if not np.isnan(y).any():
+            y = y.astype("int64")
+        return self._series(y)
+
+    def _mean_series(self, acc):
+        s, n = acc
+        return self._series(np.where(n == 0, 0, s / np.maximum(n, 1)))
+
+    def get_fn_invocation_rate(self, name):
+        return self._mean_series(self._rate)
+
+    def get_memory_usage(self, name):
+        if name not in self._nodes:
+            return {}
+        return self._mean_series(self._nodes[name])
+
+    def get_cpu_usage(self, name):
+        if name not in self._nodes:
+            return {}
+        return self._mean_series(self._nodes[name])
+
+    def get_container_index(self):
+        if self._containers is None:
+            # executions still held back are folded into a copy, so more chunks can follow
+            self._containers = self._fold.snapshot()
+        return self._containers
+
+    def get_replica_timeline(self):
+        timeline = [t for t in self._timeline if len(t[0])]
+        if not timeline:
+            return np.zeros(0), np.zeros(0)
+        times = np.concatenate([t for t, _ in timeline])
+        order = np.argsort(times, kind="mergesort")
+        return times[order], np.concatenate([v for _, v in timeline])[order]
+
+    def get_heat_data(self):
+        hosts = sorted(self._hosts)
+        row = {h: e for e, h in enumerate(hosts)}
+        host_of = np.array([row[h] for h in self._pair_hosts], dtype="int64")
+
+        live = np.zeros((len(hosts), len(self.edges)), dtype="int64")
+        for k, pairs in enumerate(self._live):
+            if pairs:
+                live[:, k] = np.bincount(host_of[list(pairs)], minlength=len(hosts))
+
+        keys = [float(h) if self._float_hosts else h for h in hosts]
+        # sampled at the bucket midpoints, the exact sweep needs every execution
+        self.peak_containers = {key: int(live[e].max()) for e, key in enumerate(keys)}
+        return {key: self._series(live[e]) for e, key in enumerate(keys)}
+
+
+def stream_file(aggregator_class, file, interval=10, chunksize=CHUNKSIZE, prepare=None):
+    """Aggregate a result CSV chunk by chunk into an instance of ``aggregator_class``.
+
+    ``prepare``, if given, rewrites every chunk before it is aggregated.
+    """
+    columns = list(pd.read_csv(file, nrows=0).columns)
+    first, last = time_range(file, chunksize)
+
+    agg = aggregator_class(0, int(elapsed_seconds([last], first)[0]) + 1, interval)
+    agg.begin(columns, first)
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        agg.add_chunk(prepare(chunk) if prepare else chunk)
+    return agg